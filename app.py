@@ -1,26 +1,45 @@
 from __future__ import annotations
 
+from datetime import date
 from pathlib import Path
+from typing import Any
 
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
 from muthu_performance_lab.config import (
+    BEST_EFFORT_DISTANCES,
     DB_PATH,
     DEFAULT_GARMIN_CANDIDATES,
     ERROR_LOG_PATH,
 )
-from muthu_performance_lab.database import get_connection, upsert_workouts
-from muthu_performance_lab.fit_ingest import ingest_activity_folder
-from muthu_performance_lab.metrics import (
-    filter_runs,
-    kpi_lifetime_distance_km,
-    kpi_total_runs,
-    load_workouts_df,
-    monthly_mileage,
-    training_load_ratio,
-    weekly_mileage_km,
+from muthu_performance_lab.database import (
+    connection,
+    get_data_version,
+    list_ingest_runs,
+    slowest_run_files,
+)
+from muthu_performance_lab.downsample import (
+    date_positions,
+    density_bins,
+    lttb_union,
+    needs_binning,
+)
+from muthu_performance_lab.fit_ingest import default_worker_count
+from muthu_performance_lab.metrics import training_load_series
+from muthu_performance_lab.payload import DEFAULT_POINT_BUDGETS, RUN_TABLE_COLUMNS
+from muthu_performance_lab.profiling import RunProfile
+from muthu_performance_lab.pwa_export import refresh_database_from_garmin
+from muthu_performance_lab.queries import (
+    query_daily_run_distance,
+    query_lifetime_distance_km,
+    query_monthly_mileage,
+    query_personal_records,
+    query_runs,
+    query_total_runs,
+    query_training_load_ratio,
+    query_weekly_mileage_km,
 )
 
 
@@ -47,17 +66,28 @@ def pace_label(min_per_km: float) -> str:
     return f"{minutes}:{seconds:02d} /km"
 
 
-def run_ingestion(garmin_root: Path):
-    activity_dir = garmin_root / "Activity"
-    rows = ingest_activity_folder(activity_dir=activity_dir, error_log_path=ERROR_LOG_PATH)
+def duration_label(seconds: float) -> str:
+    total = int(round(seconds))
+    hours, rest = divmod(total, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def run_ingestion(
+    garmin_root: Path, incremental: bool = True, workers: int | None = None
+) -> dict[str, int]:
+    progress_bar = st.progress(0.0, text="Looking for new FIT files...")
+
+    def show_progress(done: int, total: int) -> None:
+        fraction = done / total if total else 1.0
+        progress_bar.progress(fraction, text=f"Ingested {done:,} of {total:,} changed files")
 
-    conn = get_connection(DB_PATH)
     try:
-        count = upsert_workouts(conn, rows)
+        return refresh_database_from_garmin(
+            garmin_root, incremental=incremental, workers=workers, progress=show_progress
+        )
     finally:
-        conn.close()
-
-    return count, len(rows)
+        progress_bar.empty()
 
 
 with st.sidebar:
@@ -68,14 +98,37 @@ with st.sidebar:
     garmin_path_input = st.text_input(
         "GARMIN folder path",
         value=default_path,
-        help="This folder should contain Activity/, Monitor/, Sleep/, and HRVStatus/.",
+        help="This folder should contain Activity/, Monitor/, Sleep/, and HRVStatus/. "
+        "A .zip export of it works too; it is read without extracting it.",
     )
 
     st.write("Use this button whenever you add new FIT files.")
+    full_refresh = st.checkbox(
+        "Re-parse all files",
+        value=False,
+        help="By default only new or changed FIT files are parsed, and files that "
+        "failed before are skipped until they change.",
+    )
+    parse_workers = st.number_input(
+        "Parser processes",
+        min_value=1,
+        max_value=64,
+        value=default_worker_count(),
+        step=1,
+        help="How many CPU cores to use when parsing FIT files.",
+    )
     refresh_clicked = st.button("Refresh from FIT files", type="primary")
 
+    st.header("Charts")
+    downsample_charts = st.checkbox(
+        "Downsample long histories",
+        value=True,
+        help="Charts with more points than their budget show a shape-preserving subset "
+        "(pace vs HR is binned). Untick to draw every run; the run table always has all of them.",
+    )
+
 if not garmin_path_input.strip():
-    st.warning("Please enter your GARMIN folder path in the sidebar.")
+    st.warning("Please enter your GARMIN folder (or .zip) path in the sidebar.")
     st.stop()
 
 try:
@@ -86,8 +139,15 @@ except Exception:  # noqa: BLE001
 
 if refresh_clicked:
     try:
-        upserted, parsed = run_ingestion(garmin_root)
-        st.success(f"Refresh complete. Parsed {parsed} files and updated {upserted} rows.")
+        stats = run_ingestion(
+            garmin_root, incremental=not full_refresh, workers=int(parse_workers)
+        )
+        st.success(
+            f"Refresh complete. Parsed {stats['parsed']} files, skipped {stats['skipped']} "
+            f"unchanged, removed {stats['deleted']} missing, {stats['failed']} failed, "
+            f"{stats['quarantined']} quarantined (\"Re-parse all files\" retries them), "
+            f"{stats['duplicates']} duplicates skipped."
+        )
     except Exception as exc:  # noqa: BLE001
         st.error(f"Could not refresh data: {exc}")
 
@@ -98,25 +158,213 @@ if DB_PATH.exists() is False:
     except Exception:
         pass
 
-conn = get_connection(DB_PATH)
-try:
-    all_df = load_workouts_df(conn)
-finally:
-    conn.close()
 
-runs_df = filter_runs(all_df)
+def read_data_version() -> int:
+    with connection(DB_PATH) as conn:
+        return get_data_version(conn)
+
+
+# Streamlit reruns this whole script on every widget change. The loaders below
+# are cached per (database file, data version, date): reruns with unchanged data
+# reuse the same DataFrames and figures, and a refresh that writes to the
+# database bumps the version, so they are rebuilt exactly once. The date is
+# part of the key because "this week" and "this year" move on with it.
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_dashboard_data(db_path: str, data_version: int, today: date) -> dict[str, Any]:
+    # Aggregates are computed in SQLite; only the run columns the charts use are loaded.
+    with connection(Path(db_path)) as conn:
+        return {
+            "runs": query_runs(conn, RUN_TABLE_COLUMNS),
+            "total_runs": query_total_runs(conn),
+            "lifetime_km": query_lifetime_distance_km(conn),
+            "weekly_km": query_weekly_mileage_km(conn, today),
+            "load_ratio": query_training_load_ratio(conn),
+            "monthly": query_monthly_mileage(conn),
+            "load": training_load_series(query_daily_run_distance(conn)),
+        }
+
+
+def downsample_rows(df: pd.DataFrame, x_col: str, y_cols: list[str], budget: int) -> pd.DataFrame:
+    """Rows LTTB keeps so the y columns still look the same against x."""
+    x = date_positions(df[x_col])
+    picked = lttb_union(x, [df[col].to_numpy(dtype="float64") for col in y_cols], budget)
+    return df.iloc[picked]
+
+
+# max_entries covers two data versions, each with downsampling on and off.
+@st.cache_resource(show_spinner=False, max_entries=4)
+def build_figures(
+    db_path: str, data_version: int, today: date, downsample: bool
+) -> dict[str, Any]:
+    # cache_resource hands back the same figure objects instead of copies;
+    # nothing below mutates them after they are built.
+    data = load_dashboard_data(db_path, data_version, today)
+    runs_df = data["runs"]
+    budgets = DEFAULT_POINT_BUDGETS if downsample else {name: 0 for name in DEFAULT_POINT_BUDGETS}
+    sampled: dict[str, tuple[int, int]] = {}
+
+    fig_monthly = px.line(data["monthly"], x="month", y="distance_km", markers=True)
+    fig_monthly.update_layout(xaxis_title="Month", yaxis_title="Distance (km)")
+
+    scatter_df = runs_df.dropna(subset=["avg_pace_min_per_km", "avg_hr"])
+    if needs_binning(len(scatter_df), budgets["pace_vs_hr"]):
+        # Each dot is the average of the runs in one grid cell, sized by their number.
+        bins_df = density_bins(
+            scatter_df["avg_hr"].to_numpy(),
+            scatter_df["avg_pace_min_per_km"].to_numpy(),
+            budgets["pace_vs_hr"],
+        ).rename(columns={"x": "avg_hr", "y": "avg_pace_min_per_km", "count": "runs"})
+        sampled["Pace vs Heart Rate"] = (len(bins_df), len(scatter_df))
+        fig_scatter = px.scatter(
+            bins_df,
+            x="avg_hr",
+            y="avg_pace_min_per_km",
+            size="runs",
+            hover_data=["runs"],
+            labels={"avg_hr": "Average HR", "avg_pace_min_per_km": "Pace (min/km)"},
+        )
+    else:
+        fig_scatter = px.scatter(
+            scatter_df,
+            x="avg_hr",
+            y="avg_pace_min_per_km",
+            hover_data=["workout_date", "distance_km", "duration_min"],
+            labels={"avg_hr": "Average HR", "avg_pace_min_per_km": "Pace (min/km)"},
+        )
+    fig_scatter.update_yaxes(autorange="reversed")
+
+    cadence_df = runs_df.dropna(subset=["avg_cadence"])
+    cadence_plot_df = downsample_rows(
+        cadence_df, "workout_date", ["avg_cadence"], budgets["cadence_trend"]
+    )
+    if len(cadence_plot_df) < len(cadence_df):
+        sampled["Cadence Trend"] = (len(cadence_plot_df), len(cadence_df))
+    fig_cadence = px.line(
+        cadence_plot_df,
+        x="workout_date",
+        y="avg_cadence",
+        markers=True,
+        labels={"workout_date": "Date", "avg_cadence": "Average Cadence"},
+    )
+
+    distance_plot_df = downsample_rows(
+        runs_df, "workout_date", ["distance_km"], budgets["distance_trend"]
+    )
+    if len(distance_plot_df) < len(runs_df):
+        sampled["Distance Per Run"] = (len(distance_plot_df), len(runs_df))
+    fig_distance = px.bar(
+        distance_plot_df,
+        x="workout_date",
+        y="distance_km",
+        labels={"workout_date": "Date", "distance_km": "Distance (km)"},
+    )
+
+    load_plot_df = downsample_rows(
+        data["load"], "date", ["load_ratio", "ewma_load_ratio"], budgets["training_load"]
+    )
+    if len(load_plot_df) < len(data["load"]):
+        sampled["Load Ratio"] = (len(load_plot_df), len(data["load"]))
+    fig_load = px.line(
+        load_plot_df,
+        x="date",
+        y=["load_ratio", "ewma_load_ratio"],
+        labels={"date": "Date", "value": "Acute:Chronic Ratio", "variable": "Method"},
+    )
+    fig_load.for_each_trace(
+        lambda trace: trace.update(
+            name={"load_ratio": "Rolling 7d / 28d", "ewma_load_ratio": "EWMA 7d / 28d"}[trace.name]
+        )
+    )
+
+    return {
+        "monthly": fig_monthly,
+        "scatter": fig_scatter,
+        "cadence": fig_cadence,
+        "distance": fig_distance,
+        "load": fig_load,
+        "sampled": sampled,
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def build_run_table(db_path: str, data_version: int, today: date) -> pd.DataFrame:
+    runs_df = load_dashboard_data(db_path, data_version, today)["runs"]
+    display_df = runs_df[RUN_TABLE_COLUMNS].copy()
+
+    display_df["workout_date"] = display_df["workout_date"].dt.date
+
+    display_df["avg_pace_min_per_km"] = display_df["avg_pace_min_per_km"].apply(pace_label)
+
+    display_df.rename(
+        columns={
+            "workout_date": "Date",
+            "distance_km": "Distance (km)",
+            "duration_min": "Duration (min)",
+            "avg_hr": "Avg HR",
+            "max_hr": "Max HR",
+            "avg_cadence": "Avg Cadence",
+            "avg_pace_min_per_km": "Avg Pace",
+            "hr_efficiency": "HR Efficiency (pace/HR)",
+            "calories": "Calories",
+            "avg_temperature": "Avg Temperature",
+        },
+        inplace=True,
+    )
+    return display_df.sort_values("Date", ascending=False)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def build_personal_records(db_path: str, data_version: int, year: int) -> pd.DataFrame:
+    this_year = date(year, 1, 1)
+    with connection(Path(db_path)) as conn:
+        all_time = query_personal_records(conn)
+        year = query_personal_records(conn, start=this_year)
+
+    def record_cells(record: tuple[Any, ...] | None) -> list[str]:
+        if record is None:
+            return ["-", "-"]
+        # (workout_id, workout_date, distance_m, elapsed_s, start_offset_s)
+        pace = record[3] / 60.0 / (record[2] / 1000.0)
+        return [f"{duration_label(record[3])} ({pace_label(pace)})", str(record[1])[:10]]
+
+    rows = [
+        [
+            name.replace("_", " ").capitalize(),
+            *record_cells(all_time[name]),
+            *record_cells(year[name]),
+        ]
+        for name in BEST_EFFORT_DISTANCES
+    ]
+    year_label = str(this_year.year)
+    return pd.DataFrame(
+        rows,
+        columns=["Distance", "All-time", "Set on", year_label, f"{year_label} set on"],
+    )
+
 
-if runs_df.empty:
+# Timings of this rerun, shown in the Performance expander. Cached steps
+# show up as near-zero stages.
+rerun_profile = RunProfile("streamlit")
+with rerun_profile.stage("read_data_version"):
+    data_version = read_data_version()
+today = date.today()
+with rerun_profile.stage("load_dashboard_data"):
+    data = load_dashboard_data(str(DB_PATH), data_version, today)
+
+if data["runs"].empty:
     st.info(
         "No running workouts found yet. Check your GARMIN path and click 'Refresh from FIT files'."
     )
     st.stop()
 
+with rerun_profile.stage("build_figures"):
+    figures = build_figures(str(DB_PATH), data_version, today, downsample_charts)
+
 col1, col2, col3, col4 = st.columns(4)
-col1.metric("Total Runs", f"{kpi_total_runs(runs_df):,}")
-col2.metric("Lifetime Distance", f"{kpi_lifetime_distance_km(runs_df):,.1f} km")
-col3.metric("Weekly Mileage", f"{weekly_mileage_km(runs_df):,.1f} km")
-col4.metric("7d vs 28d Load Ratio", f"{training_load_ratio(runs_df):.2f}")
+col1.metric("Total Runs", f"{data['total_runs']:,}")
+col2.metric("Lifetime Distance", f"{data['lifetime_km']:,.1f} km")
+col3.metric("Weekly Mileage", f"{data['weekly_km']:,.1f} km")
+col4.metric("7d vs 28d Load Ratio", f"{data['load_ratio']:.2f}")
 
 st.divider()
 
@@ -124,86 +372,89 @@ left, right = st.columns(2)
 
 with left:
     st.subheader("Monthly Mileage Trend")
-    monthly_df = monthly_mileage(runs_df)
-    fig_monthly = px.line(monthly_df, x="month", y="distance_km", markers=True)
-    fig_monthly.update_layout(xaxis_title="Month", yaxis_title="Distance (km)")
-    st.plotly_chart(fig_monthly, use_container_width=True)
+    st.plotly_chart(figures["monthly"], use_container_width=True)
 
 with right:
     st.subheader("Pace vs Heart Rate")
-    scatter_df = runs_df.dropna(subset=["avg_pace_min_per_km", "avg_hr"])
-    fig_scatter = px.scatter(
-        scatter_df,
-        x="avg_hr",
-        y="avg_pace_min_per_km",
-        hover_data=["workout_date", "distance_km", "duration_min"],
-        labels={"avg_hr": "Average HR", "avg_pace_min_per_km": "Pace (min/km)"},
-    )
-    fig_scatter.update_yaxes(autorange="reversed")
-    st.plotly_chart(fig_scatter, use_container_width=True)
+    st.plotly_chart(figures["scatter"], use_container_width=True)
 
 left2, right2 = st.columns(2)
 
 with left2:
     st.subheader("Cadence Trend Over Time")
-    cadence_df = runs_df.dropna(subset=["avg_cadence"])
-    fig_cadence = px.line(
-        cadence_df,
-        x="workout_date",
-        y="avg_cadence",
-        markers=True,
-        labels={"workout_date": "Date", "avg_cadence": "Average Cadence"},
-    )
-    st.plotly_chart(fig_cadence, use_container_width=True)
+    st.plotly_chart(figures["cadence"], use_container_width=True)
 
 with right2:
     st.subheader("Distance Per Run Over Time")
-    fig_distance = px.bar(
-        runs_df,
-        x="workout_date",
-        y="distance_km",
-        labels={"workout_date": "Date", "distance_km": "Distance (km)"},
+    st.plotly_chart(figures["distance"], use_container_width=True)
+
+st.subheader("Acute:Chronic Load Ratio Over Time")
+st.plotly_chart(figures["load"], use_container_width=True)
+
+if figures["sampled"]:
+    shown_of_total = ", ".join(
+        f"{name} {shown:,} of {total:,} points"
+        for name, (shown, total) in figures["sampled"].items()
+    )
+    st.caption(
+        f"Downsampled for speed: {shown_of_total}. "
+        "Untick 'Downsample long histories' in the sidebar to draw every run."
     )
-    st.plotly_chart(fig_distance, use_container_width=True)
 
 st.divider()
-st.subheader("Run Table")
-display_df = runs_df[
-    [
-        "workout_date",
-        "distance_km",
-        "duration_min",
-        "avg_hr",
-        "max_hr",
-        "avg_cadence",
-        "avg_pace_min_per_km",
-        "hr_efficiency",
-        "calories",
-        "avg_temperature",
-    ]
-].copy()
-
-display_df["workout_date"] = display_df["workout_date"].dt.date
-
-display_df["avg_pace_min_per_km"] = display_df["avg_pace_min_per_km"].apply(pace_label)
-
-display_df.rename(
-    columns={
-        "workout_date": "Date",
-        "distance_km": "Distance (km)",
-        "duration_min": "Duration (min)",
-        "avg_hr": "Avg HR",
-        "max_hr": "Max HR",
-        "avg_cadence": "Avg Cadence",
-        "avg_pace_min_per_km": "Avg Pace",
-        "hr_efficiency": "HR Efficiency (pace/HR)",
-        "calories": "Calories",
-        "avg_temperature": "Avg Temperature",
-    },
-    inplace=True,
-)
+st.subheader("Personal Records")
+with rerun_profile.stage("build_personal_records"):
+    personal_records = build_personal_records(str(DB_PATH), data_version, today.year)
+st.dataframe(personal_records, use_container_width=True, hide_index=True)
+st.caption("Fastest stretch of each distance inside any run, from the recorded GPS/pod distance.")
 
-st.dataframe(display_df.sort_values("Date", ascending=False), use_container_width=True)
+st.divider()
+st.subheader("Run Table")
+with rerun_profile.stage("build_run_table"):
+    run_table = build_run_table(str(DB_PATH), data_version, today)
+st.dataframe(run_table, use_container_width=True)
+
+with st.expander("Performance"):
+    rerun_profile.finish()
+    st.markdown("**This page load**")
+    st.dataframe(
+        pd.DataFrame(
+            {"stage": list(rerun_profile.stages), "seconds": list(rerun_profile.stages.values())}
+        ),
+        hide_index=True,
+    )
+    st.caption(f"{rerun_profile.total_seconds:.3f} s in total, including drawing the charts.")
+
+    with connection(DB_PATH) as conn:
+        ingest_runs = list_ingest_runs(conn)
+        # The latest run that parsed anything; --skip-refresh exports parse nothing.
+        parsing_runs = [run for run in ingest_runs if run["files_parsed"] + run["files_failed"]]
+        slowest = slowest_run_files(conn, parsing_runs[0]["id"]) if parsing_runs else []
+    if ingest_runs:
+        st.markdown("**Recent refreshes and exports**")
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "started_at": run["started_at"],
+                        "kind": run["kind"],
+                        "seconds": run["total_seconds"],
+                        "files": run["files_parsed"],
+                        "failed": run["files_failed"],
+                        "MB": run["bytes_parsed"] / 1e6,
+                        "parse_seconds": run["parse_seconds"],
+                        "slowest_stage": max(run["stages"], key=run["stages"].get, default=""),
+                    }
+                    for run in ingest_runs
+                ]
+            ),
+            hide_index=True,
+        )
+        st.markdown("**Stages of the latest run (seconds)**")
+        st.json(ingest_runs[0]["stages"])
+    if slowest:
+        st.markdown(f"**Slowest FIT files of the run started {parsing_runs[0]['started_at']}**")
+        st.dataframe(pd.DataFrame(slowest), hide_index=True)
 
 with st.expander("Future Upgrade Ideas"):
     st.markdown(
@@ -0,0 +1,439 @@
+"""
+Time ingestion, metrics and the PWA export on synthetic Garmin histories.
+
+For each scale (number of activities) a deterministic GARMIN/Activity tree
+is generated once under the work folder (see synthetic_fit.py) and reused
+by later runs. Each stage runs `--repeat` times on fresh state and its
+median is kept:
+
+    ingest_activity_folder  parse every FIT file in the tree
+    ingest_archive          the same, read in place from a ZIP of the tree
+    upsert_workouts         write the parsed rows into an empty database
+    rederive_workouts       recompute every workout's columns from its stored fields
+    load_workouts_df        read the workouts table into pandas
+    <metric>                each function in metrics.py, on that DataFrame
+    build_dashboard_payload the pandas export engine, and the lite engine
+    export_pwa_json / export_pwa_chunks (fresh folder, then a no-op re-export)
+
+    python benchmark.py --output before.json
+    python benchmark.py --baseline before.json   # exits 1 on a regression
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from muthu_performance_lab import lite_export, metrics, pwa_export
+from muthu_performance_lab.config import DATA_DIR
+from muthu_performance_lab.database import (
+    close_pooled_connections,
+    get_connection,
+    rederive_workouts,
+    upsert_workouts,
+)
+from muthu_performance_lab.fit_ingest import ingest_activity_folder
+from muthu_performance_lab.synthetic_fit import (
+    DEFAULT_CORRUPT_FRACTION,
+    DEFAULT_DURATION_MIN,
+    DEFAULT_RECORD_INTERVAL,
+    DEFAULT_SPORT_MIX,
+    SPEC_NAME,
+    SPORT_PROFILES,
+    ensure_garmin_tree,
+)
+
+RESULTS_FORMAT = 1
+DEFAULT_SCALES = [100, 1000, 5000]
+DEFAULT_REPEAT = 3
+DEFAULT_WORK_DIR = DATA_DIR / "benchmark"
+# A stage regresses when its median is this much slower than the baseline's...
+DEFAULT_THRESHOLD = 0.25
+# ...and by at least this many seconds, so millisecond stages do not flap.
+DEFAULT_MIN_DELTA_S = 0.005
+
+# Metrics timed one by one on the output of filter_runs.
+METRIC_STAGES: Dict[str, Callable[[Any], Any]] = {
+    "kpi_total_runs": metrics.kpi_total_runs,
+    "kpi_lifetime_distance_km": metrics.kpi_lifetime_distance_km,
+    "monthly_mileage": metrics.monthly_mileage,
+    "weekly_mileage_km": metrics.weekly_mileage_km,
+    "training_load_ratio": metrics.training_load_ratio,
+    "daily_distance": metrics.daily_distance,
+}
+
+Timing = Dict[str, Any]
+
+
+def time_stage(
+    run: Callable[..., Any], repeat: int, setup: Optional[Callable[[], tuple]] = None
+) -> Tuple[Timing, Any]:
+    """
+    Call `run(*setup())` `repeat` times and return (timing, last result).
+
+    Only `run` is timed; `setup` resets whatever state the stage needs.
+    """
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = run(*args)
+        seconds.append(time.perf_counter() - start)
+    return {
+        "median_s": statistics.median(seconds),
+        "min_s": min(seconds),
+        "runs_s": [round(value, 6) for value in seconds],
+    }, result
+
+
+def _remove_db(db_path: Path) -> None:
+    close_pooled_connections()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+
+def _fresh_dir(path: Path) -> Path:
+    shutil.rmtree(path, ignore_errors=True)
+    return path
+
+
+def _ensure_archive(garmin_root: Path, archive: Path) -> None:
+    """ZIP `garmin_root` the way a GARMIN export arrives, unless it is already zipped."""
+    spec = garmin_root / SPEC_NAME
+    if archive.exists() and archive.stat().st_mtime >= spec.stat().st_mtime:
+        return
+    partial = archive.with_suffix(".zip.partial")
+    with zipfile.ZipFile(partial, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for fit_path in sorted((garmin_root / "Activity").iterdir()):
+            zip_file.write(fit_path, f"GARMIN/Activity/{fit_path.name}")
+    partial.replace(archive)
+
+
+def bench_scale(
+    activities: int, work_dir: Path, repeat: int, workers: int, tree_options: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Generate (or reuse) one synthetic tree and time every stage on it."""
+    garmin_root = work_dir / f"garmin-{activities}"
+    started = time.perf_counter()
+    tree = ensure_garmin_tree(garmin_root, activities, **tree_options)
+    archive = work_dir / f"garmin-{activities}.zip"
+    _ensure_archive(garmin_root, archive)
+    setup_s = time.perf_counter() - started
+
+    scale_dir = work_dir / f"run-{activities}"
+    scale_dir.mkdir(parents=True, exist_ok=True)
+    db_path = scale_dir / "performance_lab.db"
+    error_log = scale_dir / "ingestion_errors.log"
+    stages: Dict[str, Timing] = {}
+
+    def parse() -> List[Dict[str, Any]]:
+        error_log.unlink(missing_ok=True)
+        return ingest_activity_folder(garmin_root / "Activity", error_log, workers=workers)
+
+    stages["ingest_activity_folder"], rows = time_stage(parse, repeat)
+
+    def parse_archive() -> List[Dict[str, Any]]:
+        error_log.unlink(missing_ok=True)
+        return ingest_activity_folder(archive, error_log, workers=workers)
+
+    stages["ingest_archive"], _ = time_stage(parse_archive, repeat)
+
+    def empty_db() -> tuple:
+        _remove_db(db_path)
+        # Schema creation happens here, outside the timed upsert.
+        return get_connection(db_path), [dict(row) for row in rows]
+
+    def upsert(conn, batch) -> int:
+        try:
+            return upsert_workouts(conn, batch)
+        finally:
+            conn.close()
+
+    stages["upsert_workouts"], _ = time_stage(upsert, repeat, empty_db)
+
+    conn = get_connection(db_path)
+    try:
+        stages["rederive_workouts"], _ = time_stage(
+            lambda: rederive_workouts(conn, everything=True), repeat
+        )
+        stages["load_workouts_df"], workouts_df = time_stage(
+            lambda: metrics.load_workouts_df(conn), repeat
+        )
+    finally:
+        conn.close()
+    stages["filter_runs"], runs_df = time_stage(lambda: metrics.filter_runs(workouts_df), repeat)
+    for name, metric in METRIC_STAGES.items():
+        stages[name], _ = time_stage(lambda: metric(runs_df), repeat)
+    stages["training_load_series"], _ = time_stage(
+        lambda: metrics.training_load_series(metrics.daily_distance(runs_df)), repeat
+    )
+
+    stages["build_dashboard_payload"], payload = time_stage(
+        lambda: pwa_export.build_dashboard_payload(db_path=db_path), repeat
+    )
+    stages["build_dashboard_payload_lite"], _ = time_stage(
+        lambda: lite_export.build_dashboard_payload(db_path=db_path), repeat
+    )
+    json_path = scale_dir / "pwa" / "dashboard_data.json"
+    stages["export_pwa_json"], _ = time_stage(
+        lambda: pwa_export.export_pwa_json(json_path, db_path=db_path), repeat
+    )
+    chunks_dir = scale_dir / "pwa" / "data"
+    stages["export_pwa_chunks"], _ = time_stage(
+        lambda out: pwa_export.export_pwa_chunks(out, db_path=db_path),
+        repeat,
+        lambda: (_fresh_dir(chunks_dir),),
+    )
+    stages["export_pwa_chunks_noop"], _ = time_stage(
+        lambda: pwa_export.export_pwa_chunks(chunks_dir, db_path=db_path), repeat
+    )
+    close_pooled_connections()
+
+    return {
+        "activities": activities,
+        "files": tree["files"],
+        "corrupt_files": tree["corrupt"],
+        "fit_bytes": tree["bytes"],
+        "rows": len(rows),
+        "runs": payload["kpis"]["total_runs"] if payload["has_data"] else 0,
+        "setup_s": round(setup_s, 3),
+        "stages": stages,
+    }
+
+
+def run_benchmarks(
+    scales: List[int], work_dir: Path, repeat: int, workers: int, tree_options: Dict[str, Any]
+) -> Dict[str, Any]:
+    results = {
+        "format": RESULTS_FORMAT,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "repeat": repeat,
+        "workers": workers,
+        "synthetic": {key: _jsonable(value) for key, value in tree_options.items()},
+        "scales": {},
+    }
+    for activities in scales:
+        print(f"Scale {activities}: generating/reusing tree and timing stages...", flush=True)
+        scale = bench_scale(activities, work_dir, repeat, workers, tree_options)
+        results["scales"][str(activities)] = scale
+        for name, timing in scale["stages"].items():
+            print(f"  {name:<30} {timing['median_s'] * 1000:10.1f} ms")
+    return results
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+    stage_thresholds: Optional[Dict[str, float]] = None,
+    min_delta_s: float = DEFAULT_MIN_DELTA_S,
+) -> List[str]:
+    """
+    Print every stage's median next to the baseline's; return the regressions.
+
+    Only scales and stages present in both results are compared. A stage
+    regresses when it is slower than baseline * (1 + threshold) and by more
+    than `min_delta_s`; `stage_thresholds` overrides the threshold per stage.
+    """
+    stage_thresholds = stage_thresholds or {}
+    regressions = []
+    for scale, current_scale in current["scales"].items():
+        baseline_scale = baseline.get("scales", {}).get(scale)
+        if baseline_scale is None:
+            continue
+        print(f"Scale {scale}: baseline -> current (median)")
+        for name, timing in current_scale["stages"].items():
+            before = baseline_scale["stages"].get(name)
+            if before is None:
+                continue
+            old, new = before["median_s"], timing["median_s"]
+            change = (new - old) / old if old > 0 else 0.0
+            limit = stage_thresholds.get(name, threshold)
+            slower = change > limit and new - old > min_delta_s
+            print(
+                f"  {name:<30} {old * 1000:10.1f} ms -> {new * 1000:10.1f} ms "
+                f"{change:+8.1%}{'  REGRESSION' if slower else ''}"
+            )
+            if slower:
+                regressions.append(f"{scale}/{name}: {change:+.1%} (limit {limit:+.0%})")
+    return regressions
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def parse_pairs(values: List[str], option: str) -> Dict[str, float]:
+    """Turn repeated NAME=VALUE options into a dict of floats."""
+    pairs = {}
+    for value in values:
+        name, _, number = value.partition("=")
+        try:
+            pairs[name.strip()] = float(number)
+        except ValueError:
+            raise ValueError(f"{option} expects NAME=NUMBER, got {value!r}") from None
+        if not name.strip():
+            raise ValueError(f"{option} expects NAME=NUMBER, got {value!r}")
+    return pairs
+
+
+def parse_duration(value: str) -> Tuple[int, int]:
+    low, sep, high = value.partition("-")
+    if not sep or not low.isdigit() or not high.isdigit() or int(low) > int(high) or int(low) < 1:
+        raise ValueError(f"--duration expects MIN-MAX minutes, got {value!r}")
+    return int(low), int(high)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingestion, metrics and export on synthetic Garmin histories."
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SCALES,
+        help="Numbers of activities to benchmark.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per stage; the median is kept."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parser processes for ingest_activity_folder (1 gives the steadiest numbers).",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=str(DEFAULT_WORK_DIR),
+        help="Folder for the generated GARMIN trees and scratch databases.",
+    )
+    parser.add_argument("--output", type=str, default=None, help="Write the results JSON here.")
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="Results JSON of an earlier run to compare against; exits 1 on a regression.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed slowdown before a stage counts as a regression (0.25 = 25%%).",
+    )
+    parser.add_argument(
+        "--stage-threshold",
+        action="append",
+        default=[],
+        metavar="STAGE=FRACTION",
+        help="Per-stage override of --threshold. Repeatable.",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=DEFAULT_MIN_DELTA_S,
+        help="Slowdowns smaller than this many seconds never count as regressions.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic activities.")
+    parser.add_argument(
+        "--sport",
+        action="append",
+        default=[],
+        metavar="SPORT=SHARE",
+        help="Sport mix of the synthetic history. Repeatable. Default: "
+        f"{', '.join(f'{k}={v}' for k, v in DEFAULT_SPORT_MIX.items())}.",
+    )
+    parser.add_argument(
+        "--duration",
+        type=str,
+        default="{}-{}".format(*DEFAULT_DURATION_MIN),
+        help="Activity length range in minutes, as MIN-MAX.",
+    )
+    parser.add_argument(
+        "--record-interval",
+        type=int,
+        default=DEFAULT_RECORD_INTERVAL,
+        help="Seconds between record messages in the synthetic files.",
+    )
+    parser.add_argument(
+        "--corrupt-fraction",
+        type=float,
+        default=DEFAULT_CORRUPT_FRACTION,
+        help="Share of synthetic files written broken on purpose.",
+    )
+    args = parser.parse_args()
+
+    try:
+        stage_thresholds = parse_pairs(args.stage_threshold, "--stage-threshold")
+        sport_mix = parse_pairs(args.sport, "--sport") or DEFAULT_SPORT_MIX
+        duration_min = parse_duration(args.duration)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.repeat < 1 or args.record_interval < 1:
+        parser.error("--repeat and --record-interval must be at least 1.")
+    unknown = sorted(set(sport_mix) - set(SPORT_PROFILES))
+    if unknown or any(share <= 0 for share in sport_mix.values()):
+        parser.error(
+            f"--sport takes positive shares of: {', '.join(SPORT_PROFILES)} (got {args.sport})."
+        )
+    if not 0 <= args.corrupt_fraction <= 1:
+        parser.error("--corrupt-fraction must be between 0 and 1.")
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+
+    tree_options = {
+        "seed": args.seed,
+        "sport_mix": sport_mix,
+        "duration_min": duration_min,
+        "record_interval": args.record_interval,
+        "corrupt_fraction": args.corrupt_fraction,
+    }
+    results = run_benchmarks(
+        args.scales, Path(args.work_dir), args.repeat, args.workers, tree_options
+    )
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+        print(f"Results written to {args.output}")
+
+    if baseline is None:
+        return 0
+    if baseline.get("synthetic") != results["synthetic"]:
+        print("Warning: the baseline used different synthetic data settings.", file=sys.stderr)
+    regressions = compare_results(
+        baseline, results, args.threshold, stage_thresholds, args.min_delta
+    )
+    if regressions:
+        print(f"{len(regressions)} stages regressed:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,11 +3,204 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
-from muthu_performance_lab.pwa_export import (
-    detect_default_garmin_path,
-    export_pwa_json,
-    refresh_database_from_garmin,
+from muthu_performance_lab.compression import precompress_tree
+from muthu_performance_lab.config import DB_PATH, PWA_DIR
+from muthu_performance_lab.database import (
+    DEFAULT_BATCH_SIZE,
+    check_daily_totals,
+    connection,
+    fetch_files_to_reparse,
+    rebuild_daily_totals,
+    record_ingest_run,
+    rederive_workouts,
 )
+from muthu_performance_lab.fit_archive import is_archive
+from muthu_performance_lab.payload import DEFAULT_POINT_BUDGETS, point_budgets
+from muthu_performance_lab.profiling import DEFAULT_TOP_FILES, RunProfile, stage
+from muthu_performance_lab.watcher import (
+    DEFAULT_DEBOUNCE,
+    DEFAULT_POLL_INTERVAL,
+    watch_file,
+    watch_folder,
+)
+
+# pwa_export (pandas, FIT parsing) is imported only by the commands that use
+# it: `--skip-refresh` exports with lite_export and never loads pandas.
+
+
+def check_rollup() -> int:
+    with connection(DB_PATH) as conn:
+        problems = check_daily_totals(conn)
+        if problems:
+            for line in problems:
+                print(line)
+            rebuild_daily_totals(conn)
+            conn.commit()
+            print(f"daily_totals had {len(problems)} mismatching rows; rebuilt from workouts.")
+            return 1
+
+    print("daily_totals is consistent with workouts.")
+    return 0
+
+
+def parse_chart_points(values: list[str]) -> dict[str, int]:
+    """Turn repeated --chart-points NAME=N options into point budget overrides."""
+    overrides = {}
+    for value in values:
+        name, sep, budget = value.partition("=")
+        if not sep or not budget.strip().isdigit():
+            raise ValueError(f"--chart-points expects NAME=N, got {value!r}")
+        overrides[name.strip()] = int(budget)
+    point_budgets(overrides)  # Rejects unknown chart names early.
+    return overrides
+
+
+def export(
+    output_dir: Path,
+    output: str | None,
+    chart_points: dict[str, int],
+    lite: bool = False,
+    profile: RunProfile | None = None,
+) -> dict:
+    """Write the PWA data; `lite` uses the stdlib-only engine (same files, faster start)."""
+    with stage(profile, "import_engine"):
+        if lite:
+            from muthu_performance_lab import lite_export as engine
+        else:
+            from muthu_performance_lab import pwa_export as engine
+
+    manifest = engine.export_pwa_chunks(output_dir, chart_points, profile=profile)
+    print(
+        f"Exported PWA data: {output_dir}/manifest.json "
+        f"({manifest['chunks_written']} chunks written, {manifest['chunks_reused']} unchanged)"
+    )
+    if output:
+        engine.export_pwa_json(Path(output), chart_points, profile=profile)
+        print(f"Exported PWA JSON: {output}")
+    # Data files get their .gz/.br siblings as they are written; this covers
+    # the app shell (HTML, JS, CSS) for pwa_server.py.
+    with stage(profile, "precompress"):
+        precompress_tree(PWA_DIR)
+    return manifest
+
+
+def watch_archive(archive: Path, args: argparse.Namespace) -> None:
+    from muthu_performance_lab.pwa_export import refresh_database_from_garmin
+
+    def on_change() -> None:
+        stats = refresh_database_from_garmin(
+            archive,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            store_streams=not args.no_streams,
+        )
+        print(
+            f"Watcher: parsed {stats['parsed']} new or changed FIT files, "
+            f"removed {stats['deleted']}, {stats['failed']} failed, "
+            f"{stats['quarantined']} quarantined, {stats['duplicates']} duplicates skipped."
+        )
+        export(Path(args.output_dir), args.output, args.chart_points)
+
+    print(f"Watching {archive} for a newer export (Ctrl+C to stop).")
+    try:
+        watch_file(archive, on_change, poll_interval=args.poll_interval, debounce=args.debounce)
+    except KeyboardInterrupt:
+        pass
+
+
+def watch(garmin_root: Path, args: argparse.Namespace) -> None:
+    if is_archive(garmin_root):
+        watch_archive(garmin_root, args)
+        return
+    from muthu_performance_lab.pwa_export import refresh_fit_files
+
+    def on_changes(new_files: list[Path], removed_files: list[Path]) -> None:
+        stats = refresh_fit_files(
+            new_files,
+            removed_files,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            store_streams=not args.no_streams,
+        )
+        print(
+            f"Watcher: parsed {stats['parsed']} new FIT files, removed {stats['deleted']}, "
+            f"{stats['failed']} failed, {stats['quarantined']} quarantined, "
+            f"{stats['duplicates']} duplicates skipped."
+        )
+        export(Path(args.output_dir), args.output, args.chart_points)
+
+    print(f"Watching {garmin_root / 'Activity'} for new FIT files (Ctrl+C to stop).")
+    try:
+        watch_folder(
+            garmin_root / "Activity",
+            on_changes,
+            poll_interval=args.poll_interval,
+            debounce=args.debounce,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+def run(args: argparse.Namespace, profile: RunProfile) -> Path | None:
+    """Refresh (unless --skip-refresh) and export; returns the GARMIN root used, if any."""
+    garmin_root = None
+    if args.rederive:
+        with stage(profile, "rederive"), connection(DB_PATH) as conn:
+            rederived = rederive_workouts(conn, everything=True, batch_size=args.batch_size)
+            to_reparse = len(fetch_files_to_reparse(conn))
+        print(f"Re-derived {rederived} workouts from their stored session fields.")
+        if to_reparse:
+            print(
+                f"{to_reparse} workouts were stored by an older version; "
+                "the next refresh parses their FIT files once more."
+            )
+
+    if not args.skip_refresh:
+        with stage(profile, "import_engine"):
+            from muthu_performance_lab.pwa_export import (
+                detect_default_garmin_path,
+                refresh_database_from_garmin,
+            )
+
+        if args.garmin_path:
+            garmin_root = Path(args.garmin_path).expanduser().resolve()
+        else:
+            detected = detect_default_garmin_path()
+            if detected is None:
+                raise FileNotFoundError(
+                    "Could not find GARMIN folder automatically. Use --garmin-path."
+                )
+            garmin_root = detected
+
+        stats = refresh_database_from_garmin(
+            garmin_root,
+            incremental=not args.full_refresh,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            store_streams=not args.no_streams,
+            progress=lambda done, total: print(f"  {done}/{total} changed files ingested"),
+            profile=profile,
+        )
+        print(
+            f"Refresh complete. Parsed {stats['parsed']} FIT files, "
+            f"skipped {stats['skipped']} unchanged, removed {stats['deleted']} missing, "
+            f"{stats['failed']} failed, {stats['quarantined']} still quarantined, "
+            f"{stats['duplicates']} duplicates skipped. Updated {stats['upserted']} rows."
+        )
+        if stats["rederived"]:
+            print(f"Re-derived {stats['rederived']} workouts from their stored session fields.")
+        if stats["failed"] or stats["quarantined"]:
+            print("See failing files with: python manage_quarantine.py list")
+
+    manifest = export(
+        Path(args.output_dir),
+        args.output,
+        args.chart_points,
+        lite=args.skip_refresh,
+        profile=profile,
+    )
+    print(f"Data available: {manifest.get('has_data')}")
+    return garmin_root
 
 
 def main() -> int:
@@ -16,38 +209,138 @@ def main() -> int:
         "--garmin-path",
         type=str,
         default=None,
-        help="Path to your GARMIN folder (contains Activity/, Sleep/, etc).",
+        help="Path to your GARMIN folder (contains Activity/, Sleep/, etc), or to a .zip "
+        "export of it; the archive is read in place, without extracting it.",
     )
     parser.add_argument(
         "--skip-refresh",
         action="store_true",
         help="Skip reading FIT files and export from current SQLite database only.",
     )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Re-parse every FIT file, even ones unchanged since the last refresh.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes used to parse FIT files (default: CPU count, 1 = no pool).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Rows committed to SQLite per batch during refresh.",
+    )
+    parser.add_argument(
+        "--no-streams",
+        action="store_true",
+        help="Only store session summaries, not per-second record streams.",
+    )
+    parser.add_argument(
+        "--check-rollup",
+        action="store_true",
+        help="Diff the daily_totals rollup against a fresh rebuild (repairing it if needed) and exit.",
+    )
+    parser.add_argument(
+        "--rederive",
+        action="store_true",
+        help="Recompute every workout's columns from its stored session fields, without "
+        "parsing FIT files, before the refresh and export.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="pwa/data",
+        help="Folder for the PWA manifest.json and its per-month data chunks.",
+    )
     parser.add_argument(
         "--output",
         type=str,
-        default="pwa/data/dashboard_data.json",
-        help="Output JSON file for PWA.",
+        default=None,
+        help="Also write the whole dashboard as a single JSON file to this path.",
+    )
+    parser.add_argument(
+        "--chart-points",
+        action="append",
+        default=[],
+        metavar="CHART=N",
+        help="Most points a chart draws before it is downsampled; 0 draws every point. "
+        f"Repeatable. Defaults: {', '.join(f'{k}={v}' for k, v in DEFAULT_POINT_BUDGETS.items())}.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the export, keep running and ingest new FIT files as they appear.",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between checks of the Activity folder (or .zip) in --watch mode.",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help="Seconds without further changes before a burst of new files is ingested.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        nargs="?",
+        const=DEFAULT_TOP_FILES,
+        default=None,
+        metavar="N",
+        help="Print time per stage and the N slowest FIT files "
+        f"(default {DEFAULT_TOP_FILES}). Every run is saved to ingest_runs either way.",
+    )
+    parser.add_argument(
+        "--profile-dump",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Also run under cProfile and save the stats to PATH (main process only; "
+        "parser processes are not included). Inspect with python -m pstats PATH.",
     )
     args = parser.parse_args()
 
-    if not args.skip_refresh:
-        if args.garmin_path:
-            garmin_root = Path(args.garmin_path).expanduser().resolve()
-        else:
-            detected = detect_default_garmin_path()
-            if detected is None:
-                raise FileNotFoundError(
-                    "Could not find GARMIN folder automatically. Use --garmin-path."
-                )
-            garmin_root = detected
+    if args.check_rollup:
+        return check_rollup()
+    if args.watch and args.skip_refresh:
+        parser.error("--watch cannot be combined with --skip-refresh.")
+    try:
+        args.chart_points = parse_chart_points(args.chart_points)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.profile is not None and args.profile < 0:
+        parser.error("--profile expects a non-negative number of files.")
+
+    profile = RunProfile("export_pwa_data")
+    if args.profile_dump:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            garmin_root = run(args, profile)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(args.profile_dump)
+    else:
+        garmin_root = run(args, profile)
 
-        upserted, parsed = refresh_database_from_garmin(garmin_root)
-        print(f"Refresh complete. Parsed {parsed} FIT files and updated {upserted} rows.")
+    with connection(DB_PATH) as conn:
+        record_ingest_run(conn, profile)
+    if args.profile is not None:
+        print(profile.report(args.profile))
+    if args.profile_dump:
+        print(f"cProfile stats written to {args.profile_dump}")
 
-    payload = export_pwa_json(Path(args.output))
-    print(f"Exported PWA JSON: {args.output}")
-    print(f"Data available: {payload.get('has_data')}")
+    if args.watch:
+        watch(garmin_root, args)
     return 0
 
 
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from muthu_performance_lab.config import DB_PATH
+from muthu_performance_lab.database import connection, list_quarantine, release_quarantine
+from muthu_performance_lab.fit_archive import source_from_file
+from muthu_performance_lab.pwa_export import refresh_fit_files
+
+
+def _resolved(paths: list[str]) -> list[str]:
+    return [str(Path(path).expanduser().resolve()) for path in paths]
+
+
+def list_entries() -> int:
+    with connection(DB_PATH) as conn:
+        entries = list_quarantine(conn)
+    if not entries:
+        print("No quarantined files.")
+        return 0
+    for entry in entries:
+        print(entry["source_file"])
+        print(
+            f"  {entry['error_class']}: {entry['error_message']} "
+            f"(failed {entry['failure_count']}x, last {entry['last_failed_at']})"
+        )
+    print(f"{len(entries)} quarantined files.")
+    return 0
+
+
+def retry(paths: list[str], workers: int | None) -> int:
+    with connection(DB_PATH) as conn:
+        if paths:
+            targets = _resolved(paths)
+        else:
+            targets = [entry["source_file"] for entry in list_quarantine(conn)]
+
+    # Entries inside a ZIP archive are retried straight from the archive.
+    sources = [source_from_file(path) for path in targets]
+    on_disk = [source for source in sources if source.exists()]
+    # Files that are gone are passed as removed, which drops their entries.
+    missing = [source for source in sources if not source.exists()]
+    stats = refresh_fit_files(on_disk, missing, workers=workers, skip_quarantined=False)
+    print(
+        f"Retried {len(on_disk)} files: {stats['parsed']} parsed, "
+        f"{stats['failed']} failed again, {len(missing)} no longer on disk."
+    )
+    return 1 if stats["failed"] else 0
+
+
+def clear(paths: list[str]) -> int:
+    with connection(DB_PATH) as conn:
+        released = release_quarantine(conn, _resolved(paths) if paths else None)
+    print(f"Cleared {released} quarantine entries; they will be parsed on the next refresh.")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Inspect FIT files that failed to parse and are skipped until they change."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show quarantined files and their errors.")
+    retry_parser = commands.add_parser(
+        "retry", help="Parse quarantined files again now (all of them if no paths are given)."
+    )
+    retry_parser.add_argument(
+        "paths", nargs="*", help="FIT files to retry (as listed, also inside a .zip)."
+    )
+    retry_parser.add_argument(
+        "--workers", type=int, default=None, help="Number of parser processes."
+    )
+    clear_parser = commands.add_parser(
+        "clear", help="Forget quarantine entries so the next refresh parses them again."
+    )
+    clear_parser.add_argument("paths", nargs="*", help="FIT files to clear (default: all).")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        return list_entries()
+    if args.command == "retry":
+        return retry(args.paths, args.workers)
+    return clear(args.paths)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,494 @@
+"""
+Local JSON API for the dashboard (asyncio, standard library only).
+
+Every endpoint is a GET and accepts the same filters:
+`?start=YYYY-MM-DD&end=YYYY-MM-DD&sport=running` (`sport` takes a comma-
+separated list or `all`; it defaults to running, like the rest of the app).
+
+- /api/meta             data version, sports, first/last date, page size limit
+- /api/kpis             the KPI cards for the filtered runs
+- /api/monthly_mileage  distance per month
+- /api/load             daily acute:chronic load series
+- /api/runs             one page of the run table (`page`, `page_size`, `order=asc|desc`)
+- /api/best_efforts     the personal record per standard distance, or with
+                        `distance=5k` (a name or metres) the `limit` fastest
+- /api/laps             the laps of one workout (`workout_id`; filters ignored)
+
+Responses use the same columnar layout as the PWA export. They are kept in
+an LRU cache keyed by path and filters; the cache is emptied whenever
+app_meta.data_version changes, i.e. after every ingest, including ones
+made by another process (the exporter, the watcher, Streamlit).
+
+SQLite work runs in worker threads so one slow query does not hold up
+other requests. The server only listens on 127.0.0.1 by default and is
+read-only. Only the PWA's own origin (http://127.0.0.1:8765 or
+http://localhost:8765, see pwa_origins) may read responses from a browser;
+requests sent by any other web page are refused.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from muthu_performance_lab.config import BEST_EFFORT_DISTANCES, CHRONIC_DAYS, DB_PATH, RUN_SPORTS
+from muthu_performance_lab.database import connection, get_data_version
+from muthu_performance_lab.metrics import training_load_series
+from muthu_performance_lab.payload import (
+    LOAD_CHART_COLUMNS,
+    RUN_TABLE_COLUMNS,
+    dumps_payload,
+    frame_columns,
+    row_columns,
+    to_float,
+)
+from muthu_performance_lab.pwa_server import DEFAULT_PORT as DEFAULT_PWA_PORT
+from muthu_performance_lab.queries import (
+    BEST_EFFORT_COLUMNS,
+    LAP_ROW_COLUMNS,
+    query_best_efforts,
+    query_daily_run_distance,
+    query_date_range,
+    query_laps,
+    query_lifetime_distance_km,
+    query_monthly_mileage,
+    query_personal_records,
+    query_runs,
+    query_sports,
+    query_total_runs,
+    query_training_load_ratio,
+    query_weekly_mileage_km,
+)
+
+DEFAULT_API_HOST = "127.0.0.1"
+# Next to the PWA server's 8765; app.js looks for the API here.
+DEFAULT_API_PORT = 8766
+URL_PREFIX = "/api/"
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+DEFAULT_EFFORTS = 10
+MAX_EFFORTS = 100
+CACHE_ENTRIES = 256
+# History read before a filtered load series' start. Rolling sums need
+# CHRONIC_DAYS; the EWMA columns need more: after 6 * 28 days the weight
+# left on older days is (27/29)^168, about 0.0006%.
+LOAD_LEAD_IN_DAYS = 6 * CHRONIC_DAYS
+# Requests larger than this are not HTTP GETs from the dashboard.
+MAX_HEADER_BYTES = 16 * 1024
+
+# (start, end, sports); sports is None for the default (RUN_SPORTS).
+Filters = Tuple[Optional[date], Optional[date], Optional[Tuple[str, ...]]]
+
+
+class ApiError(Exception):
+    """A bad request; the message is sent back to the client."""
+
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _one(query: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = query.get(name)
+    return values[-1].strip() if values and values[-1].strip() else None
+
+
+def _parse_date(query: Dict[str, List[str]], name: str) -> Optional[date]:
+    value = _one(query, name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a date like 2024-01-31") from None
+
+
+def _parse_int(query: Dict[str, List[str]], name: str, default: int, low: int, high: int) -> int:
+    value = _one(query, name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be a whole number") from None
+    if not low <= number <= high:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be between {low} and {high}")
+    return number
+
+
+def parse_filters(query: Dict[str, List[str]], all_sports: Callable[[], List[str]]) -> Filters:
+    """The (start, end, sports) filter from a parsed query string."""
+    start = _parse_date(query, "start")
+    end = _parse_date(query, "end")
+    if start and end and start > end:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "start must not be after end")
+
+    sport = _one(query, "sport")
+    if sport is None:
+        return start, end, None
+    if sport.lower() == "all":
+        sports = all_sports()
+    else:
+        sports = [name.strip().lower() for name in sport.split(",") if name.strip()]
+    # The default list is passed as None so it reuses the default SQL.
+    if set(sports) == RUN_SPORTS:
+        return start, end, None
+    return start, end, tuple(sorted(set(sports)))
+
+
+def _filters_json(filters: Filters) -> Dict[str, Any]:
+    start, end, sports = filters
+    return {
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "sports": list(sports) if sports is not None else sorted(RUN_SPORTS),
+    }
+
+
+def api_meta(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    first, last = query_date_range(conn, filters[2])
+    return {
+        "sports": [{"sport": sport, "workouts": count} for sport, count in query_sports(conn)],
+        "first_date": first,
+        "last_date": last,
+        "max_page_size": MAX_PAGE_SIZE,
+    }
+
+
+def api_kpis(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    start, end, sports = filters
+    latest = query_runs(
+        conn, ["workout_date", "avg_pace_min_per_km"], start, end, sports=sports,
+        limit=1, newest_first=True,
+    )
+    # The weekly card shows the week of the window's end (this week by default).
+    week_of = end if end is not None and end < date.today() else None
+    return {
+        "kpis": {
+            "total_runs": query_total_runs(conn, start, end, sports),
+            "lifetime_distance_km": round(query_lifetime_distance_km(conn, start, end, sports), 2),
+            "weekly_mileage_km": round(query_weekly_mileage_km(conn, week_of, sports), 2),
+            "training_load_ratio": round(query_training_load_ratio(conn, end, sports), 3),
+            "latest_run_date": (
+                latest["workout_date"].iloc[0].date().isoformat() if not latest.empty else None
+            ),
+            "latest_run_pace": (
+                to_float(latest["avg_pace_min_per_km"].iloc[0]) if not latest.empty else None
+            ),
+        }
+    }
+
+
+def api_monthly_mileage(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    monthly = query_monthly_mileage(conn, *filters)
+    return {"columns": frame_columns(monthly, ["month", "distance_km"])}
+
+
+def api_load(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    start, end, sports = filters
+    # Read some history before `start`, so the first days of the window have
+    # settled chronic and EWMA loads, then cut the series back to the window.
+    lead_in = start - timedelta(days=LOAD_LEAD_IN_DAYS) if start is not None else None
+    load = training_load_series(query_daily_run_distance(conn, lead_in, end, sports))
+    if start is not None and not load.empty:
+        load = load[load["date"] >= datetime.combine(start, datetime.min.time())]
+    return {"columns": frame_columns(load.reset_index(drop=True), LOAD_CHART_COLUMNS)}
+
+
+def api_runs(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    start, end, sports = filters
+    page_size = _parse_int(query, "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    page = _parse_int(query, "page", 1, 1, 10**9)
+    order = (_one(query, "order") or "asc").lower()
+    if order not in ("asc", "desc"):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "order must be asc or desc")
+
+    total = query_total_runs(conn, start, end, sports)
+    runs = query_runs(
+        conn, RUN_TABLE_COLUMNS, start, end, sports=sports,
+        limit=page_size, offset=(page - 1) * page_size, newest_first=order == "desc",
+    )
+    return {
+        "page": page,
+        "page_size": page_size,
+        "pages": max(math.ceil(total / page_size), 1),
+        "total": total,
+        "order": order,
+        "runs": frame_columns(runs, RUN_TABLE_COLUMNS),
+    }
+
+
+def _parse_distance(query: Dict[str, List[str]]) -> Optional[float]:
+    """The `distance` parameter as metres: a BEST_EFFORT_DISTANCES name or number."""
+    value = _one(query, "distance")
+    if value is None:
+        return None
+    if value.lower() in BEST_EFFORT_DISTANCES:
+        return BEST_EFFORT_DISTANCES[value.lower()]
+    try:
+        distance_m = float(value)
+    except ValueError:
+        distance_m = None
+    if distance_m not in BEST_EFFORT_DISTANCES.values():
+        names = ", ".join(BEST_EFFORT_DISTANCES)
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"distance must be one of {names} (or its metres)")
+    return distance_m
+
+
+def api_best_efforts(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    distance_m = _parse_distance(query)
+    if distance_m is None:
+        records = query_personal_records(conn, *filters)
+        rows = [row for row in records.values() if row is not None]
+        return {
+            "distances": list(BEST_EFFORT_DISTANCES),
+            "records": row_columns(rows, BEST_EFFORT_COLUMNS),
+        }
+    limit = _parse_int(query, "limit", DEFAULT_EFFORTS, 1, MAX_EFFORTS)
+    rows = query_best_efforts(conn, distance_m, *filters, limit=limit)
+    return {"distance_m": distance_m, "efforts": row_columns(rows, BEST_EFFORT_COLUMNS)}
+
+
+def api_laps(conn, filters: Filters, query: Dict[str, List[str]]) -> Dict[str, Any]:
+    if _one(query, "workout_id") is None:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "workout_id is required")
+    workout_id = _parse_int(query, "workout_id", 0, 1, 2**63 - 1)
+    laps = query_laps(conn, workout_id)
+    return {"workout_id": workout_id, "laps": row_columns(laps, LAP_ROW_COLUMNS)}
+
+
+ENDPOINTS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "meta": api_meta,
+    "kpis": api_kpis,
+    "monthly_mileage": api_monthly_mileage,
+    "load": api_load,
+    "runs": api_runs,
+    "best_efforts": api_best_efforts,
+    "laps": api_laps,
+}
+
+
+class ResponseCache:
+    """LRU of encoded responses, emptied when the data version changes."""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.data_version: Optional[int] = None
+        self._entries: "OrderedDict[Tuple[Any, ...], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def check_version(self, data_version: int) -> None:
+        if data_version != self.data_version:
+            self._entries.clear()
+            self.data_version = data_version
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Tuple[Any, ...], body: bytes) -> None:
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DashboardApi:
+    """Answers API requests from `db_path`, caching responses per data version."""
+
+    def __init__(self, db_path: Path = DB_PATH, cache_entries: int = CACHE_ENTRIES) -> None:
+        self.db_path = db_path
+        self.cache = ResponseCache(cache_entries)
+
+    def _data_version(self) -> int:
+        with connection(self.db_path) as conn:
+            return get_data_version(conn)
+
+    def _compute(self, endpoint: str, query: Dict[str, List[str]], data_version: int) -> bytes:
+        with connection(self.db_path) as conn:
+            filters = parse_filters(query, lambda: [sport for sport, _ in query_sports(conn)])
+            result = ENDPOINTS[endpoint](conn, filters, query)
+        payload = {"data_version": data_version, "filters": _filters_json(filters), **result}
+        return dumps_payload(payload).encode("utf-8")
+
+    async def respond(self, target: str) -> Tuple[HTTPStatus, bytes]:
+        """Status and JSON body for a request target such as "/api/kpis?sport=all"."""
+        url = urlsplit(target)
+        endpoint = url.path[len(URL_PREFIX) :].strip("/") if url.path.startswith(URL_PREFIX) else ""
+        if endpoint not in ENDPOINTS:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"Unknown endpoint {url.path!r}")
+
+        query = parse_qs(url.query)
+        data_version = await asyncio.to_thread(self._data_version)
+        self.cache.check_version(data_version)
+        # Sorted items, so ?a=1&b=2 and ?b=2&a=1 share one entry.
+        key = (endpoint, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        body = self.cache.get(key)
+        if body is None:
+            body = await asyncio.to_thread(self._compute, endpoint, query, data_version)
+            # An ingest may have finished while computing; only cache for the
+            # version the response was built from.
+            if self.cache.data_version == data_version:
+                self.cache.put(key, body)
+        return HTTPStatus.OK, body
+
+
+def pwa_origins(pwa_port: int = DEFAULT_PWA_PORT) -> FrozenSet[str]:
+    """Browser origins of the PWA served by pwa_server.py on `pwa_port`."""
+    return frozenset(f"http://{host}:{pwa_port}" for host in ("127.0.0.1", "localhost"))
+
+
+def _error_body(message: str) -> bytes:
+    return json.dumps({"error": message}).encode("utf-8")
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+    """(method, target, headers) of the next request, or None when the client is done."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ApiError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split()
+    if len(parts) != 3:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return parts[0].upper(), parts[1], headers
+
+
+def _has_body(headers: Dict[str, str]) -> bool:
+    return "transfer-encoding" in headers or headers.get("content-length", "0") != "0"
+
+
+def _response_head(
+    status: HTTPStatus, length: int, keep_alive: bool, origin: Optional[str] = None
+) -> bytes:
+    lines = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        "Content-Type: application/json",
+        f"Content-Length: {length}",
+        # Freshness comes from the data version; the browser should always ask.
+        "Cache-Control: no-store",
+        "Vary: Origin",
+        "Connection: " + ("keep-alive" if keep_alive else "close"),
+    ]
+    if origin is not None:
+        # The PWA is served from another port, so it needs CORS to read replies.
+        lines.append(f"Access-Control-Allow-Origin: {origin}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def handle_connection(
+    api: DashboardApi,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    allowed_origins: FrozenSet[str] = pwa_origins(),
+) -> None:
+    """
+    Serve requests on one connection until the client closes it (HTTP/1.1 keep-alive).
+
+    Requests from a browser page outside `allowed_origins` get 403; CORS is
+    only granted to the allowed ones. Clients that send no Origin (curl,
+    scripts) are served as before. Other methods than GET and HEAD, and
+    requests with a body, are answered and then the connection is closed.
+    """
+    try:
+        while True:
+            keep_alive = False
+            send_body = True
+            allowed_origin = None
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers = request
+                # Request bodies are never read, so the connection is closed
+                # after one instead of parsing the body as the next request.
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and method in ("GET", "HEAD")
+                    and not _has_body(headers)
+                )
+                send_body = method != "HEAD"
+                origin = headers.get("origin")
+                if origin is not None:
+                    if origin not in allowed_origins:
+                        raise ApiError(HTTPStatus.FORBIDDEN, f"Origin {origin!r} is not allowed")
+                    allowed_origin = origin
+                if method not in ("GET", "HEAD"):
+                    raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Only GET is supported")
+                status, body = await api.respond(target)
+            except ApiError as exc:
+                status, body = exc.status, _error_body(str(exc))
+            except Exception as exc:  # noqa: BLE001
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, _error_body(str(exc))
+
+            writer.write(_response_head(status, len(body), keep_alive, allowed_origin))
+            if send_body:
+                writer.write(body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_api_server(
+    host: str = DEFAULT_API_HOST,
+    port: int = DEFAULT_API_PORT,
+    db_path: Path = DB_PATH,
+    pwa_port: int = DEFAULT_PWA_PORT,
+) -> asyncio.AbstractServer:
+    api = DashboardApi(db_path)
+    allowed_origins = pwa_origins(pwa_port)
+    return await asyncio.start_server(
+        lambda reader, writer: handle_connection(api, reader, writer, allowed_origins),
+        host,
+        port,
+        limit=MAX_HEADER_BYTES,
+    )
+
+
+async def _serve_forever(host: str, port: int, db_path: Path, pwa_port: int) -> None:
+    server = await start_api_server(host, port, db_path, pwa_port)
+    async with server:
+        await server.serve_forever()
+
+
+def serve_api(
+    host: str = DEFAULT_API_HOST,
+    port: int = DEFAULT_API_PORT,
+    db_path: Path = DB_PATH,
+    pwa_port: int = DEFAULT_PWA_PORT,
+) -> None:
+    """Serve the API; browsers may only read it from the PWA on `pwa_port`."""
+    print(f"Dashboard API running at: http://{host}:{port}{URL_PREFIX}")
+    try:
+        asyncio.run(_serve_forever(host, port, db_path, pwa_port))
+    except KeyboardInterrupt:
+        pass
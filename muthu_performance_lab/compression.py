@@ -0,0 +1,110 @@
+"""
+Precompressed siblings for the PWA's static files.
+
+For every text file under pwa/ (HTML, JS, CSS, JSON, SVG) the exporter
+writes `name.gz` and, when the brotli package is installed, `name.br` next
+to it. The PWA server (pwa_server.py) picks whichever variant the browser
+accepts, so nothing is compressed per request.
+"""
+from __future__ import annotations
+
+import gzip
+import os
+from pathlib import Path
+from typing import Dict, Iterable
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip siblings are written.
+    brotli = None
+
+COMPRESSIBLE_SUFFIXES = {".html", ".js", ".css", ".json", ".svg", ".webmanifest", ".txt"}
+
+# Content-Encoding -> sibling suffix, in the order the server prefers them.
+ENCODING_SUFFIXES: Dict[str, str] = {"br": ".br", "gzip": ".gz"}
+
+# Files smaller than this gain little and are served as-is.
+MIN_COMPRESS_BYTES = 256
+# Quality 5 is about as fast as gzip -9 and still smaller; 11 is ~50x slower,
+# which would dominate an incremental export.
+BROTLI_QUALITY = 5
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical input.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def available_encodings() -> list[str]:
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding != "br" or brotli is not None]
+
+
+def write_compressed_siblings(path: Path, data: bytes | None = None) -> int:
+    """
+    (Re)write the .gz/.br siblings of `path`. Returns how many were written.
+
+    Siblings are written to a temp file and renamed into place, and only
+    kept when they are actually smaller than the original.
+    """
+    if data is None:
+        data = path.read_bytes()
+
+    written = 0
+    for encoding in available_encodings():
+        sibling = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+        packed = _compress(data, encoding) if len(data) >= MIN_COMPRESS_BYTES else None
+        if packed is None or len(packed) >= len(data):
+            sibling.unlink(missing_ok=True)
+            continue
+        tmp_path = sibling.with_name(sibling.name + ".tmp")
+        tmp_path.write_bytes(packed)
+        os.replace(tmp_path, sibling)
+        written += 1
+    return written
+
+
+def remove_compressed_siblings(path: Path) -> None:
+    for suffix in ENCODING_SUFFIXES.values():
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+
+def _is_stale(path: Path, source_mtime: float) -> bool:
+    try:
+        return path.stat().st_mtime < source_mtime
+    except FileNotFoundError:
+        return True
+
+
+def precompress_tree(root: Path, suffixes: Iterable[str] = COMPRESSIBLE_SUFFIXES) -> int:
+    """
+    Bring the compressed siblings under `root` up to date.
+
+    Files whose siblings are missing or older than the file are compressed;
+    siblings whose original file is gone are deleted. Returns the number of
+    sibling files written.
+    """
+    wanted = set(suffixes)
+    sibling_suffixes = set(ENCODING_SUFFIXES.values())
+    written = 0
+    for path in root.rglob("*"):
+        if not path.is_file():
+            continue
+        if path.suffix in sibling_suffixes:
+            if not path.with_suffix("").exists():
+                path.unlink()
+            continue
+        if path.suffix not in wanted:
+            continue
+
+        stat = path.stat()
+        siblings = [
+            path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+            for encoding in available_encodings()
+        ]
+        if stat.st_size >= MIN_COMPRESS_BYTES and any(
+            _is_stale(sibling, stat.st_mtime) for sibling in siblings
+        ):
+            written += write_compressed_siblings(path)
+    return written
@@ -14,3 +14,22 @@ DEFAULT_GARMIN_CANDIDATES = [
 DATA_DIR = PROJECT_ROOT / "data"
 DB_PATH = DATA_DIR / "performance_lab.db"
 ERROR_LOG_PATH = DATA_DIR / "ingestion_errors.log"
+STREAMS_DIR = DATA_DIR / "streams"
+PWA_DIR = PROJECT_ROOT / "pwa"
+
+# Sports counted as runs by every dashboard metric (compared lower-cased).
+RUN_SPORTS = {"running"}
+
+# Training load windows, in days: acute (last week) vs chronic (last 4 weeks).
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+
+# Best efforts kept per activity, in metres (see best_efforts.py).
+BEST_EFFORT_DISTANCES = {
+    "400m": 400.0,
+    "1k": 1000.0,
+    "5k": 5000.0,
+    "10k": 10000.0,
+    "half_marathon": 21097.5,
+    "marathon": 42195.0,
+}
@@ -1,6 +1,27 @@
+import json
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, Dict, Any
+from typing import Callable, Iterable, Iterator, Dict, Any, List, Optional, Set, Tuple
+
+from muthu_performance_lab.fit_reader import activity_identity
+from muthu_performance_lab.profiling import RunProfile
+from muthu_performance_lab.session_fields import (
+    DERIVED_COLUMNS,
+    DERIVED_VERSION,
+    LAP_COLUMNS,
+    PARSE_VERSION,
+    decode_session_fields,
+    derive_columns,
+)
+
+
+# Rows written per transaction during ingest. Each batch is committed, so an
+# interrupted refresh keeps everything up to the last full batch.
+DEFAULT_BATCH_SIZE = 200
 
 
 CREATE_TABLE_SQL = """
@@ -8,6 +29,7 @@ CREATE TABLE IF NOT EXISTS workouts (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     source_file TEXT UNIQUE NOT NULL,
     source_mtime REAL NOT NULL,
+    source_size INTEGER,
     workout_date TEXT,
     sport TEXT,
     sub_sport TEXT,
@@ -23,10 +45,217 @@ CREATE TABLE IF NOT EXISTS workouts (
 """
 
 
+CREATE_STREAMS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS workout_streams (
+    workout_id INTEGER PRIMARY KEY REFERENCES workouts(id),
+    stream_file TEXT NOT NULL,
+    sample_count INTEGER NOT NULL,
+    channels TEXT NOT NULL
+);
+"""
+
+
+# The whole FIT session message of each workout (session_fields.py), and the
+# DERIVED_VERSION its workouts columns were computed with.
+CREATE_WORKOUT_FIELDS_SQL = """
+CREATE TABLE IF NOT EXISTS workout_fields (
+    workout_id INTEGER PRIMARY KEY REFERENCES workouts(id),
+    session_json TEXT NOT NULL,
+    derived_version INTEGER NOT NULL
+);
+"""
+
+
+# One row per lap message, in file order (lap_index from 0).
+CREATE_LAPS_SQL = """
+CREATE TABLE IF NOT EXISTS laps (
+    workout_id INTEGER NOT NULL REFERENCES workouts(id),
+    lap_index INTEGER NOT NULL,
+    start_time TEXT,
+    distance_km REAL,
+    duration_min REAL,
+    avg_hr REAL,
+    max_hr REAL,
+    avg_cadence REAL,
+    avg_pace_min_per_km REAL,
+    calories REAL,
+    PRIMARY KEY (workout_id, lap_index)
+);
+"""
+
+
+# Fastest stretch of each config.BEST_EFFORT_DISTANCES distance per workout
+# (best_efforts.py). workout_date and sport (lower-cased, '' when unknown)
+# are copied from workouts so personal records are an index range lookup.
+CREATE_BEST_EFFORTS_SQL = """
+CREATE TABLE IF NOT EXISTS best_efforts (
+    workout_id INTEGER NOT NULL REFERENCES workouts(id),
+    distance_m REAL NOT NULL,
+    elapsed_s REAL NOT NULL,
+    start_offset_s REAL NOT NULL,
+    workout_date TEXT,
+    sport TEXT NOT NULL,
+    PRIMARY KEY (workout_id, distance_m)
+);
+"""
+
+
+# One row per (date, sport) so date-bucketed metrics read a few hundred rows
+# instead of every workout. sport is lower-cased, '' when unknown; workouts
+# without a date are not rolled up.
+CREATE_DAILY_TOTALS_SQL = """
+CREATE TABLE IF NOT EXISTS daily_totals (
+    workout_date TEXT NOT NULL,
+    sport TEXT NOT NULL,
+    workout_count INTEGER NOT NULL,
+    distance_km REAL NOT NULL,
+    duration_min REAL NOT NULL,
+    hr_duration_min REAL NOT NULL,
+    hr_weighted_sum REAL NOT NULL,
+    PRIMARY KEY (workout_date, sport)
+);
+"""
+
+# Small key/value table. "data_version" goes up by one in every transaction
+# that changes workouts or the rollup, so readers (e.g. the Streamlit cache)
+# can tell whether anything changed without scanning the data.
+CREATE_META_SQL = """
+CREATE TABLE IF NOT EXISTS app_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Files that failed to parse, keyed by path. While a file still has the same
+# mtime and size it is skipped by incremental refreshes instead of being
+# re-parsed (and failing again) every time.
+CREATE_QUARANTINE_SQL = """
+CREATE TABLE IF NOT EXISTS quarantine (
+    source_file TEXT PRIMARY KEY,
+    source_mtime REAL NOT NULL,
+    source_size INTEGER NOT NULL,
+    error_class TEXT NOT NULL,
+    error_message TEXT NOT NULL,
+    first_failed_at TEXT NOT NULL,
+    last_failed_at TEXT NOT NULL,
+    failure_count INTEGER NOT NULL
+);
+"""
+
+# A file that fails again keeps its first_failed_at and counts up.
+QUARANTINE_UPSERT_SQL = """
+INSERT INTO quarantine (
+    source_file,
+    source_mtime,
+    source_size,
+    source_crc,
+    error_class,
+    error_message,
+    first_failed_at,
+    last_failed_at,
+    failure_count
+)
+VALUES (
+    :source_file,
+    :source_mtime,
+    :source_size,
+    :source_crc,
+    :error_class,
+    :error_message,
+    :failed_at,
+    :failed_at,
+    1
+)
+ON CONFLICT(source_file) DO UPDATE SET
+    source_mtime = excluded.source_mtime,
+    source_size = excluded.source_size,
+    source_crc = excluded.source_crc,
+    error_class = excluded.error_class,
+    error_message = excluded.error_message,
+    last_failed_at = excluded.last_failed_at,
+    failure_count = quarantine.failure_count + 1;
+"""
+
+# Files skipped because another path already holds the same activity (see
+# fit_reader.activity_identity). Kept so an unchanged duplicate is skipped
+# by its mtime and size on later refreshes instead of being read again.
+CREATE_DUPLICATE_FILES_SQL = """
+CREATE TABLE IF NOT EXISTS duplicate_files (
+    source_file TEXT PRIMARY KEY,
+    source_mtime REAL NOT NULL,
+    source_size INTEGER NOT NULL,
+    activity_key TEXT NOT NULL,
+    duplicate_of TEXT NOT NULL
+);
+"""
+
+DUPLICATE_UPSERT_SQL = """
+INSERT INTO duplicate_files (
+    source_file, source_mtime, source_size, source_crc, activity_key, duplicate_of
+)
+VALUES (
+    :source_file, :source_mtime, :source_size, :source_crc, :activity_key, :duplicate_of
+)
+ON CONFLICT(source_file) DO UPDATE SET
+    source_mtime = excluded.source_mtime,
+    source_size = excluded.source_size,
+    source_crc = excluded.source_crc,
+    activity_key = excluded.activity_key,
+    duplicate_of = excluded.duplicate_of;
+"""
+
+# One row per refresh or export run (see profiling.RunProfile); stages holds
+# JSON {stage: seconds} in the order the stages ran. Per-file parse times of
+# a run are in ingest_run_files. Only the last INGEST_RUNS_KEPT runs are kept.
+CREATE_INGEST_RUNS_SQL = """
+CREATE TABLE IF NOT EXISTS ingest_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    total_seconds REAL NOT NULL,
+    files_parsed INTEGER NOT NULL,
+    files_failed INTEGER NOT NULL,
+    bytes_parsed INTEGER NOT NULL,
+    parse_seconds REAL NOT NULL,
+    stages TEXT NOT NULL
+);
+"""
+
+CREATE_INGEST_RUN_FILES_SQL = """
+CREATE TABLE IF NOT EXISTS ingest_run_files (
+    run_id INTEGER NOT NULL REFERENCES ingest_runs(id),
+    source_file TEXT NOT NULL,
+    parse_seconds REAL NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    ok INTEGER NOT NULL
+);
+"""
+
+INGEST_RUNS_KEPT = 30
+
+# hr_weighted_sum / hr_duration_min is the duration-weighted average HR.
+DAILY_TOTALS_SELECT_SQL = """
+SELECT
+    workout_date,
+    lower(coalesce(sport, '')) AS sport_key,
+    COUNT(*),
+    TOTAL(distance_km),
+    TOTAL(duration_min),
+    TOTAL(CASE WHEN avg_hr IS NOT NULL THEN duration_min END),
+    TOTAL(avg_hr * duration_min)
+FROM workouts
+WHERE workout_date IS NOT NULL {where}
+GROUP BY workout_date, sport_key
+"""
+
+
 UPSERT_SQL = """
 INSERT INTO workouts (
     source_file,
     source_mtime,
+    source_size,
+    source_crc,
+    activity_key,
     workout_date,
     sport,
     sub_sport,
@@ -42,6 +271,9 @@ INSERT INTO workouts (
 VALUES (
     :source_file,
     :source_mtime,
+    :source_size,
+    :source_crc,
+    :activity_key,
     :workout_date,
     :sport,
     :sub_sport,
@@ -56,6 +288,9 @@ VALUES (
 )
 ON CONFLICT(source_file) DO UPDATE SET
     source_mtime = excluded.source_mtime,
+    source_size = excluded.source_size,
+    source_crc = excluded.source_crc,
+    activity_key = excluded.activity_key,
     workout_date = excluded.workout_date,
     sport = excluded.sport,
     sub_sport = excluded.sub_sport,
@@ -70,19 +305,766 @@ ON CONFLICT(source_file) DO UPDATE SET
 """
 
 
+# Links a freshly upserted workout to the record stream its parser wrote.
+UPSERT_STREAM_SQL = """
+INSERT INTO workout_streams (workout_id, stream_file, sample_count, channels)
+SELECT id, :stream_file, :stream_samples, :stream_channels
+FROM workouts
+WHERE source_file = :source_file
+ON CONFLICT(workout_id) DO UPDATE SET
+    stream_file = excluded.stream_file,
+    sample_count = excluded.sample_count,
+    channels = excluded.channels;
+"""
+
+
+UPSERT_FIELDS_SQL = """
+INSERT INTO workout_fields (workout_id, session_json, derived_version, parse_version)
+SELECT id, :session_fields, :derived_version, :parse_version
+FROM workouts
+WHERE source_file = :source_file
+ON CONFLICT(workout_id) DO UPDATE SET
+    session_json = excluded.session_json,
+    derived_version = excluded.derived_version,
+    parse_version = excluded.parse_version;
+"""
+
+INSERT_LAP_SQL = """
+INSERT INTO laps (workout_id, lap_index, {columns})
+SELECT id, :lap_index, {values}
+FROM workouts
+WHERE source_file = :source_file;
+""".format(
+    columns=", ".join(LAP_COLUMNS), values=", ".join(f":{column}" for column in LAP_COLUMNS)
+)
+
+INSERT_BEST_EFFORT_SQL = """
+INSERT INTO best_efforts
+    (workout_id, distance_m, elapsed_s, start_offset_s, workout_date, sport)
+SELECT id, :distance_m, :elapsed_s, :start_offset_s, workout_date, lower(coalesce(sport, ''))
+FROM workouts
+WHERE source_file = :source_file;
+"""
+
+# Deletes the rows of one workout, by source file, from a table keyed by workout_id.
+DELETE_BY_SOURCE_SQL = (
+    "DELETE FROM {table} WHERE workout_id IN (SELECT id FROM workouts WHERE source_file = ?)"
+)
+
+
+def _ensure_columns(conn: sqlite3.Connection) -> None:
+    # Databases created before source_size existed need the column added in place.
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(workouts)")}
+    if "source_size" not in columns:
+        conn.execute("ALTER TABLE workouts ADD COLUMN source_size INTEGER")
+
+
+def _migrate_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_TABLE_SQL)
+    conn.execute(CREATE_STREAMS_TABLE_SQL)
+    conn.execute(CREATE_META_SQL)
+    _ensure_columns(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_workouts_workout_date ON workouts(workout_date)")
+
+
+def _migrate_daily_totals(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_DAILY_TOTALS_SQL)
+    # Existing databases get their rollup seeded from workouts here.
+    rebuild_daily_totals(conn)
+
+
+def _migrate_sport_indexes(conn: sqlite3.Connection) -> None:
+    # Every run query filters on lower(sport) (see queries._RUN_WHERE); an
+    # expression index lets SQLite skip other sports instead of scanning them.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_workouts_sport_date "
+        "ON workouts(lower(sport), workout_date)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_daily_totals_sport_date "
+        "ON daily_totals(sport, workout_date)"
+    )
+
+
+def _migrate_quarantine(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_QUARANTINE_SQL)
+
+
+def _migrate_activity_keys(conn: sqlite3.Connection) -> None:
+    """
+    Key every stored workout by activity identity and collapse duplicates.
+
+    Of several rows for the same activity the first one ingested (lowest id)
+    is kept; the others move to duplicate_files. Their stream files stay in
+    data/streams/ and are reused if that path is ever ingested again.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(workouts)")}
+    if "activity_key" not in columns:
+        conn.execute("ALTER TABLE workouts ADD COLUMN activity_key TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_workouts_activity_key ON workouts(activity_key)")
+    conn.execute(CREATE_DUPLICATE_FILES_SQL)
+
+    keys = []
+    for workout_id, source_file in conn.execute("SELECT id, source_file FROM workouts").fetchall():
+        try:
+            keys.append((activity_identity(Path(source_file)), workout_id))
+        except OSError:
+            # File no longer on disk: left unkeyed, it never counts as a duplicate.
+            continue
+    conn.executemany("UPDATE workouts SET activity_key = ? WHERE id = ?", keys)
+
+    duplicates = conn.execute(
+        """
+        SELECT w.source_file, w.source_mtime, COALESCE(w.source_size, 0), w.activity_key,
+               (SELECT k.source_file FROM workouts k
+                WHERE k.activity_key = w.activity_key ORDER BY k.id LIMIT 1)
+        FROM workouts w
+        WHERE w.activity_key IS NOT NULL
+          AND w.id > (SELECT MIN(id) FROM workouts m WHERE m.activity_key = w.activity_key)
+        """
+    ).fetchall()
+    if not duplicates:
+        return
+    conn.executemany(
+        "INSERT OR REPLACE INTO duplicate_files "
+        "(source_file, source_mtime, source_size, activity_key, duplicate_of) "
+        "VALUES (?, ?, ?, ?, ?)",
+        duplicates,
+    )
+    params = [(row[0],) for row in duplicates]
+    conn.executemany(
+        "DELETE FROM workout_streams WHERE workout_id IN "
+        "(SELECT id FROM workouts WHERE source_file = ?)",
+        params,
+    )
+    conn.executemany("DELETE FROM workouts WHERE source_file = ?", params)
+    rebuild_daily_totals(conn)
+
+
+def _migrate_ingest_runs(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_INGEST_RUNS_SQL)
+    conn.execute(CREATE_INGEST_RUN_FILES_SQL)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ingest_run_files_run "
+        "ON ingest_run_files(run_id, parse_seconds DESC)"
+    )
+
+
+def _migrate_workout_fields(conn: sqlite3.Connection) -> None:
+    # Workouts stored before this step have no fields yet; refreshes re-parse
+    # them once (see fetch_files_to_reparse).
+    conn.execute(CREATE_WORKOUT_FIELDS_SQL)
+
+
+def _migrate_laps_best_efforts(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_LAPS_SQL)
+    conn.execute(CREATE_BEST_EFFORTS_SQL)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_best_efforts_distance_date "
+        "ON best_efforts(distance_m, workout_date)"
+    )
+    # All-time records per sport read the first row of this index.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_best_efforts_fastest "
+        "ON best_efforts(distance_m, sport, elapsed_s)"
+    )
+    # Existing workouts count as parse version 1, so refreshes parse them
+    # once more for their laps and best efforts (see fetch_files_to_reparse).
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(workout_fields)")}
+    if "parse_version" not in columns:
+        conn.execute(
+            "ALTER TABLE workout_fields ADD COLUMN parse_version INTEGER NOT NULL DEFAULT 1"
+        )
+
+
+def _migrate_source_crc(conn: sqlite3.Connection) -> None:
+    # Files read from a ZIP archive (fit_archive.py) are also keyed by their
+    # CRC-32; files on disk keep NULL.
+    for table in ("workouts", "quarantine", "duplicate_files"):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "source_crc" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN source_crc INTEGER")
+
+
+# Applied in order, each in its own transaction, and recorded in
+# schema_migrations. Add new steps at the end; never renumber old ones.
+# Steps must be safe to run on databases created before this table existed.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "workouts, workout_streams and app_meta tables", _migrate_base_tables),
+    (2, "daily_totals rollup", _migrate_daily_totals),
+    (3, "sport/date indexes", _migrate_sport_indexes),
+    (4, "quarantine for files that fail to parse", _migrate_quarantine),
+    (5, "activity keys and duplicate_files", _migrate_activity_keys),
+    (6, "ingest_runs timings", _migrate_ingest_runs),
+    (7, "workout_fields session fields", _migrate_workout_fields),
+    (8, "laps and best_efforts", _migrate_laps_best_efforts),
+    (9, "source_crc for ZIP archive members", _migrate_source_crc),
+]
+
+CREATE_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+);
+"""
+
+# Applied to every connection. WAL lets the dashboard read while an ingest
+# writes; NORMAL sync is safe with WAL (a power cut can only lose the last
+# commits, never corrupt the file). busy_timeout makes a second writer wait
+# instead of failing with "database is locked".
+CONNECTION_PRAGMAS = [
+    "PRAGMA busy_timeout = 10000",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+]
+
+# Idle connections kept per database file for reuse.
+POOL_SIZE = 4
+
+_pool_lock = threading.Lock()
+_idle_connections: Dict[str, List[sqlite3.Connection]] = {}
+_migrated_paths: Set[str] = set()
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute(CREATE_MIGRATIONS_SQL)
+    (version,) = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()
+    return version
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """Apply pending MIGRATIONS and return the versions that were applied."""
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # at once cannot both apply the same step.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.now().isoformat(timespec="seconds")),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def _open(db_path: Path) -> sqlite3.Connection:
+    # check_same_thread=False: pooled connections may be handed to another
+    # thread (Streamlit runs each rerun on a new one), never to two at once.
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _ensure_schema(conn: sqlite3.Connection, key: str) -> None:
+    # Schema checks run once per database file per process, not on every call.
+    with _pool_lock:
+        if key in _migrated_paths:
+            return
+    # WAL is stored in the file, so this only does work the first time.
+    conn.execute("PRAGMA journal_mode = WAL")
+    if migrate(conn):
+        conn.execute("PRAGMA optimize")
+    with _pool_lock:
+        _migrated_paths.add(key)
+
+
+def _forget_if_missing(db_path: Path, key: str) -> None:
+    # A deleted database file (e.g. a manual reset) must be created and migrated again.
+    if db_path.exists():
+        return
+    with _pool_lock:
+        _migrated_paths.discard(key)
+        stale = _idle_connections.pop(key, [])
+    for conn in stale:
+        conn.close()
+
+
 def get_connection(db_path: Path) -> sqlite3.Connection:
+    """A new tuned connection with an up-to-date schema; the caller closes it."""
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    conn.execute(CREATE_TABLE_SQL)
-    conn.commit()
+    _forget_if_missing(db_path, str(db_path.resolve()))
+    conn = _open(db_path)
+    _ensure_schema(conn, str(db_path.resolve()))
     return conn
 
 
-def upsert_workouts(conn: sqlite3.Connection, rows: Iterable[Dict[str, Any]]) -> int:
-    rows = list(rows)
-    if not rows:
+@contextmanager
+def connection(db_path: Path) -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a pooled connection for `db_path`.
+
+    The connection goes back to the pool afterwards instead of being closed.
+    Pending changes are committed on a clean exit and rolled back on error,
+    so a returned connection never holds a transaction open.
+    """
+    key = str(db_path.resolve())
+    _forget_if_missing(db_path, key)
+    with _pool_lock:
+        idle = _idle_connections.get(key)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = get_connection(db_path)
+
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        if conn.in_transaction:
+            conn.commit()
+    finally:
+        if conn.in_transaction:
+            # A failed commit leaves the connection unusable for the pool.
+            conn.close()
+        else:
+            with _pool_lock:
+                idle = _idle_connections.setdefault(key, [])
+                if len(idle) < POOL_SIZE:
+                    idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+
+def close_pooled_connections() -> None:
+    with _pool_lock:
+        pooled = [conn for idle in _idle_connections.values() for conn in idle]
+        _idle_connections.clear()
+    for conn in pooled:
+        conn.close()
+
+
+def bump_data_version(conn: sqlite3.Connection) -> None:
+    """Mark the data as changed; commits with the caller's transaction."""
+    conn.execute(
+        "INSERT INTO app_meta (key, value) VALUES ('data_version', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+
+def get_data_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM app_meta WHERE key = 'data_version'").fetchone()
+    return row[0] if row else 0
+
+
+DailyKey = Tuple[str, str]
+
+
+def _daily_key(workout_date: Optional[str], sport: Optional[str]) -> Optional[DailyKey]:
+    if workout_date is None:
+        return None
+    return workout_date, (sport or "").lower()
+
+
+def _stored_daily_keys(conn: sqlite3.Connection, source_files: Iterable[str]) -> Set[DailyKey]:
+    keys: Set[DailyKey] = set()
+    for source_file in source_files:
+        row = conn.execute(
+            "SELECT workout_date, sport FROM workouts WHERE source_file = ?", (source_file,)
+        ).fetchone()
+        key = _daily_key(*row) if row else None
+        if key is not None:
+            keys.add(key)
+    return keys
+
+
+def refresh_daily_totals(conn: sqlite3.Connection, keys: Iterable[DailyKey]) -> None:
+    """Recompute the rollup rows for the given (date, sport) keys from workouts."""
+    params = list(keys)
+    if not params:
+        return
+    conn.executemany("DELETE FROM daily_totals WHERE workout_date = ? AND sport = ?", params)
+    conn.executemany(
+        "INSERT INTO daily_totals "
+        + DAILY_TOTALS_SELECT_SQL.format(
+            where="AND workout_date = ? AND lower(coalesce(sport, '')) = ?"
+        ),
+        params,
+    )
+
+
+def rebuild_daily_totals(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM daily_totals")
+    conn.execute("INSERT INTO daily_totals " + DAILY_TOTALS_SELECT_SQL.format(where=""))
+    bump_data_version(conn)
+
+
+def check_daily_totals(conn: sqlite3.Connection, tolerance: float = 1e-6) -> List[str]:
+    """
+    Rebuild the rollup from scratch and diff it against the stored one.
+
+    Returns one line per mismatching (date, sport); an empty list means the
+    incremental rollup is consistent. The stored rollup is left untouched.
+    """
+    stored = {
+        (row[0], row[1]): row[2:]
+        for row in conn.execute("SELECT * FROM daily_totals")
+    }
+    fresh = {
+        (row[0], row[1]): row[2:]
+        for row in conn.execute(DAILY_TOTALS_SELECT_SQL.format(where=""))
+    }
+
+    problems = []
+    for key in sorted(stored.keys() | fresh.keys()):
+        old, new = stored.get(key), fresh.get(key)
+        if old is None or new is None:
+            problems.append(f"{key[0]} {key[1] or '-'}: stored={old} rebuilt={new}")
+        elif any(abs(a - b) > tolerance for a, b in zip(old, new)):
+            problems.append(f"{key[0]} {key[1] or '-'}: stored={old} rebuilt={new}")
+    return problems
+
+
+# (source_mtime, source_size, source_crc): what tells whether a file changed.
+# source_crc is only set for ZIP archive members.
+ChangeKey = Tuple[float, Optional[int], Optional[int]]
+
+
+def fetch_known_files(conn: sqlite3.Connection) -> Dict[str, ChangeKey]:
+    """Return {source_file: change key} for every stored workout."""
+    rows = conn.execute("SELECT source_file, source_mtime, source_size, source_crc FROM workouts")
+    return {source_file: (mtime, size, crc) for source_file, mtime, size, crc in rows}
+
+
+def fetch_files_to_reparse(conn: sqlite3.Connection) -> Set[str]:
+    """
+    Source files of workouts without stored session fields, or stored by an
+    older PARSE_VERSION: their FIT files hold data the database lacks.
+    """
+    rows = conn.execute(
+        "SELECT w.source_file FROM workouts w "
+        "LEFT JOIN workout_fields f ON f.workout_id = w.id "
+        "WHERE f.workout_id IS NULL OR f.parse_version < ?",
+        (PARSE_VERSION,),
+    )
+    return {row[0] for row in rows}
+
+
+def delete_workouts(
+    conn: sqlite3.Connection,
+    source_files: Iterable[str],
+    streams_dir: Optional[Path] = None,
+) -> int:
+    """Delete workouts by source file, along with their record streams."""
+    paths: List[str] = list(source_files)
+    if not paths:
         return 0
 
-    conn.executemany(UPSERT_SQL, rows)
+    params = [(path,) for path in paths]
+    touched = _stored_daily_keys(conn, paths)
+    stream_files = [
+        row[0]
+        for path in paths
+        for row in conn.execute(
+            "SELECT s.stream_file FROM workout_streams s "
+            "JOIN workouts w ON w.id = s.workout_id WHERE w.source_file = ?",
+            (path,),
+        )
+    ]
+    for table in ("workout_streams", "workout_fields", "laps", "best_efforts"):
+        conn.executemany(DELETE_BY_SOURCE_SQL.format(table=table), params)
+    conn.executemany("DELETE FROM workouts WHERE source_file = ?", params)
+    refresh_daily_totals(conn, touched)
+    bump_data_version(conn)
+    conn.commit()
+
+    if streams_dir is not None:
+        for stream_file in stream_files:
+            (streams_dir / stream_file).unlink(missing_ok=True)
+    return len(paths)
+
+
+def upsert_workouts(
+    conn: sqlite3.Connection,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Upsert rows in committed batches of `batch_size`, consuming `rows` lazily.
+
+    Rows that carry stream_file / stream_samples / stream_channels also get
+    their workout_streams entry written in the same transaction (a
+    stream_file of None removes it), rows that
+    carry session_fields their workout_fields entry, and rows that carry
+    "laps" or "best_efforts" (lists, possibly empty) replace those; the
+    daily_totals rows for every date the batch touched are recomputed, and
+    the files are released from quarantine and duplicate_files. Rows should
+    carry an activity_key (see fit_reader.activity_identity); it is stored
+    as NULL when missing.
+
+    `on_batch` is called after each commit with the running row count.
+    """
+    row_iter = iter(rows)
+    total = 0
+    while True:
+        batch = list(islice(row_iter, batch_size))
+        if not batch:
+            break
+        for row in batch:
+            row.setdefault("activity_key", None)
+            row.setdefault("source_crc", None)
+            row.setdefault("derived_version", DERIVED_VERSION)
+            row.setdefault("parse_version", PARSE_VERSION)
+        # Both the old and new (date, sport) of an updated workout need recomputing.
+        touched = _stored_daily_keys(conn, (row["source_file"] for row in batch))
+        conn.executemany(UPSERT_SQL, batch)
+        conn.executemany(UPSERT_STREAM_SQL, [row for row in batch if row.get("stream_file")])
+        conn.executemany(
+            DELETE_BY_SOURCE_SQL.format(table="workout_streams"),
+            [(row["source_file"],) for row in batch if row.get("stream_file", "") is None],
+        )
+        conn.executemany(UPSERT_FIELDS_SQL, [row for row in batch if row.get("session_fields")])
+        # Rows carry their laps and best efforts under the table's name;
+        # best_efforts ignores lap_index.
+        for table, insert_sql in (("laps", INSERT_LAP_SQL), ("best_efforts", INSERT_BEST_EFFORT_SQL)):
+            replaced = [row for row in batch if table in row]
+            conn.executemany(
+                DELETE_BY_SOURCE_SQL.format(table=table),
+                [(row["source_file"],) for row in replaced],
+            )
+            conn.executemany(
+                insert_sql,
+                [
+                    {**item, "lap_index": index, "source_file": row["source_file"]}
+                    for row in replaced
+                    for index, item in enumerate(row[table])
+                ],
+            )
+        # A file that parses now is no longer quarantined or a duplicate.
+        source_files = [(row["source_file"],) for row in batch]
+        conn.executemany("DELETE FROM quarantine WHERE source_file = ?", source_files)
+        conn.executemany("DELETE FROM duplicate_files WHERE source_file = ?", source_files)
+        touched.update(
+            key
+            for key in (_daily_key(row["workout_date"], row["sport"]) for row in batch)
+            if key is not None
+        )
+        refresh_daily_totals(conn, touched)
+        bump_data_version(conn)
+        conn.commit()
+        total += len(batch)
+        if on_batch is not None:
+            on_batch(total)
+    return total
+
+
+def rederive_workouts(
+    conn: sqlite3.Connection,
+    everything: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Recompute the DERIVED_COLUMNS of workouts from their stored session fields.
+
+    Only workouts derived by an older DERIVED_VERSION are touched, or every
+    workout with stored fields when `everything` is set. Works in committed
+    batches like upsert_workouts, keeping daily_totals in step. Returns the
+    number of workouts rewritten.
+    """
+    update_sql = (
+        "UPDATE workouts SET "
+        + ", ".join(f"{column} = :{column}" for column in DERIVED_COLUMNS)
+        + " WHERE id = :id"
+    )
+    select_sql = (
+        "SELECT w.id, w.source_file, f.session_json FROM workouts w "
+        "JOIN workout_fields f ON f.workout_id = w.id "
+        "WHERE w.id > ? AND (? OR f.derived_version < ?) ORDER BY w.id LIMIT ?"
+    )
+    total = 0
+    last_id = 0
+    while True:
+        batch = conn.execute(
+            select_sql, (last_id, everything, DERIVED_VERSION, batch_size)
+        ).fetchall()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        touched = _stored_daily_keys(conn, (source_file for _, source_file, _ in batch))
+        updates = []
+        for workout_id, _, session_json in batch:
+            row = derive_columns(decode_session_fields(session_json))
+            row["id"] = workout_id
+            updates.append(row)
+            key = _daily_key(row["workout_date"], row["sport"])
+            if key is not None:
+                touched.add(key)
+        conn.executemany(update_sql, updates)
+        conn.executemany(
+            "UPDATE workout_fields SET derived_version = ? WHERE workout_id = ?",
+            [(DERIVED_VERSION, row["id"]) for row in updates],
+        )
+        conn.executemany(
+            "UPDATE best_efforts SET workout_date = :workout_date, "
+            "sport = lower(coalesce(:sport, '')) WHERE workout_id = :id",
+            updates,
+        )
+        refresh_daily_totals(conn, touched)
+        bump_data_version(conn)
+        conn.commit()
+        total += len(batch)
+    return total
+
+
+def fetch_quarantined_files(conn: sqlite3.Connection) -> Dict[str, ChangeKey]:
+    """Return {source_file: change key} for every quarantined file."""
+    rows = conn.execute(
+        "SELECT source_file, source_mtime, source_size, source_crc FROM quarantine"
+    )
+    return {source_file: (mtime, size, crc) for source_file, mtime, size, crc in rows}
+
+
+def list_quarantine(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Every quarantine entry, most recent failure first."""
+    cursor = conn.execute("SELECT * FROM quarantine ORDER BY last_failed_at DESC, source_file")
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def quarantine_files(conn: sqlite3.Connection, failures: Iterable[Dict[str, Any]]) -> int:
+    """
+    Record parse failures in one transaction.
+
+    Each failure needs source_file, source_mtime, source_size, error_class
+    and error_message, and may have a source_crc.
+    """
+    failed_at = datetime.now().isoformat(timespec="seconds")
+    params = [{"source_crc": None, **failure, "failed_at": failed_at} for failure in failures]
+    if params:
+        conn.executemany(QUARANTINE_UPSERT_SQL, params)
+        conn.commit()
+    return len(params)
+
+
+def release_quarantine(conn: sqlite3.Connection, source_files: Optional[Iterable[str]] = None) -> int:
+    """Forget quarantine entries for `source_files` (all of them when None)."""
+    if source_files is None:
+        released = conn.execute("DELETE FROM quarantine").rowcount
+    else:
+        released = conn.executemany(
+            "DELETE FROM quarantine WHERE source_file = ?",
+            [(path,) for path in source_files],
+        ).rowcount
+    conn.commit()
+    return released
+
+
+def fetch_activity_keys(conn: sqlite3.Connection) -> Dict[str, str]:
+    """Return {activity_key: source_file} for every keyed workout."""
+    rows = conn.execute(
+        "SELECT activity_key, source_file FROM workouts WHERE activity_key IS NOT NULL"
+    )
+    return dict(rows.fetchall())
+
+
+def fetch_duplicate_files(
+    conn: sqlite3.Connection,
+) -> Dict[str, Tuple[float, int, Optional[int], str]]:
+    """
+    Return {source_file: (source_mtime, source_size, source_crc, activity_key)}
+    for known duplicates.
+    """
+    rows = conn.execute(
+        "SELECT source_file, source_mtime, source_size, source_crc, activity_key "
+        "FROM duplicate_files"
+    )
+    return {source_file: (mtime, size, crc, key) for source_file, mtime, size, crc, key in rows}
+
+
+def record_duplicate_files(conn: sqlite3.Connection, duplicates: Iterable[Dict[str, Any]]) -> int:
+    """
+    Remember files skipped as duplicates, in one transaction.
+
+    Each entry needs source_file, source_mtime, source_size, activity_key
+    and duplicate_of (the source_file of the workout that was kept), and
+    may have a source_crc.
+    """
+    params = [{"source_crc": None, **duplicate} for duplicate in duplicates]
+    if params:
+        conn.executemany(DUPLICATE_UPSERT_SQL, params)
+        conn.commit()
+    return len(params)
+
+
+def forget_duplicate_files(conn: sqlite3.Connection, source_files: Iterable[str]) -> int:
+    removed = conn.executemany(
+        "DELETE FROM duplicate_files WHERE source_file = ?",
+        [(path,) for path in source_files],
+    ).rowcount
+    conn.commit()
+    return removed
+
+
+def record_ingest_run(
+    conn: sqlite3.Connection, profile: RunProfile, keep: int = INGEST_RUNS_KEPT
+) -> int:
+    """
+    Save a finished RunProfile and return its ingest_runs id.
+
+    Runs older than the last `keep` are deleted with their file timings.
+    data_version is not bumped: timings do not change any dashboard data.
+    """
+    summary = profile.summary()
+    run_id = conn.execute(
+        """
+        INSERT INTO ingest_runs (
+            kind, started_at, total_seconds, files_parsed, files_failed,
+            bytes_parsed, parse_seconds, stages
+        )
+        VALUES (
+            :kind, :started_at, :total_seconds, :files_parsed, :files_failed,
+            :bytes_parsed, :parse_seconds, :stages
+        )
+        """,
+        {**summary, "stages": json.dumps(summary["stages"])},
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO ingest_run_files (run_id, source_file, parse_seconds, size_bytes, ok) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(run_id, path, seconds, size, int(ok)) for path, seconds, size, ok in profile.files],
+    )
+    oldest_kept = run_id - keep + 1
+    conn.execute("DELETE FROM ingest_run_files WHERE run_id < ?", (oldest_kept,))
+    conn.execute("DELETE FROM ingest_runs WHERE id < ?", (oldest_kept,))
     conn.commit()
-    return len(rows)
+    return run_id
+
+
+def list_ingest_runs(conn: sqlite3.Connection, limit: int = 10) -> List[Dict[str, Any]]:
+    """The most recent ingest_runs rows, newest first, with stages decoded."""
+    cursor = conn.execute("SELECT * FROM ingest_runs ORDER BY id DESC LIMIT ?", (limit,))
+    names = [column[0] for column in cursor.description]
+    runs = [dict(zip(names, row)) for row in cursor]
+    for run in runs:
+        run["stages"] = json.loads(run["stages"])
+    return runs
+
+
+def slowest_run_files(
+    conn: sqlite3.Connection, run_id: int, limit: int = 10
+) -> List[Dict[str, Any]]:
+    """The slowest files to parse in one run, slowest first."""
+    cursor = conn.execute(
+        "SELECT source_file, parse_seconds, size_bytes, ok FROM ingest_run_files "
+        "WHERE run_id = ? ORDER BY parse_seconds DESC LIMIT ?",
+        (run_id, limit),
+    )
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
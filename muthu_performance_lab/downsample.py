@@ -0,0 +1,104 @@
+"""
+Shape-preserving downsampling for the dashboard charts.
+
+Line and bar series use Largest-Triangle-Three-Buckets (LTTB): the series is
+cut into equal buckets and each bucket keeps the point that forms the
+largest triangle with the previous pick and the next bucket's average, so
+peaks and dips survive. The pace/HR scatter is binned instead: runs are
+grouped into a grid and each non-empty cell becomes one point at the mean
+of its runs, carrying how many runs it stands for.
+
+Series at or under their budget are returned untouched, and the charts'
+raw data (the run table, the chunk files) is never thinned.
+"""
+from __future__ import annotations
+
+import math
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, budget: int) -> np.ndarray:
+    """
+    Positions of the points LTTB keeps, in order; always the first and last.
+
+    A budget of 2 or less keeps every point. NaN values in `y` are treated
+    as 0 when choosing points.
+    """
+    n = len(y)
+    if budget <= 2 or n <= budget:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.nan_to_num(np.asarray(y, dtype="float64"))
+    # budget - 2 buckets between the fixed first and last points. The extra
+    # edge at n makes the last point the "next bucket" of the final bucket.
+    edges = np.append(np.linspace(1, n - 1, budget - 1).astype(np.int64), n)
+
+    picked = np.empty(budget, dtype=np.int64)
+    picked[0] = 0
+    previous = 0
+    for bucket in range(budget - 2):
+        lo, hi, next_hi = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        next_x = x[hi:next_hi].mean()
+        next_y = y[hi:next_hi].mean()
+        # Twice the triangle area; the constant factor does not change argmax.
+        area = np.abs(
+            (x[previous] - next_x) * (y[lo:hi] - y[previous])
+            - (x[previous] - x[lo:hi]) * (next_y - y[previous])
+        )
+        previous = lo + int(area.argmax())
+        picked[bucket + 1] = previous
+    picked[-1] = n - 1
+    return picked
+
+
+def lttb_union(x: np.ndarray, columns: List[np.ndarray], budget: int) -> np.ndarray:
+    """LTTB over several lines that share an x axis, splitting the budget between them."""
+    if budget <= 2 or len(x) <= budget:
+        return np.arange(len(x))
+    share = max(budget // len(columns), 3)
+    return np.unique(np.concatenate([lttb_indices(x, y, share) for y in columns]))
+
+
+def date_positions(dates: pd.Series) -> np.ndarray:
+    """Dates as float day numbers, so LTTB measures shapes in time."""
+    return dates.to_numpy(dtype="datetime64[D]").astype("float64")
+
+
+def needs_binning(point_count: int, budget: int) -> bool:
+    return 0 < budget < point_count
+
+
+def density_bins(x: np.ndarray, y: np.ndarray, budget: int) -> pd.DataFrame:
+    """
+    Bin (x, y) points into at most `budget` cells.
+
+    Returns one row per non-empty cell with the mean x, the mean y and the
+    number of points ("count"), ordered by cell.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # The same number of cells along both axes.
+    side = max(int(math.sqrt(budget)), 1)
+    x_cells = _cell_numbers(x, side)
+    y_cells = _cell_numbers(y, side)
+    _, inverse, counts = np.unique(
+        x_cells * side + y_cells, return_inverse=True, return_counts=True
+    )
+    return pd.DataFrame(
+        {
+            "x": np.bincount(inverse, weights=x) / counts,
+            "y": np.bincount(inverse, weights=y) / counts,
+            "count": counts,
+        }
+    )
+
+
+def _cell_numbers(values: np.ndarray, cells: int) -> np.ndarray:
+    low, high = values.min(), values.max()
+    if high == low:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - low) / (high - low) * cells).astype(np.int64), cells - 1)
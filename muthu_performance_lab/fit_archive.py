@@ -0,0 +1,147 @@
+"""
+FIT files read straight out of a ZIP archive, without extracting them.
+
+A Garmin export can be ingested as the .zip it arrived in: every .fit
+member under an Activity/ folder of the archive (every .fit member, if it
+has no Activity/ folder) becomes an ArchiveMember, which the ingest
+pipeline handles like a Path. Its source_file is the archive path followed
+by the member name, e.g. ".../garmin.zip/GARMIN/Activity/A1B2.fit".
+
+Change detection uses what the archive's central directory already holds:
+the member's date, size and CRC-32. Re-running on the same (or a newer)
+export skips unchanged members without decompressing them.
+
+Members are decompressed into memory one at a time, so nothing is written
+to disk. Each process opens an archive once and keeps it open; parser
+processes read their members from their own handle.
+"""
+from __future__ import annotations
+
+import calendar
+import os
+import threading
+import zipfile
+from pathlib import Path
+from typing import IO, Dict, List, NamedTuple, Optional, Tuple, Union
+
+ARCHIVE_SUFFIX = ".zip"
+ACTIVITY_FOLDER = "activity"
+# Finder adds "__MACOSX/.../._name.fit" resource forks to the ZIPs it makes.
+SKIPPED_PREFIX = "__MACOSX/"
+
+# archive path -> ((process id, mtime_ns, size) it was opened at, open ZipFile)
+_open_archives: Dict[str, Tuple[Tuple[int, int, int], zipfile.ZipFile]] = {}
+_open_lock = threading.Lock()
+
+
+class ArchiveMember(NamedTuple):
+    """One FIT file inside a ZIP archive; reads it from the archive on demand."""
+
+    archive: str  # resolved path of the .zip
+    name: str  # member name inside the archive
+    mtime: float  # member date as a timestamp, read as UTC
+    size: int  # uncompressed size
+    crc: int
+
+    def __str__(self) -> str:
+        return self.archive + os.sep + self.name.replace("/", os.sep)
+
+    def resolve(self) -> ArchiveMember:
+        return self
+
+    def exists(self) -> bool:
+        try:
+            open_archive(self.archive).getinfo(self.name)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return False
+        return True
+
+    def read_bytes(self) -> bytes:
+        return open_archive(self.archive).read(self.name)
+
+    def open(self, mode: str = "rb") -> IO[bytes]:
+        return open_archive(self.archive).open(self.name)
+
+
+# What the ingest pipeline accepts as a FIT file.
+FitSource = Union[Path, ArchiveMember]
+
+
+def is_archive(path: Path) -> bool:
+    return path.suffix.lower() == ARCHIVE_SUFFIX and path.is_file()
+
+
+def open_archive(archive: str) -> zipfile.ZipFile:
+    """
+    The open ZipFile for `archive`, opened once per process.
+
+    Reopened when the file on disk changes, so long-running processes (the
+    watcher, Streamlit) never read members from an outdated directory, and
+    in forked parser processes, which must not share the parent's file
+    position.
+    """
+    stat = os.stat(archive)
+    key = (os.getpid(), stat.st_mtime_ns, stat.st_size)
+    with _open_lock:
+        cached = _open_archives.get(archive)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if cached is not None and cached[0][0] == key[0]:
+            cached[1].close()
+        zip_file = zipfile.ZipFile(archive)
+        _open_archives[archive] = (key, zip_file)
+        return zip_file
+
+
+def _is_fit_member(info: zipfile.ZipInfo) -> bool:
+    return (
+        not info.is_dir()
+        and info.filename.lower().endswith(".fit")
+        and not info.filename.startswith(SKIPPED_PREFIX)
+    )
+
+
+def _member(archive: str, info: zipfile.ZipInfo) -> ArchiveMember:
+    # ZIP dates carry no time zone; read as UTC, the same member gets the
+    # same mtime on every machine and across DST changes.
+    mtime = calendar.timegm(info.date_time + (0, 0, 0))
+    return ArchiveMember(archive, info.filename, float(mtime), info.file_size, info.CRC)
+
+
+def find_archive_members(archive_path: Path) -> List[ArchiveMember]:
+    """The FIT members to ingest from a ZIP archive, sorted by name."""
+    archive = str(archive_path.resolve())
+    infos = [info for info in open_archive(archive).infolist() if _is_fit_member(info)]
+    in_activity = [
+        info
+        for info in infos
+        if ACTIVITY_FOLDER in (part.lower() for part in info.filename.split("/")[:-1])
+    ]
+    return sorted(
+        (_member(archive, info) for info in in_activity or infos), key=lambda member: member.name
+    )
+
+
+def source_crc(fit_path: FitSource) -> Optional[int]:
+    """The CRC-32 that is part of an archive member's change key; None for plain files."""
+    return fit_path.crc if isinstance(fit_path, ArchiveMember) else None
+
+
+def source_from_file(source_file: str) -> FitSource:
+    """
+    A stored source_file back as a Path or ArchiveMember.
+
+    A path that runs through an existing .zip file is a member of it.
+    Members that are no longer in the archive come back as a Path that
+    does not exist.
+    """
+    path = Path(source_file)
+    for archive in path.parents:
+        if archive.suffix.lower() == ARCHIVE_SUFFIX and archive.is_file():
+            name = path.relative_to(archive).as_posix()
+            try:
+                info = open_archive(str(archive)).getinfo(name)
+            except (OSError, KeyError, zipfile.BadZipFile):
+                return path
+            return _member(str(archive), info)
+    return path
@@ -1,108 +1,332 @@
 from __future__ import annotations
 
-from datetime import datetime
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
-from fitparse import FitFile
+from muthu_performance_lab.best_efforts import best_efforts
+from muthu_performance_lab.fit_archive import (
+    FitSource,
+    find_archive_members,
+    is_archive,
+    source_crc,
+)
+from muthu_performance_lab.fit_reader import FitReaderError, read_fit_activity, read_fit_summary
+from muthu_performance_lab.profiling import RunProfile, stage
+from muthu_performance_lab.session_fields import (
+    derive_columns,
+    derive_lap_columns,
+    encode_session_fields,
+)
+from muthu_performance_lab.streams import build_record_columns, stream_file_name, write_stream
 
+# Files handed to each worker task. Large enough to amortize the inter-process
+# round trip, small enough that results stream back steadily.
+DEFAULT_CHUNK_SIZE = 16
+
+# Error log lines are buffered and appended this many at a time.
+ERROR_LOG_FLUSH_EVERY = 200
+
+# (fit_path, row or None, failure or None, parse seconds). A failure holds
+# source_file, source_mtime, source_size, source_crc, error_class and
+# error_message, ready for the quarantine table.
+ParseResult = Tuple[FitSource, Optional[Dict[str, Any]], Optional[Dict[str, Any]], float]
 
-def _safe_float(value: Any) -> Optional[float]:
-    if value is None:
-        return None
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
 
+def _read_summary_fitparse(data: bytes) -> Dict[str, Any]:
+    # Imported here: most files never need fitparse, and loading it is a
+    # noticeable part of the startup time of every command.
+    from fitparse import FitFile
 
-def _get_field(session_data: Dict[str, Any], keys: List[str]) -> Any:
-    for key in keys:
-        if key in session_data and session_data[key] is not None:
-            return session_data[key]
-    return None
+    # From memory, so members of a ZIP archive work the same as files.
+    fit_file = FitFile(data)
+    laps: List[Dict[str, Any]] = []
 
+    # Laps come before the session, so stopping at the session keeps them all.
+    for msg in fit_file.get_messages(["lap", "session"]):
+        fields = {field.name: field.value for field in msg}
+        if msg.name == "session":
+            return {"session": fields, "laps": laps}
+        laps.append(fields)
 
-def _extract_session_data(fit_path: Path) -> Dict[str, Any]:
-    fit_file = FitFile(str(fit_path))
-    session_message = None
+    raise ValueError("No session record found in FIT file")
 
-    for msg in fit_file.get_messages("session"):
-        session_message = msg
-        break
 
-    if session_message is None:
+def _read_summary(fit_path: FitSource, data: Optional[bytes] = None) -> Dict[str, Any]:
+    """fit_reader.read_fit_summary, falling back to fitparse; requires a session."""
+    if data is None:
+        data = fit_path.read_bytes()
+    # The fast reader skips record messages entirely; fitparse is only used
+    # for files that rely on FIT features the fast reader does not support.
+    try:
+        summary = read_fit_summary(data)
+    except FitReaderError:
+        return _read_summary_fitparse(data)
+
+    if "session" not in summary:
         raise ValueError("No session record found in FIT file")
+    return summary
 
-    session_data: Dict[str, Any] = {}
-    for field in session_message:
-        session_data[field.name] = field.value
 
-    start_time = _get_field(session_data, ["start_time", "timestamp"])
-    if isinstance(start_time, datetime):
-        workout_date = start_time.date().isoformat()
-    else:
-        workout_date = None
+def _extract_session_data(fit_path: FitSource) -> Dict[str, Any]:
+    return _session_row(_read_summary(fit_path))
 
-    distance_m = _safe_float(_get_field(session_data, ["total_distance"]))
-    distance_km = (distance_m / 1000.0) if distance_m is not None else None
 
-    duration_sec = _safe_float(_get_field(session_data, ["total_timer_time", "total_elapsed_time"]))
-    duration_min = (duration_sec / 60.0) if duration_sec is not None else None
+def _extract_workout(fit_path: FitSource, streams_dir: Optional[Path]) -> Dict[str, Any]:
+    """
+    Session row and laps for one file; with a streams_dir, also store its
+    record stream and compute its best efforts from it.
 
-    avg_hr = _safe_float(_get_field(session_data, ["avg_heart_rate"]))
-    max_hr = _safe_float(_get_field(session_data, ["max_heart_rate"]))
+    Streams come from the fast reader only. Files that need the fitparse
+    fallback still get their session row and laps, just without a stream.
+    A file without a stream gets stream_file None, so the stream and best
+    efforts of an earlier version of the file are removed.
+    """
+    data = fit_path.read_bytes()
+    if streams_dir is None:
+        return _session_row(_read_summary(fit_path, data))
 
-    # Garmin devices can use different cadence field names depending on activity type.
-    avg_cadence = _safe_float(
-        _get_field(session_data, ["avg_running_cadence", "avg_cadence"])
-    )
+    try:
+        summary, records = read_fit_activity(data)
+    except FitReaderError:
+        summary, records = _read_summary_fitparse(data), []
+    if "session" not in summary:
+        raise ValueError("No session record found in FIT file")
+
+    row = _session_row(summary)
+    row["best_efforts"] = []
+    row["stream_file"] = None
+    stream_file = stream_file_name(str(fit_path.resolve()))
+    if not records:
+        (streams_dir / stream_file).unlink(missing_ok=True)
+        return row
+
+    columns = build_record_columns(records)
+    write_stream(streams_dir / stream_file, columns)
+    row["stream_file"] = stream_file
+    row["stream_samples"] = len(records)
+    row["stream_channels"] = ",".join(columns)
+    if "timestamp" in columns and "distance" in columns:
+        row["best_efforts"] = best_efforts(columns["timestamp"], columns["distance"])
+    return row
+
+
+def _session_row(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Derived workout columns, the encoded session fields they came from and the laps."""
+    session_data = summary["session"]
+    row = derive_columns(session_data)
+    row["session_fields"] = encode_session_fields(session_data)
+    row["laps"] = [derive_lap_columns(lap) for lap in summary.get("laps", [])]
+    return row
 
-    calories = _safe_float(_get_field(session_data, ["total_calories"]))
-    avg_temperature = _safe_float(_get_field(session_data, ["avg_temperature"]))
-
-    # Pace in minutes per kilometer.
-    avg_pace = None
-    if distance_km and duration_min and distance_km > 0:
-        avg_pace = duration_min / distance_km
-
-    sport = _get_field(session_data, ["sport"])
-    sub_sport = _get_field(session_data, ["sub_sport"])
-
-    return {
-        "workout_date": workout_date,
-        "sport": str(sport) if sport is not None else None,
-        "sub_sport": str(sub_sport) if sub_sport is not None else None,
-        "distance_km": distance_km,
-        "duration_min": duration_min,
-        "avg_hr": avg_hr,
-        "max_hr": max_hr,
-        "avg_cadence": avg_cadence,
-        "avg_pace_min_per_km": avg_pace,
-        "calories": calories,
-        "avg_temperature": avg_temperature,
-    }
-
-
-def ingest_activity_folder(activity_dir: Path, error_log_path: Path) -> List[Dict[str, Any]]:
+
+def find_fit_files(activity_dir: Path) -> List[Path]:
     if not activity_dir.exists() or not activity_dir.is_dir():
         raise FileNotFoundError(f"Activity folder not found: {activity_dir}")
 
-    rows: List[Dict[str, Any]] = []
-    fit_files = sorted(
+    return sorted(
         [p for p in activity_dir.rglob("*") if p.suffix.lower() == ".fit"]
     )
 
-    error_log_path.parent.mkdir(parents=True, exist_ok=True)
+
+def find_fit_sources(garmin_root: Path) -> Tuple[List[FitSource], Path]:
+    """
+    The FIT files of a GARMIN folder (under its Activity folder) or of a
+    ZIP archive (see fit_archive.find_archive_members), and the folder or
+    archive they were found in.
+    """
+    if is_archive(garmin_root):
+        return find_archive_members(garmin_root), garmin_root
+    activity_dir = garmin_root / "Activity"
+    return find_fit_files(activity_dir), activity_dir
+
+
+def split_changed_files(
+    fit_files: Iterable[FitSource],
+    known_files: Dict[str, Tuple[float, Optional[int], Optional[int]]],
+) -> Tuple[List[Tuple[FitSource, float, int]], List[str]]:
+    """
+    Compare files on disk with what the database already holds.
+
+    Returns (changed, unchanged): changed entries carry the stat result so the
+    parse step does not need to stat again; unchanged entries are resolved paths.
+    Archive members are compared by the date, size and CRC-32 from the
+    archive's directory, without reading them.
+    """
+    changed: List[Tuple[FitSource, float, int]] = []
+    unchanged: List[str] = []
 
     for fit_path in fit_files:
-        try:
-            extracted = _extract_session_data(fit_path)
-            extracted["source_file"] = str(fit_path.resolve())
-            extracted["source_mtime"] = fit_path.stat().st_mtime
-            rows.append(extracted)
-        except Exception as exc:  # noqa: BLE001 - keep ingest resilient for beginners
-            with error_log_path.open("a", encoding="utf-8") as f:
-                f.write(f"{fit_path}: {exc}\n")
-
-    return rows
+        if isinstance(fit_path, Path):
+            stat = fit_path.stat()
+            mtime, size = stat.st_mtime, stat.st_size
+        else:
+            mtime, size = fit_path.mtime, fit_path.size
+        source_file = str(fit_path.resolve())
+        if known_files.get(source_file) == (mtime, size, source_crc(fit_path)):
+            unchanged.append(source_file)
+        else:
+            changed.append((fit_path, mtime, size))
+
+    return changed, unchanged
+
+
+def default_worker_count() -> int:
+    return os.cpu_count() or 1
+
+
+def _parse_one(
+    fit_path: FitSource, mtime: float, size: int, streams_dir: Optional[Path] = None
+) -> ParseResult:
+    started = time.perf_counter()
+    try:
+        extracted = _extract_workout(fit_path, streams_dir)
+    except Exception as exc:  # noqa: BLE001 - keep ingest resilient for beginners
+        return fit_path, None, {
+            "source_file": str(fit_path.resolve()),
+            "source_mtime": mtime,
+            "source_size": size,
+            "source_crc": source_crc(fit_path),
+            "error_class": type(exc).__name__,
+            "error_message": str(exc),
+        }, time.perf_counter() - started
+
+    extracted["source_file"] = str(fit_path.resolve())
+    extracted["source_mtime"] = mtime
+    extracted["source_size"] = size
+    extracted["source_crc"] = source_crc(fit_path)
+    return fit_path, extracted, None, time.perf_counter() - started
+
+
+def _parse_chunk(
+    chunk: List[Tuple[FitSource, float, int]], streams_dir: Optional[Path] = None
+) -> List[ParseResult]:
+    # Runs inside a worker process, so it must stay a module-level function.
+    return [_parse_one(fit_path, mtime, size, streams_dir) for fit_path, mtime, size in chunk]
+
+
+def iter_parsed_files(
+    files: Iterable[Tuple[FitSource, float, int]],
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    streams_dir: Optional[Path] = None,
+) -> Iterator[ParseResult]:
+    """
+    Parse FIT files and yield one result per file as soon as it is ready.
+
+    With workers > 1 the files are split into chunks and spread across a
+    process pool; results come back in completion order, not input order.
+    Only a couple of chunks per worker are in flight at once, so results do
+    not pile up when the consumer is slower than the parsers.
+
+    With a streams_dir, each worker also writes the per-second record stream
+    of the files it parses. Members of a ZIP archive are sent to the workers
+    by name; each worker reads them from its own handle on the archive.
+    """
+    file_iter = iter(files)
+    if workers <= 1:
+        for fit_path, mtime, size in file_iter:
+            yield _parse_one(fit_path, mtime, size, streams_dir)
+        return
+
+    chunks = iter(lambda: list(islice(file_iter, chunk_size)), [])
+    first_chunks = list(islice(chunks, 2))
+    if len(first_chunks) < 2:
+        # A single chunk is not worth starting a pool for.
+        yield from _parse_chunk(first_chunks[0] if first_chunks else [], streams_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {
+            executor.submit(_parse_chunk, chunk, streams_dir)
+            for chunk in first_chunks + list(islice(chunks, workers * 2 - 2))
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for chunk in islice(chunks, 1):
+                    pending.add(executor.submit(_parse_chunk, chunk, streams_dir))
+                yield from future.result()
+
+
+def _append_error_log(error_log_path: Path, lines: List[str]) -> None:
+    if lines:
+        with error_log_path.open("a", encoding="utf-8") as f:
+            f.writelines(lines)
+        lines.clear()
+
+
+def iter_fit_rows(
+    files: Iterable[Tuple[FitSource, float, int]],
+    error_log_path: Path,
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_file: Optional[Callable[[FitSource, bool], None]] = None,
+    streams_dir: Optional[Path] = None,
+    on_failure: Optional[Callable[[Dict[str, Any]], None]] = None,
+    profile: Optional[RunProfile] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield workout rows for the files that parse; failures go to the error log.
+
+    `on_file(fit_path, ok)` is called for every file, parsed or not, and
+    `on_failure(failure)` for every file that failed. With a profile, each
+    file's parse time and size are added to it. Error log lines are
+    written in batches, and whatever is left when the iteration stops.
+    """
+    error_log_path.parent.mkdir(parents=True, exist_ok=True)
+    log_lines: List[str] = []
+
+    try:
+        for fit_path, extracted, failure, seconds in iter_parsed_files(
+            files, workers, chunk_size, streams_dir
+        ):
+            if on_file is not None:
+                on_file(fit_path, extracted is not None)
+            if profile is not None:
+                entry = extracted if extracted is not None else failure
+                profile.add_file(
+                    entry["source_file"], seconds, entry["source_size"], extracted is not None
+                )
+            if extracted is None:
+                log_lines.append(
+                    f"{fit_path}: {failure['error_class']}: {failure['error_message']}\n"
+                )
+                if len(log_lines) >= ERROR_LOG_FLUSH_EVERY:
+                    _append_error_log(error_log_path, log_lines)
+                if on_failure is not None:
+                    on_failure(failure)
+                continue
+            yield extracted
+    finally:
+        _append_error_log(error_log_path, log_lines)
+
+
+def parse_fit_files(
+    files: Iterable[Tuple[FitSource, float, int]],
+    error_log_path: Path,
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[Dict[str, Any]]:
+    return list(iter_fit_rows(files, error_log_path, workers, chunk_size))
+
+
+def ingest_activity_folder(
+    activity_dir: Path,
+    error_log_path: Path,
+    workers: int = 1,
+    profile: Optional[RunProfile] = None,
+) -> List[Dict[str, Any]]:
+    """Parse every FIT file of an Activity folder, or of a ZIP archive."""
+    with stage(profile, "discover"):
+        if is_archive(activity_dir):
+            fit_files: List[FitSource] = find_archive_members(activity_dir)
+        else:
+            fit_files = find_fit_files(activity_dir)
+    with stage(profile, "stat"):
+        changed, _ = split_changed_files(fit_files, {})
+    with stage(profile, "parse"):
+        return list(iter_fit_rows(changed, error_log_path, workers=workers, profile=profile))
@@ -0,0 +1,473 @@
+"""
+Minimal FIT binary reader for the handful of messages the lab needs.
+
+fitparse decodes every message in a file, including the one-per-second
+`record` messages, before it hands back the session summary. This reader walks
+the same binary layout but only decodes the messages it is asked for; every
+other data message is skipped by its defined length.
+
+Anything it does not understand raises FitReaderError so callers can fall
+back to fitparse. CRCs are not verified (the data section length is).
+"""
+from __future__ import annotations
+
+import hashlib
+import struct
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# FIT timestamps count seconds from 1989-12-31 00:00 UTC.
+FIT_EPOCH = datetime(1989, 12, 31)
+# Smaller date_time values are seconds since device power-on, not real dates.
+MIN_DATE_TIME = 0x10000000
+
+MESG_FILE_ID = 0
+MESG_SESSION = 18
+MESG_LAP = 19
+MESG_RECORD = 20
+
+# Bytes read from the start of a file to find its file_id message, which
+# devices write first.
+FILE_ID_PROBE_BYTES = 4096
+
+# base type number -> (struct code, size, invalid raw value)
+_BASE_TYPES: Dict[int, Tuple[str, int, Any]] = {
+    0: ("B", 1, 0xFF),  # enum
+    1: ("b", 1, 0x7F),  # sint8
+    2: ("B", 1, 0xFF),  # uint8
+    3: ("h", 2, 0x7FFF),  # sint16
+    4: ("H", 2, 0xFFFF),  # uint16
+    5: ("i", 4, 0x7FFFFFFF),  # sint32
+    6: ("I", 4, 0xFFFFFFFF),  # uint32
+    8: ("f", 4, None),  # float32, invalid is NaN
+    9: ("d", 8, None),  # float64, invalid is NaN
+    10: ("B", 1, 0),  # uint8z
+    11: ("H", 2, 0),  # uint16z
+    12: ("I", 4, 0),  # uint32z
+    14: ("q", 8, 0x7FFFFFFFFFFFFFFF),  # sint64
+    15: ("Q", 8, 0xFFFFFFFFFFFFFFFF),  # uint64
+    16: ("Q", 8, 0),  # uint64z
+}
+_STRING = 7
+_BYTE = 13
+
+SPORTS = {
+    0: "generic", 1: "running", 2: "cycling", 3: "transition", 4: "fitness_equipment",
+    5: "swimming", 6: "basketball", 7: "soccer", 8: "tennis", 9: "american_football",
+    10: "training", 11: "walking", 12: "cross_country_skiing", 13: "alpine_skiing",
+    14: "snowboarding", 15: "rowing", 16: "mountaineering", 17: "hiking", 18: "multisport",
+    19: "paddling", 20: "flying", 21: "e_biking", 22: "motorcycling", 23: "boating",
+    24: "driving", 25: "golf", 26: "hang_gliding", 27: "horseback_riding", 28: "hunting",
+    29: "fishing", 30: "inline_skating", 31: "rock_climbing", 32: "sailing",
+    33: "ice_skating", 34: "sky_diving", 35: "snowshoeing", 36: "snowmobiling",
+    37: "stand_up_paddleboarding", 38: "surfing", 39: "wakeboarding", 40: "water_skiing",
+    41: "kayaking", 42: "rafting", 43: "windsurfing", 44: "kitesurfing", 45: "tactical",
+    46: "jumpmaster", 47: "boxing", 48: "floor_climbing", 254: "all",
+}
+
+SUB_SPORTS = {
+    0: "generic", 1: "treadmill", 2: "street", 3: "trail", 4: "track", 5: "spin",
+    6: "indoor_cycling", 7: "road", 8: "mountain", 9: "downhill", 10: "recumbent",
+    11: "cyclocross", 12: "hand_cycling", 13: "track_cycling", 14: "indoor_rowing",
+    15: "elliptical", 16: "stair_climbing", 17: "lap_swimming", 18: "open_water",
+    19: "flexibility_training", 20: "strength_training", 21: "warm_up", 22: "match",
+    23: "exercise", 24: "challenge", 25: "indoor_skiing", 26: "cardio_training",
+    27: "indoor_walking", 28: "e_bike_fitness", 29: "bmx", 30: "casual_walking",
+    31: "speed_walking", 32: "bike_to_run_transition", 33: "run_to_bike_transition",
+    34: "swim_to_bike_transition", 35: "atv", 36: "motocross", 37: "backcountry",
+    38: "resort", 39: "rc_drone", 40: "wingsuit", 41: "whitewater", 42: "skate_skiing",
+    43: "yoga", 44: "pilates", 45: "indoor_running", 46: "gravel_cycling",
+    47: "e_bike_mountain", 48: "commuting", 49: "mixed_surface", 50: "navigate",
+    51: "track_me", 52: "map", 53: "single_gas_diving", 54: "multi_gas_diving",
+    55: "gauge_diving", 56: "apnea_diving", 57: "apnea_hunting", 58: "virtual_activity",
+    59: "obstacle", 254: "all",
+}
+
+FILE_TYPES = {
+    1: "device", 2: "settings", 3: "sport", 4: "activity", 5: "workout", 6: "course",
+    7: "schedules", 9: "weight", 10: "totals", 11: "goals", 14: "blood_pressure",
+    15: "monitoring_a", 20: "activity_summary", 28: "monitoring_daily", 32: "monitoring_b",
+    34: "segment", 35: "segment_list", 40: "exd_configuration",
+}
+
+_ENUMS = {"sport": SPORTS, "sub_sport": SUB_SPORTS, "file": FILE_TYPES}
+
+# field number -> (name, scale, offset, kind). kind is "date_time", an _ENUMS
+# key, or None for plain numbers. Names, scales and offsets follow the FIT
+# profile so results line up with fitparse. Fields missing here are kept
+# raw as "unknown_<number>".
+FieldSpec = Tuple[str, Optional[float], Optional[float], Optional[str]]
+
+MESSAGE_PROFILES: Dict[int, Tuple[str, Dict[int, FieldSpec]]] = {
+    MESG_FILE_ID: (
+        "file_id",
+        {
+            0: ("type", None, None, "file"),
+            1: ("manufacturer", None, None, None),
+            3: ("serial_number", None, None, None),
+            4: ("time_created", None, None, "date_time"),
+        },
+    ),
+    MESG_SESSION: (
+        "session",
+        {
+            2: ("start_time", None, None, "date_time"),
+            5: ("sport", None, None, "sport"),
+            6: ("sub_sport", None, None, "sub_sport"),
+            7: ("total_elapsed_time", 1000, None, None),
+            8: ("total_timer_time", 1000, None, None),
+            9: ("total_distance", 100, None, None),
+            10: ("total_cycles", None, None, None),
+            11: ("total_calories", None, None, None),
+            14: ("avg_speed", 1000, None, None),
+            15: ("max_speed", 1000, None, None),
+            16: ("avg_heart_rate", None, None, None),
+            17: ("max_heart_rate", None, None, None),
+            18: ("avg_cadence", None, None, None),
+            19: ("max_cadence", None, None, None),
+            20: ("avg_power", None, None, None),
+            21: ("max_power", None, None, None),
+            22: ("total_ascent", None, None, None),
+            23: ("total_descent", None, None, None),
+            24: ("total_training_effect", 10, None, None),
+            34: ("normalized_power", None, None, None),
+            49: ("avg_altitude", 5, 500, None),
+            50: ("max_altitude", 5, 500, None),
+            57: ("avg_temperature", None, None, None),
+            58: ("max_temperature", None, None, None),
+            71: ("min_altitude", 5, 500, None),
+            124: ("enhanced_avg_speed", 1000, None, None),
+            125: ("enhanced_max_speed", 1000, None, None),
+            126: ("enhanced_avg_altitude", 5, 500, None),
+            127: ("enhanced_min_altitude", 5, 500, None),
+            128: ("enhanced_max_altitude", 5, 500, None),
+            137: ("total_anaerobic_training_effect", 10, None, None),
+            253: ("timestamp", None, None, "date_time"),
+        },
+    ),
+    MESG_LAP: (
+        "lap",
+        {
+            2: ("start_time", None, None, "date_time"),
+            7: ("total_elapsed_time", 1000, None, None),
+            8: ("total_timer_time", 1000, None, None),
+            9: ("total_distance", 100, None, None),
+            11: ("total_calories", None, None, None),
+            13: ("avg_speed", 1000, None, None),
+            14: ("max_speed", 1000, None, None),
+            15: ("avg_heart_rate", None, None, None),
+            16: ("max_heart_rate", None, None, None),
+            17: ("avg_cadence", None, None, None),
+            21: ("total_ascent", None, None, None),
+            22: ("total_descent", None, None, None),
+            42: ("avg_altitude", 5, 500, None),
+            43: ("max_altitude", 5, 500, None),
+            62: ("min_altitude", 5, 500, None),
+            110: ("enhanced_avg_speed", 1000, None, None),
+            111: ("enhanced_max_speed", 1000, None, None),
+            112: ("enhanced_avg_altitude", 5, 500, None),
+            113: ("enhanced_min_altitude", 5, 500, None),
+            114: ("enhanced_max_altitude", 5, 500, None),
+            254: ("message_index", None, None, None),
+            253: ("timestamp", None, None, "date_time"),
+        },
+    ),
+}
+
+# 16-bit fields the FIT profile expands into their 32-bit enhanced_* field
+# (same scale and offset): field number -> enhanced field number. Like
+# fitparse, the expanded value is set where the 16-bit field appears, so an
+# enhanced field written later in the message wins over it.
+_ENHANCED_COMPONENTS: Dict[int, Dict[int, int]] = {
+    MESG_SESSION: {14: 124, 15: 125, 49: 126, 71: 127, 50: 128},
+    MESG_LAP: {13: 110, 14: 111, 42: 112, 62: 113, 43: 114},
+}
+
+# Session fields that the FIT profile renames when the activity is a run or
+# walk: field number -> (sport values, name used for those sports).
+_SESSION_SUBFIELDS = {
+    10: ({1, 11}, "total_strides"),
+    18: ({1}, "avg_running_cadence"),
+    19: ({1}, "max_running_cadence"),
+}
+
+
+class FitReaderError(ValueError):
+    """The file uses a FIT feature this reader does not handle."""
+
+
+# (unpacker, decode plan, {field number: (position in unpacked tuple, invalid value)})
+# The index only covers single-value numeric fields; it lets callers pull
+# columns straight out of the unpacked tuples without building dicts.
+MessageLayout = Tuple[struct.Struct, list, Dict[int, Tuple[int, Any]]]
+
+
+def _build_layout(endian: str, fields: List[Tuple[int, int, int]]) -> MessageLayout:
+    fmt = [endian]
+    plan = []
+    field_index: Dict[int, Tuple[int, Any]] = {}
+    position = 0
+    for num, size, base_type in fields:
+        type_num = base_type & 0x1F
+        if type_num in (_STRING, _BYTE):
+            fmt.append(f"{size}s")
+            plan.append((num, 1, type_num, None))
+            position += 1
+            continue
+        try:
+            code, type_size, invalid = _BASE_TYPES[type_num]
+        except KeyError:
+            raise FitReaderError(f"Unknown base type {base_type:#x}") from None
+        if size % type_size:
+            raise FitReaderError(f"Field {num} size {size} does not fit base type {base_type:#x}")
+        count = size // type_size
+        fmt.append(f"{count}{code}")
+        plan.append((num, count, type_num, invalid))
+        if count == 1:
+            field_index[num] = (position, invalid)
+        position += count
+    return struct.Struct("".join(fmt)), plan, field_index
+
+
+def _clean(value: Any, type_num: int, invalid: Any) -> Any:
+    if type_num == _STRING:
+        text = value.split(b"\0", 1)[0]
+        return text.decode("utf-8", errors="replace") if text else None
+    if type_num == _BYTE:
+        return None if all(b == 0xFF for b in value) else value
+    if invalid is None:
+        return None if value != value else value  # NaN check for floats
+    return None if value == invalid else value
+
+
+def _clean_values(plan: list, raw: tuple) -> Dict[int, Any]:
+    values: Dict[int, Any] = {}
+    i = 0
+    for num, count, type_num, invalid in plan:
+        if count == 1:
+            values[num] = _clean(raw[i], type_num, invalid)
+        else:
+            items = tuple(_clean(v, type_num, invalid) for v in raw[i : i + count])
+            values[num] = None if all(v is None for v in items) else items
+        i += count
+    return values
+
+
+def _check_definition(definition_end: int, end: int) -> None:
+    # Truncated or malformed files must fail as FitReaderError (which falls
+    # back to fitparse), not as IndexError or struct.error.
+    if definition_end > end:
+        raise FitReaderError("FIT definition runs past the data section")
+
+
+def iter_fit_data(
+    data: bytes, global_nums: Iterable[int], partial: bool = False
+) -> Iterator[Tuple[int, MessageLayout, tuple]]:
+    """
+    Yield (global message number, layout, unpacked values) for every data
+    message whose global number is in `global_nums`. Other data messages are
+    skipped without decoding. Values are raw: unscaled, invalid markers kept.
+
+    With partial=True, `data` may be just the start of a file: messages are
+    yielded until the bytes run out.
+    """
+    wanted = set(global_nums)
+    file_end = len(data)
+    segment = 0
+
+    # A .fit file may hold several FIT segments back to back ("chained" files).
+    while segment < file_end:
+        if file_end - segment < 12:
+            raise FitReaderError("File too small to be a FIT file")
+        header_size = data[segment]
+        if header_size < 12 or data[segment + 8 : segment + 12] != b".FIT":
+            raise FitReaderError("Invalid FIT file header")
+        (data_size,) = struct.unpack_from("<I", data, segment + 4)
+        pos = segment + header_size
+        end = pos + data_size
+        if end + 2 > file_end:
+            if not partial:
+                raise FitReaderError("FIT data section is truncated")
+            end = file_end
+
+        # local message type -> (global number, message size, layout or None)
+        definitions: Dict[int, list] = {}
+        while pos < end:
+            header = data[pos]
+            pos += 1
+
+            if header & 0x80:
+                # Compressed timestamp header: a data message for local types 0-3.
+                local = (header >> 5) & 0x03
+            elif header & 0x40:
+                local = header & 0x0F
+                _check_definition(pos + 5, end)
+                endian = ">" if data[pos + 1] == 1 else "<"
+                (global_num,) = struct.unpack_from(endian + "H", data, pos + 2)
+                field_count = data[pos + 4]
+                pos += 5
+                _check_definition(pos + field_count * 3 + (1 if header & 0x20 else 0), end)
+                fields = [
+                    (data[p], data[p + 1], data[p + 2])
+                    for p in range(pos, pos + field_count * 3, 3)
+                ]
+                pos += field_count * 3
+                size = sum(f[1] for f in fields)
+                if header & 0x20:
+                    # Developer fields follow the regular ones; they count towards
+                    # the message size but are never decoded.
+                    dev_count = data[pos]
+                    pos += 1
+                    _check_definition(pos + dev_count * 3, end)
+                    size += sum(data[p + 1] for p in range(pos, pos + dev_count * 3, 3))
+                    pos += dev_count * 3
+                layout = _build_layout(endian, fields) if global_num in wanted else None
+                definitions[local] = (global_num, size, layout)
+                continue
+            else:
+                local = header & 0x0F
+
+            definition = definitions.get(local)
+            if definition is None:
+                raise FitReaderError(f"Data message for undefined local type {local}")
+            global_num, size, layout = definition
+            if layout is not None:
+                if header & 0x80:
+                    raise FitReaderError("Compressed timestamps are not supported")
+                if pos + size > end:
+                    raise FitReaderError("FIT message runs past the data section")
+                yield global_num, layout, layout[0].unpack_from(data, pos)
+            pos += size
+
+        if pos != end:
+            raise FitReaderError("FIT message runs past the data section")
+        segment = end + 2
+
+
+def iter_fit_messages(
+    data: bytes, global_nums: Iterable[int], partial: bool = False
+) -> Iterator[Tuple[int, Dict[int, Any]]]:
+    """
+    Yield (global message number, {field number: raw value}) for every data
+    message whose global number is in `global_nums`. Raw values are unscaled;
+    invalid values are None.
+    """
+    for global_num, layout, raw in iter_fit_data(data, global_nums, partial):
+        yield global_num, _clean_values(layout[1], raw)
+
+
+def _named_fields(global_num: int, raw: Dict[int, Any]) -> Dict[str, Any]:
+    _, profile = MESSAGE_PROFILES[global_num]
+    components = _ENHANCED_COMPONENTS.get(global_num, {})
+    named: Dict[str, Any] = {}
+    for num, value in raw.items():
+        spec = profile.get(num)
+        if spec is None:
+            named[f"unknown_{num}"] = value
+            continue
+        name, scale, offset, kind = spec
+        if value is not None and not isinstance(value, (tuple, bytes, str)):
+            if kind == "date_time":
+                if value >= MIN_DATE_TIME:
+                    value = FIT_EPOCH + timedelta(seconds=value)
+            elif kind is not None:
+                value = _ENUMS[kind].get(value, value)
+            else:
+                if scale:
+                    value = float(value) / scale
+                if offset:
+                    value = value - offset
+        if num in components:
+            named[profile[components[num]][0]] = value
+        named[name] = value
+
+    if global_num == MESG_SESSION:
+        sport = raw.get(5)
+        for num, (sports, alt_name) in _SESSION_SUBFIELDS.items():
+            name = profile[num][0]
+            if sport in sports and name in named:
+                named[alt_name] = named.pop(name)
+    return named
+
+
+def read_fit_summary(data: bytes) -> Dict[str, Any]:
+    """
+    Return {"file_id": {...}, "session": {...}, "laps": [...]} for the first
+    file_id and session messages in a FIT file, stopping as soon as the
+    session is read. Devices write laps before the session, so "laps" holds
+    every lap. Missing messages are absent from the result.
+    """
+    summary: Dict[str, Any] = {}
+    for global_num, raw in iter_fit_messages(data, MESSAGE_PROFILES):
+        _add_message(summary, global_num, raw)
+        if global_num == MESG_SESSION:
+            break
+    return summary
+
+
+def _add_message(summary: Dict[str, Any], global_num: int, raw: Dict[int, Any]) -> None:
+    if global_num == MESG_LAP:
+        summary.setdefault("laps", []).append(_named_fields(global_num, raw))
+        return
+    name = MESSAGE_PROFILES[global_num][0]
+    if name not in summary:
+        summary[name] = _named_fields(global_num, raw)
+
+
+def read_fit_activity(
+    data: bytes,
+) -> Tuple[Dict[str, Any], List[Tuple[MessageLayout, tuple]]]:
+    """
+    Walk the whole file once and return (summary, records).
+
+    `summary` matches read_fit_summary. `records` holds (layout, raw values)
+    for every record message, in file order, for column-wise conversion.
+    """
+    summary: Dict[str, Any] = {}
+    records: List[Tuple[MessageLayout, tuple]] = []
+    for global_num, layout, raw in iter_fit_data(data, [*MESSAGE_PROFILES, MESG_RECORD]):
+        if global_num == MESG_RECORD:
+            records.append((layout, raw))
+            continue
+        _add_message(summary, global_num, _clean_values(layout[1], raw))
+    return summary, records
+
+
+def read_fit_file_id(head: bytes) -> Dict[str, Any]:
+    """file_id fields of a FIT file; `head` may be just its first few KB."""
+    try:
+        for global_num, raw in iter_fit_messages(head, [MESG_FILE_ID], partial=True):
+            return _named_fields(global_num, raw)
+    except FitReaderError:
+        # A definition or message was cut off at the end of `head`.
+        raise FitReaderError("No file_id message at the start of the file") from None
+    raise FitReaderError("No file_id message at the start of the file")
+
+
+def activity_identity(fit_path: Path) -> str:
+    """
+    Key that is the same for every copy of one activity, whatever its path.
+
+    Uses the device serial number and creation time from the file_id
+    message, which only needs the first few KB of the file. Files without
+    both fall back to a SHA-256 of their bytes, read in blocks.
+    """
+    with fit_path.open("rb") as f:
+        head = f.read(FILE_ID_PROBE_BYTES)
+        try:
+            file_id = read_fit_file_id(head)
+        except FitReaderError:
+            file_id = {}
+        serial_number = file_id.get("serial_number")
+        time_created = file_id.get("time_created")
+        if serial_number is not None and time_created is not None:
+            if isinstance(time_created, datetime):
+                time_created = time_created.isoformat()
+            return f"fit:{serial_number}:{time_created}"
+
+        digest = hashlib.sha256(head)
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return f"sha256:{digest.hexdigest()}"
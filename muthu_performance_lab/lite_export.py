@@ -0,0 +1,397 @@
+"""
+PWA export without pandas or numpy, for `export_pwa_data.py --skip-refresh`.
+
+Importing pandas takes most of a cold start, which dominates a cron or
+launch-agent export that only re-reads SQLite. This module writes the same
+payload, manifest and chunk files as pwa_export.py (byte for byte, apart
+from "generated_at") with the standard library only. pwa_export.py stays
+the reference implementation, like metrics.py for queries.py. Both engines
+hand their builders to payload.build_payload / payload.export_chunks, so
+only the column, load-series and downsampling code differs.
+
+To match exactly, every numeric step repeats the libraries' arithmetic in
+the same order:
+- rounding to FLOAT_DECIMALS like numpy (scale, round half to even, unscale);
+- pandas' Kahan-compensated rolling sums and its adjust=False EWMA update;
+- numpy's pairwise summation for the LTTB bucket means, and its linspace.
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import struct
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, List, Mapping, Sequence, Tuple
+
+from muthu_performance_lab.config import ACUTE_DAYS, CHRONIC_DAYS, DB_PATH
+from muthu_performance_lab.payload import (
+    FLOAT_DECIMALS,
+    LOAD_CHART_COLUMNS,
+    Columns,
+    ExportEngine,
+    LoadRows,
+    build_payload,
+    dumps_payload,
+    export_chunks,
+    row_columns,
+    write_atomic,
+)
+from muthu_performance_lab.profiling import RunProfile, stage
+from muthu_performance_lab.queries import (
+    query_daily_run_distance_rows,
+    query_monthly_mileage_rows,
+    query_run_rows,
+)
+
+_SCALE = 10.0**FLOAT_DECIMALS
+# date(1970, 1, 1).toordinal(): numpy counts datetime64[D] days from 1970.
+_EPOCH_ORDINAL = 719163
+# numpy's pairwise summation sums blocks of up to 128 values with 8 accumulators.
+_PAIRWISE_BLOCK = 128
+
+
+# --- JSON values (payload.frame_columns) -------------------------------------
+
+
+def _round(value: float) -> float:
+    rounded = round(value * _SCALE) / _SCALE
+    # numpy keeps the sign of a value rounded to zero; it shows in chunk fingerprints.
+    return rounded if rounded else math.copysign(0.0, value)
+
+
+def _json_number(value: Any) -> Any:
+    if value is None:
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        return None
+    rounded = _round(number)
+    # Whole numbers (HR, calories, cadence) are written without a trailing ".0".
+    return int(rounded) if rounded == math.floor(rounded) else rounded
+
+
+def _json_column(name: str, values: Sequence[Any]) -> List[Any]:
+    if name in ("workout_date", "date", "month"):
+        return [value[:10] if value else None for value in values]
+    return [_json_number(value) for value in values]
+
+
+def _columns(columns: Columns, names: List[str]) -> Columns:
+    return {name: _json_column(name, columns[name]) for name in names}
+
+
+def _floats(values: Sequence[Any]) -> List[float]:
+    """Like to_numpy(dtype="float64") followed by nan_to_num: missing values become 0."""
+    return [0.0 if value is None else float(value) for value in values]
+
+
+# --- Training load (metrics.training_load_series) ---------------------------
+
+
+def _rolling_sum(values: List[float], window: int) -> List[float]:
+    """pandas Series.rolling(window, min_periods=1).sum() for values without NaN."""
+    out = []
+    total = add_comp = remove_comp = 0.0
+    count = same = 0
+    previous = values[0] if values else 0.0
+    for i, value in enumerate(values):
+        if i >= window:
+            leaving = values[i - window]
+            count -= 1
+            y = -leaving - remove_comp
+            t = total + y
+            remove_comp = t - total - y
+            total = t
+        count += 1
+        y = value - add_comp
+        t = total + y
+        add_comp = t - total - y
+        total = t
+        # pandas returns value * n for a run of equal values, avoiding float drift.
+        same = same + 1 if value == previous else 1
+        previous = value
+        out.append(previous * count if same >= count else total)
+    return out
+
+
+def _ewma(values: List[float], alpha: float) -> List[float]:
+    """pandas Series.ewm(alpha=alpha, adjust=False).mean() for values without NaN."""
+    # pandas turns alpha into a center of mass and back, so use its alpha.
+    alpha = 1.0 / (1.0 + (1.0 - alpha) / alpha)
+    old_weight = 1.0 - alpha
+    out = []
+    weighted = values[0]
+    for value in values:
+        if weighted != value:
+            weighted = (old_weight * weighted + alpha * value) / (old_weight + alpha)
+        out.append(weighted)
+    return out
+
+
+def _training_load(daily: List[Tuple[str, float]]) -> Columns:
+    """LOAD_CHART_COLUMNS for every day from the first to the last run (raw floats)."""
+    if not daily:
+        return {name: [] for name in LOAD_CHART_COLUMNS}
+    by_day = {day[:10]: float(km) for day, km in daily}
+    first = date.fromisoformat(daily[0][0][:10])
+    last = date.fromisoformat(daily[-1][0][:10])
+    days = [(first + timedelta(days=k)).isoformat() for k in range((last - first).days + 1)]
+    load = [by_day.get(day, 0.0) for day in days]
+
+    acute = _rolling_sum(load, ACUTE_DAYS)
+    chronic = _rolling_sum(load, CHRONIC_DAYS)
+    weeks = CHRONIC_DAYS / ACUTE_DAYS
+    ewma_acute = _ewma(load, 2 / (ACUTE_DAYS + 1))
+    ewma_chronic = _ewma(load, 2 / (CHRONIC_DAYS + 1))
+    return {
+        "date": days,
+        "acute_km": acute,
+        "chronic_km": chronic,
+        "load_ratio": [a / (c / weeks) if c > 0 else 0.0 for a, c in zip(acute, chronic)],
+        "ewma_load_ratio": [a / c if c > 0 else 0.0 for a, c in zip(ewma_acute, ewma_chronic)],
+    }
+
+
+# --- Downsampling (downsample.py) --------------------------------------------
+
+
+def _pairwise_sum(values: List[float], lo: int, n: int) -> float:
+    if n < 8:
+        total = 0.0
+        for i in range(lo, lo + n):
+            total += values[i]
+        return total
+    if n <= _PAIRWISE_BLOCK:
+        r = values[lo : lo + 8]
+        i = 8
+        while i < n - n % 8:
+            for j in range(8):
+                r[j] += values[lo + i + j]
+            i += 8
+        total = ((r[0] + r[1]) + (r[2] + r[3])) + ((r[4] + r[5]) + (r[6] + r[7]))
+        for k in range(lo + i, lo + n):
+            total += values[k]
+        return total
+    half = n // 2
+    half -= half % 8
+    return _pairwise_sum(values, lo, half) + _pairwise_sum(values, lo + half, n - half)
+
+
+def _mean(values: List[float], lo: int, hi: int) -> float:
+    return _pairwise_sum(values, lo, hi - lo) / (hi - lo)
+
+
+def _day_numbers(dates: Sequence[str]) -> List[float]:
+    return [float(date.fromisoformat(day[:10]).toordinal() - _EPOCH_ORDINAL) for day in dates]
+
+
+def _lttb_indices(x: List[float], y: List[float], budget: int) -> List[int]:
+    n = len(y)
+    if budget <= 2 or n <= budget:
+        return list(range(n))
+
+    step = (n - 2) / (budget - 2)
+    edges = [int(k * step + 1.0) for k in range(budget - 2)] + [n - 1, n]
+
+    picked = [0]
+    previous = 0
+    for bucket in range(budget - 2):
+        lo, hi, next_hi = edges[bucket], edges[bucket + 1], edges[bucket + 2]
+        next_x = _mean(x, hi, next_hi)
+        next_y = _mean(y, hi, next_hi)
+        x0, y0 = x[previous], y[previous]
+        best, best_area = lo, -1.0
+        for k in range(lo, hi):
+            area = abs((x0 - next_x) * (y[k] - y0) - (x0 - x[k]) * (next_y - y0))
+            if area > best_area:
+                best, best_area = k, area
+        previous = best
+        picked.append(best)
+    picked.append(n - 1)
+    return picked
+
+
+def _lttb_union(x: List[float], columns: List[List[float]], budget: int) -> List[int]:
+    if budget <= 2 or len(x) <= budget:
+        return list(range(len(x)))
+    share = max(budget // len(columns), 3)
+    return sorted({k for y in columns for k in _lttb_indices(x, y, share)})
+
+
+def _cell_numbers(values: List[float], cells: int) -> List[int]:
+    low, high = min(values), max(values)
+    if high == low:
+        return [0] * len(values)
+    return [min(int((value - low) / (high - low) * cells), cells - 1) for value in values]
+
+
+def _density_bins(x: List[float], y: List[float], budget: int) -> Columns:
+    side = max(int(math.sqrt(budget)), 1)
+    cells = [
+        cx * side + cy for cx, cy in zip(_cell_numbers(x, side), _cell_numbers(y, side))
+    ]
+    order = {cell: k for k, cell in enumerate(sorted(set(cells)))}
+    sum_x = [0.0] * len(order)
+    sum_y = [0.0] * len(order)
+    counts = [0] * len(order)
+    for cell, vx, vy in zip(cells, x, y):
+        k = order[cell]
+        sum_x[k] += vx
+        sum_y[k] += vy
+        counts[k] += 1
+    return {
+        "avg_hr": [s / c for s, c in zip(sum_x, counts)],
+        "avg_pace_min_per_km": [s / c for s, c in zip(sum_y, counts)],
+        "count": counts,
+    }
+
+
+def _sampled_rows(rows: List[int], picked: List[int]) -> dict[str, Any]:
+    spec: dict[str, Any] = {"rows": [rows[k] for k in picked], "length": len(rows)}
+    if rows and rows[-1] != len(rows) - 1:
+        spec["positions"] = picked
+    return spec
+
+
+def _row_indices(columns: Columns, required: List[str]) -> List[int]:
+    count = len(columns[required[0]])
+    return [i for i in range(count) if all(columns[name][i] is not None for name in required)]
+
+
+def _downsampled_series(
+    runs: Columns, load: Columns, budgets: Mapping[str, int]
+) -> dict[str, dict[str, Any]]:
+    """Same specs as pwa_export._downsampled_series."""
+    series: dict[str, dict[str, Any]] = {}
+    run_x = _day_numbers(runs["workout_date"])
+
+    all_rows = list(range(len(run_x)))
+    picked = _lttb_indices(run_x, _floats(runs["distance_km"]), budgets["distance_trend"])
+    if len(picked) < len(all_rows):
+        series["distance_trend"] = _sampled_rows(all_rows, picked)
+
+    cadence_rows = _row_indices(runs, ["avg_cadence"])
+    picked = _lttb_indices(
+        [run_x[i] for i in cadence_rows],
+        [float(runs["avg_cadence"][i]) for i in cadence_rows],
+        budgets["cadence_trend"],
+    )
+    if len(picked) < len(cadence_rows):
+        series["cadence_trend"] = _sampled_rows(cadence_rows, picked)
+
+    scatter_rows = _row_indices(runs, ["avg_hr", "avg_pace_min_per_km"])
+    budget = budgets["pace_vs_hr"]
+    if 0 < budget < len(scatter_rows):
+        bins = _density_bins(
+            [float(runs["avg_hr"][i]) for i in scatter_rows],
+            [float(runs["avg_pace_min_per_km"][i]) for i in scatter_rows],
+            budget,
+        )
+        series["pace_vs_hr"] = {
+            "columns": _columns(bins, ["avg_hr", "avg_pace_min_per_km", "count"]),
+            "binned": True,
+        }
+
+    load_rows = list(range(len(load["date"])))
+    picked = _lttb_union(
+        _day_numbers(load["date"]),
+        [load["load_ratio"], load["ewma_load_ratio"]],
+        budgets["training_load"],
+    )
+    if len(picked) < len(load_rows):
+        series["training_load"] = _sampled_rows(load_rows, picked)
+    return series
+
+
+# --- Engine (payload.build_payload / payload.export_chunks) -----------------
+
+
+def _runs(conn, columns: List[str], start: date | None = None, end: date | None = None) -> Columns:
+    return row_columns(query_run_rows(conn, columns, start=start, end=end), columns)
+
+
+def _run_count(runs: Columns) -> int:
+    return len(runs["workout_date"])
+
+
+def _monthly_columns(conn) -> Columns:
+    monthly = row_columns(query_monthly_mileage_rows(conn), ["month", "distance_km"])
+    return _columns(monthly, ["month", "distance_km"])
+
+
+def _load_columns(load: Columns, rows: LoadRows) -> Columns:
+    if rows is None:
+        kept = load
+    elif isinstance(rows, slice):
+        kept = {name: values[rows] for name, values in load.items()}
+    else:
+        kept = {name: [values[k] for k in rows] for name, values in load.items()}
+    return _columns(kept, LOAD_CHART_COLUMNS)
+
+
+def _load_fingerprint(load: Columns, lo: int, hi: int) -> str:
+    # Same bytes as numpy's tobytes() of the rounded (rows x columns) block.
+    values = [
+        _round(load[name][k]) for k in range(lo, hi) for name in LOAD_CHART_COLUMNS[1:]
+    ]
+    packed = struct.pack(f"={len(values)}d", *values)
+    return hashlib.sha1(packed).hexdigest()[:16]
+
+
+def _load_months(load: Columns) -> List[Tuple[str, int, int, str]]:
+    load_months = [day[:7] for day in load["date"]]
+    month_starts = [
+        k for k, month in enumerate(load_months) if k == 0 or month != load_months[k - 1]
+    ]
+    month_ends = [*month_starts[1:], len(load_months)]
+    return [
+        (load_months[lo], lo, hi, _load_fingerprint(load, lo, hi))
+        for lo, hi in zip(month_starts, month_ends)
+    ]
+
+
+_ENGINE = ExportEngine(
+    runs=_runs,
+    run_count=_run_count,
+    run_columns=_columns,
+    row_indices=_row_indices,
+    monthly_columns=_monthly_columns,
+    daily_distance=query_daily_run_distance_rows,
+    training_load=_training_load,
+    load_columns=_load_columns,
+    load_months=_load_months,
+    downsampled_series=_downsampled_series,
+)
+
+
+def build_dashboard_payload(
+    point_budget_overrides: Mapping[str, int] | None = None,
+    db_path: Path = DB_PATH,
+    profile: RunProfile | None = None,
+) -> dict[str, Any]:
+    """pwa_export.build_dashboard_payload without pandas; same payload and profile stages."""
+    return build_payload(_ENGINE, point_budget_overrides, db_path, profile)
+
+
+def export_pwa_json(
+    output_path: Path,
+    point_budget_overrides: Mapping[str, int] | None = None,
+    db_path: Path = DB_PATH,
+    profile: RunProfile | None = None,
+) -> dict[str, Any]:
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = build_dashboard_payload(point_budget_overrides, db_path, profile)
+    with stage(profile, "payload_write"):
+        write_atomic(output_path, dumps_payload(payload))
+    return payload
+
+
+def export_pwa_chunks(
+    output_dir: Path,
+    point_budget_overrides: Mapping[str, int] | None = None,
+    db_path: Path = DB_PATH,
+    profile: RunProfile | None = None,
+) -> dict[str, Any]:
+    """pwa_export.export_pwa_chunks without pandas; same manifest and chunk files."""
+    return export_chunks(_ENGINE, output_dir, point_budget_overrides, db_path, profile)
@@ -4,8 +4,18 @@ from datetime import date, timedelta
 
 import pandas as pd
 
+from muthu_performance_lab.config import ACUTE_DAYS, CHRONIC_DAYS, RUN_SPORTS
 
-RUN_SPORTS = {"running"}
+LOAD_SERIES_COLUMNS = [
+    "date",
+    "load_km",
+    "acute_km",
+    "chronic_km",
+    "load_ratio",
+    "ewma_acute_km",
+    "ewma_chronic_km",
+    "ewma_load_ratio",
+]
 
 
 def load_workouts_df(conn) -> pd.DataFrame:
@@ -90,3 +100,48 @@ def training_load_ratio(runs_df: pd.DataFrame) -> float:
         return 0.0
 
     return float(load_7 / chronic_weekly_avg)
+
+
+def daily_distance(runs_df: pd.DataFrame) -> pd.Series:
+    """Total run distance per calendar day (days without runs are absent)."""
+    if runs_df.empty:
+        return pd.Series(dtype="float64")
+    days = runs_df["workout_date"].dt.normalize()
+    return runs_df["distance_km"].fillna(0).groupby(days).sum()
+
+
+def training_load_series(daily_km: pd.Series) -> pd.DataFrame:
+    """
+    Acute:chronic load for every day from the first to the last run.
+
+    Rolling columns use the same windows as training_load_ratio (last 7 days
+    vs last 28 days / 4), so the final load_ratio equals that scalar. The EWMA
+    variant uses decay 2 / (N + 1) for N = 7 and 28 days and compares the two
+    daily averages directly.
+    """
+    if daily_km.empty:
+        return pd.DataFrame(columns=LOAD_SERIES_COLUMNS)
+
+    daily_km = daily_km.sort_index()
+    all_days = pd.date_range(daily_km.index.min(), daily_km.index.max(), freq="D")
+    load = daily_km.reindex(all_days, fill_value=0.0).astype("float64")
+
+    acute = load.rolling(ACUTE_DAYS, min_periods=1).sum()
+    chronic = load.rolling(CHRONIC_DAYS, min_periods=1).sum()
+    chronic_weekly = chronic / (CHRONIC_DAYS / ACUTE_DAYS)
+
+    ewma_acute = load.ewm(alpha=2 / (ACUTE_DAYS + 1), adjust=False).mean()
+    ewma_chronic = load.ewm(alpha=2 / (CHRONIC_DAYS + 1), adjust=False).mean()
+
+    return pd.DataFrame(
+        {
+            "date": all_days,
+            "load_km": load.to_numpy(),
+            "acute_km": acute.to_numpy(),
+            "chronic_km": chronic.to_numpy(),
+            "load_ratio": (acute / chronic_weekly).where(chronic > 0, 0.0).to_numpy(),
+            "ewma_acute_km": ewma_acute.to_numpy(),
+            "ewma_chronic_km": ewma_chronic.to_numpy(),
+            "ewma_load_ratio": (ewma_acute / ewma_chronic).where(ewma_chronic > 0, 0.0).to_numpy(),
+        }
+    )
@@ -0,0 +1,393 @@
+"""
+Payload layout shared by the two PWA export engines.
+
+pwa_export.py builds the payload with pandas; lite_export.py builds the
+same bytes with the standard library only. Both take their format numbers,
+column lists, point budgets and column helpers from here, as does the
+local API, so this module must not import pandas or numpy at import time
+(frame_columns imports them when it is called).
+
+The payload and the chunked export are assembled here too, by
+build_payload and export_chunks: each engine passes an ExportEngine with
+its own run, load-series and downsampling builders, and everything else
+(month chunking, fingerprints, chunk reuse, the manifest) exists once.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from muthu_performance_lab.compression import remove_compressed_siblings, write_compressed_siblings
+from muthu_performance_lab.database import connection
+from muthu_performance_lab.profiling import RunProfile, stage
+from muthu_performance_lab.queries import (
+    query_lifetime_distance_km,
+    query_monthly_run_fingerprints,
+    query_run_rows,
+    query_total_runs,
+    query_training_load_ratio,
+    query_weekly_mileage_km,
+)
+
+# Bumped whenever the payload layout changes; app.js checks it when decoding.
+PAYLOAD_FORMAT = 2
+# Chunked export: a small manifest plus one immutable file per month.
+CHUNKED_FORMAT = 3
+MANIFEST_NAME = "manifest.json"
+CHUNKS_DIRNAME = "chunks"
+# Enough precision for every value the dashboard displays.
+FLOAT_DECIMALS = 6
+
+RUN_TABLE_COLUMNS = [
+    "workout_date",
+    "distance_km",
+    "duration_min",
+    "avg_hr",
+    "max_hr",
+    "avg_cadence",
+    "avg_pace_min_per_km",
+    "hr_efficiency",
+    "calories",
+    "avg_temperature",
+]
+
+LOAD_CHART_COLUMNS = ["date", "acute_km", "chronic_km", "load_ratio", "ewma_load_ratio"]
+
+# Columns the downsampled chart series are computed from.
+CHART_RUN_COLUMNS = ["workout_date", "distance_km", "avg_cadence", "avg_hr", "avg_pace_min_per_km"]
+
+Columns = Dict[str, List[Any]]
+
+# Most points each chart draws; 0 turns downsampling off for that chart.
+DEFAULT_POINT_BUDGETS: Dict[str, int] = {
+    "distance_trend": 400,
+    "cadence_trend": 400,
+    "training_load": 600,
+    "pace_vs_hr": 900,
+}
+
+
+def point_budgets(overrides: Optional[Mapping[str, int]] = None) -> Dict[str, int]:
+    """DEFAULT_POINT_BUDGETS with `overrides` applied; unknown chart names raise."""
+    budgets = dict(DEFAULT_POINT_BUDGETS)
+    for name, budget in (overrides or {}).items():
+        if name not in budgets:
+            raise ValueError(f"Unknown chart {name!r}; expected one of {sorted(budgets)}")
+        budgets[name] = int(budget)
+    return budgets
+
+
+def to_float(value: Any) -> Optional[float]:
+    """`value` as a float; None for missing values (None, NaN, NaT) and non-numbers."""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def row_columns(rows: Sequence[Tuple[Any, ...]], names: List[str]) -> Columns:
+    """Query rows turned into one list per column, keyed by `names`."""
+    if not rows:
+        return {name: [] for name in names}
+    return {name: list(values) for name, values in zip(names, zip(*rows))}
+
+
+def frame_columns(df: Any, names: List[str]) -> Columns:
+    """The `names` columns of a pandas DataFrame as JSON-ready lists."""
+    return {name: _frame_column_values(df[name]) for name in names}
+
+
+def _frame_column_values(series: Any) -> List[Any]:
+    """One JSON-ready list per column, converted without a Python loop per cell."""
+    import numpy as np
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.strftime("%Y-%m-%d").to_numpy(dtype=object)
+        values[series.isna().to_numpy()] = None
+        return values.tolist()
+
+    if not pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype=object)
+        values[series.isna().to_numpy()] = None
+        return values.tolist()
+
+    numbers = series.to_numpy(dtype="float64").round(FLOAT_DECIMALS)
+    values = numbers.astype(object)
+    # Whole numbers (HR, calories, cadence) are written without a trailing ".0".
+    whole = np.isfinite(numbers) & (numbers == np.floor(numbers))
+    values[whole] = numbers[whole].astype(np.int64).astype(object)
+    # NaN and +/-inf are not valid JSON.
+    values[~np.isfinite(numbers)] = None
+    return values.tolist()
+
+
+def empty_payload(payload_format: int) -> dict[str, Any]:
+    return {
+        "format": payload_format,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "has_data": False,
+        "message": "No running workouts available.",
+    }
+
+
+def dumps_payload(payload: dict[str, Any]) -> str:
+    return json.dumps(payload, separators=(",", ":"), allow_nan=False)
+
+
+def read_manifest(path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomic(path: Path, text: str) -> None:
+    """Replace `path` in one step and write its .gz/.br siblings for the server."""
+    data = text.encode("utf-8")
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+    write_compressed_siblings(path, data)
+
+
+def month_bounds(month: str) -> tuple[date, date]:
+    start = date.fromisoformat(month + "-01")
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+# Rows of the load series: every row (None), some rows (a list) or a slice.
+LoadRows = Union[None, List[int], slice]
+
+
+class ExportEngine(NamedTuple):
+    """
+    The builders one export engine plugs into build_payload and export_chunks.
+
+    "runs" and "load" values are the engine's own (DataFrames for
+    pwa_export, column dicts for lite_export); the *_columns builders turn
+    them into JSON-ready columns.
+    """
+
+    runs: Callable[..., Any]  # (conn, columns, start=None, end=None), oldest first
+    run_count: Callable[[Any], int]
+    run_columns: Callable[[Any, List[str]], Columns]
+    row_indices: Callable[[Any, List[str]], List[int]]  # rows with every column set
+    monthly_columns: Callable[[sqlite3.Connection], Columns]
+    daily_distance: Callable[[sqlite3.Connection], Any]
+    training_load: Callable[[Any], Any]  # daily distance -> load series
+    load_columns: Callable[[Any, LoadRows], Columns]  # LOAD_CHART_COLUMNS
+    # (month "YYYY-MM", first row, end row, fingerprint of the rounded rows)
+    load_months: Callable[[Any], List[Tuple[str, int, int, str]]]
+    downsampled_series: Callable[[Any, Any, Mapping[str, int]], Dict[str, Dict[str, Any]]]
+
+
+def dashboard_kpis(conn: sqlite3.Connection) -> dict[str, Any]:
+    latest_date, latest_pace = query_run_rows(
+        conn, ["workout_date", "avg_pace_min_per_km"], limit=1, newest_first=True
+    )[0]
+    return {
+        "total_runs": query_total_runs(conn),
+        "lifetime_distance_km": round(query_lifetime_distance_km(conn), 2),
+        "weekly_mileage_km": round(query_weekly_mileage_km(conn), 2),
+        "training_load_ratio": round(query_training_load_ratio(conn), 3),
+        "latest_run_date": latest_date[:10],
+        "latest_run_pace": to_float(latest_pace),
+    }
+
+
+def build_payload(
+    engine: ExportEngine,
+    point_budget_overrides: Optional[Mapping[str, int]],
+    db_path: Path,
+    profile: Optional[RunProfile],
+) -> dict[str, Any]:
+    """The whole dashboard as one columnar payload (format 2), built by `engine`."""
+    budgets = point_budgets(point_budget_overrides)
+    with stage(profile, "payload_query"), connection(db_path) as conn:
+        runs = engine.runs(conn, RUN_TABLE_COLUMNS)
+        if not engine.run_count(runs):
+            return empty_payload(PAYLOAD_FORMAT)
+
+        monthly = engine.monthly_columns(conn)
+        daily = engine.daily_distance(conn)
+        kpis = dashboard_kpis(conn)
+    with stage(profile, "payload_training_load"):
+        load = engine.training_load(daily)
+
+    # Columnar layout: every run column is stored once in "runs"; run-based
+    # series list the row positions they use ("all" for every run). Series
+    # with their own rows carry their own "columns". See decodePayload in app.js.
+    with stage(profile, "payload_columns"):
+        payload = {
+            "format": PAYLOAD_FORMAT,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "has_data": True,
+            "kpis": kpis,
+            "runs": engine.run_columns(runs, RUN_TABLE_COLUMNS),
+            "series": {
+                "monthly_mileage": {"columns": monthly},
+                "training_load": {"columns": engine.load_columns(load, None)},
+                "pace_vs_hr": {"rows": engine.row_indices(runs, ["avg_hr", "avg_pace_min_per_km"])},
+                "cadence_trend": {"rows": engine.row_indices(runs, ["avg_cadence"])},
+                "distance_trend": {"rows": "all"},
+                "run_table": {"rows": "all"},
+            },
+            "point_budgets": budgets,
+        }
+
+    with stage(profile, "payload_downsample"):
+        sampled = engine.downsampled_series(runs, load, budgets)
+        if "training_load" in sampled:
+            # The load series carries its own columns, so only the kept rows are sent.
+            spec = sampled.pop("training_load")
+            sampled["training_load"] = {
+                "columns": engine.load_columns(load, spec["rows"]),
+                "positions": spec["rows"],
+                "length": spec["length"],
+            }
+    payload["series"].update(sampled)
+    return payload
+
+
+def export_chunks(
+    engine: ExportEngine,
+    output_dir: Path,
+    point_budget_overrides: Optional[Mapping[str, int]],
+    db_path: Path,
+    profile: Optional[RunProfile],
+) -> dict[str, Any]:
+    """The chunked export (format 3) built by `engine`; see pwa_export.export_pwa_chunks."""
+    budgets = point_budgets(point_budget_overrides)
+    chunks_dir = output_dir / CHUNKS_DIRNAME
+    chunks_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    previous_manifest = read_manifest(manifest_path)
+    previous = {
+        chunk["month"]: chunk
+        for chunk in previous_manifest.get("chunks", [])
+        if (output_dir / chunk["file"]).exists()
+    }
+
+    written = 0
+    with connection(db_path) as conn:
+        with stage(profile, "chunk_fingerprints"):
+            run_prints = query_monthly_run_fingerprints(conn)
+        if not run_prints:
+            manifest = empty_payload(CHUNKED_FORMAT)
+            manifest["chunks"] = []
+        else:
+            # The load series is cheap to recompute from the daily rollup. It has
+            # one row per day from the first to the last run, so it also lists
+            # every month that needs a chunk.
+            with stage(profile, "chunk_load_series"):
+                load = engine.training_load(engine.daily_distance(conn))
+
+            chunks: list[dict[str, Any] | None] = []
+            todo = []
+            for month, lo, hi, load_print in engine.load_months(load):
+                fingerprint = "{}-{}".format(run_prints.get(month, "none"), load_print)
+                old = previous.get(month)
+                if old is not None and old["fingerprint"] == fingerprint:
+                    chunks.append(old)
+                else:
+                    todo.append((len(chunks), month, fingerprint, lo, hi))
+                    chunks.append(None)
+
+            with stage(profile, "chunk_write"):
+                if todo:
+                    written = _write_chunks(engine, conn, load, todo, chunks, output_dir)
+
+            same_chunks = [chunk["fingerprint"] for chunk in chunks] == [
+                chunk["fingerprint"] for chunk in previous_manifest.get("chunks", [])
+            ]
+            if same_chunks and previous_manifest.get("point_budgets") == budgets:
+                series = previous_manifest.get("series", {})
+            else:
+                with stage(profile, "chunk_downsample"):
+                    series = engine.downsampled_series(
+                        engine.runs(conn, CHART_RUN_COLUMNS), load, budgets
+                    )
+
+            manifest = {
+                "format": CHUNKED_FORMAT,
+                "generated_at": datetime.now().isoformat(timespec="seconds"),
+                "has_data": True,
+                "kpis": dashboard_kpis(conn),
+                "monthly_mileage": {"columns": engine.monthly_columns(conn)},
+                "chunks": chunks,
+                "series": series,
+                "point_budgets": budgets,
+            }
+
+    # The manifest is replaced atomically, so a reader sees either the old
+    # or the new set of chunks; old chunk files are only removed afterwards.
+    with stage(profile, "chunk_manifest"):
+        write_atomic(manifest_path, dumps_payload(manifest))
+        referenced = {output_dir / chunk["file"] for chunk in manifest["chunks"]}
+        for stale in chunks_dir.glob("*.json"):
+            if stale not in referenced:
+                stale.unlink()
+                remove_compressed_siblings(stale)
+
+    return {
+        **manifest,
+        "chunks_written": written,
+        "chunks_reused": len(manifest["chunks"]) - written,
+    }
+
+
+def _write_chunks(
+    engine: ExportEngine,
+    conn: sqlite3.Connection,
+    load: Any,
+    todo: List[Tuple[int, str, str, int, int]],
+    chunks: List[Optional[Dict[str, Any]]],
+    output_dir: Path,
+) -> int:
+    """Write the `todo` months' chunk files and fill in their `chunks` entries."""
+    # One query covering every changed month; columns are converted once and
+    # each month takes its slice of the lists.
+    runs = engine.runs(
+        conn,
+        RUN_TABLE_COLUMNS,
+        start=month_bounds(todo[0][1])[0],
+        end=month_bounds(todo[-1][1])[1],
+    )
+    run_columns = engine.run_columns(runs, RUN_TABLE_COLUMNS)
+    run_months = [day[:7] for day in run_columns["workout_date"]]
+    load_offset = todo[0][3]
+    load_columns = engine.load_columns(load, slice(load_offset, todo[-1][4]))
+
+    written = 0
+    for position, month, fingerprint, lo, hi in todo:
+        first = bisect_left(run_months, month)
+        last = bisect_right(run_months, month)
+        text = dumps_payload(
+            {
+                "month": month,
+                "runs": {col: values[first:last] for col, values in run_columns.items()},
+                "training_load": {
+                    col: values[lo - load_offset : hi - load_offset]
+                    for col, values in load_columns.items()
+                },
+            }
+        )
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        file_name = f"{CHUNKS_DIRNAME}/{month}.{digest}.json"
+        if not (output_dir / file_name).exists():
+            write_atomic(output_dir / file_name, text)
+            written += 1
+        chunks[position] = {"month": month, "file": file_name, "fingerprint": fingerprint}
+    return written
@@ -0,0 +1,128 @@
+"""
+Stage timings and per-file parse times for refreshes and exports.
+
+A RunProfile collects named stage spans and one entry per parsed FIT file:
+
+    profile = RunProfile("export_pwa_data")
+    with profile.stage("discover"):
+        files = find_fit_files(activity_dir)
+
+Spans nest, and time spent in an inner span only counts towards the inner
+one, so the stages of a run add up to (at most) its wall time. Functions
+that take an optional profile use `stage(profile, name)`, which does
+nothing when the profile is None.
+
+Finished runs are saved with database.record_ingest_run.
+"""
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# (source_file, parse seconds, size in bytes, parsed ok)
+FileTiming = Tuple[str, float, int, bool]
+
+DEFAULT_TOP_FILES = 10
+
+
+class RunProfile:
+    """Stage spans and per-file parse timings of one run."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        # Seconds per stage, in the order the stages first ran.
+        self.stages: Dict[str, float] = {}
+        self.files: List[FileTiming] = []
+        self.total_seconds: Optional[float] = None
+        self._started = time.perf_counter()
+        # Time spent in child spans, one entry per open span.
+        self._child_seconds: List[float] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        self._child_seconds.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self._child_seconds.pop()
+            self.stages[name] = self.stages.get(name, 0.0) + own
+            if self._child_seconds:
+                self._child_seconds[-1] += elapsed
+
+    def timed(self, items: Iterable[T], name: str) -> Iterator[T]:
+        """Yield from `items`, counting the time spent waiting for each item as `name`."""
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_file(self, source_file: str, seconds: float, size: int, ok: bool) -> None:
+        self.files.append((source_file, seconds, size, ok))
+
+    def finish(self) -> float:
+        """Stop the run clock (once) and return the run's wall time in seconds."""
+        if self.total_seconds is None:
+            self.total_seconds = time.perf_counter() - self._started
+        return self.total_seconds
+
+    def slowest_files(self, count: int = DEFAULT_TOP_FILES) -> List[FileTiming]:
+        return sorted(self.files, key=lambda entry: entry[1], reverse=True)[:count]
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals for the ingest_runs table; finishes the run if needed."""
+        return {
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "total_seconds": self.finish(),
+            "files_parsed": sum(1 for entry in self.files if entry[3]),
+            "files_failed": sum(1 for entry in self.files if not entry[3]),
+            "bytes_parsed": sum(entry[2] for entry in self.files),
+            "parse_seconds": sum(entry[1] for entry in self.files),
+            "stages": dict(self.stages),
+        }
+
+    def report(self, top_files: int = DEFAULT_TOP_FILES) -> str:
+        """Human-readable stage breakdown and slowest files."""
+        summary = self.summary()
+        total = summary["total_seconds"]
+        lines = [f"Profile of {self.kind} ({total:.3f} s):"]
+        # Time outside every span: argument parsing, imports, printing.
+        other = max(total - sum(self.stages.values()), 0.0)
+        for name, seconds in [*self.stages.items(), ("(other)", other)]:
+            share = seconds / total if total else 0.0
+            lines.append(f"  {name:<24} {seconds:9.3f} s {share:7.1%}")
+        if self.files:
+            files = len(self.files)
+            lines.append(
+                f"Parsed {files} files ({summary['files_failed']} failed), "
+                f"{summary['bytes_parsed'] / 1e6:.1f} MB, "
+                f"{summary['parse_seconds']:.3f} s parser time "
+                f"({summary['parse_seconds'] / files * 1000:.1f} ms per file)."
+            )
+            lines.append(f"Slowest {min(top_files, files)} files:")
+            for source_file, seconds, size, ok in self.slowest_files(top_files):
+                status = "" if ok else "  (failed)"
+                lines.append(
+                    f"  {seconds * 1000:8.1f} ms {size / 1024:9.1f} KB  {source_file}{status}"
+                )
+        return "\n".join(lines)
+
+
+def stage(profile: Optional[RunProfile], name: str) -> ContextManager[None]:
+    """profile.stage(name), or a no-op when profile is None."""
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def timed(profile: Optional[RunProfile], items: Iterable[T], name: str) -> Iterable[T]:
+    return profile.timed(items, name) if profile is not None else items
@@ -1,23 +1,69 @@
 from __future__ import annotations
 
-import json
-from datetime import datetime
+import hashlib
+import os
+import sqlite3
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterable, Mapping
 
+import numpy as np
 import pandas as pd
 
-from muthu_performance_lab.config import DB_PATH, DEFAULT_GARMIN_CANDIDATES, ERROR_LOG_PATH
-from muthu_performance_lab.database import get_connection, upsert_workouts
-from muthu_performance_lab.fit_ingest import ingest_activity_folder
-from muthu_performance_lab.metrics import (
-    filter_runs,
-    kpi_lifetime_distance_km,
-    kpi_total_runs,
-    load_workouts_df,
-    monthly_mileage,
-    training_load_ratio,
-    weekly_mileage_km,
+from muthu_performance_lab.config import (
+    DB_PATH,
+    DEFAULT_GARMIN_CANDIDATES,
+    ERROR_LOG_PATH,
+    STREAMS_DIR,
+)
+from muthu_performance_lab.database import (
+    DEFAULT_BATCH_SIZE,
+    delete_workouts,
+    fetch_activity_keys,
+    fetch_duplicate_files,
+    fetch_files_to_reparse,
+    fetch_known_files,
+    fetch_quarantined_files,
+    connection,
+    forget_duplicate_files,
+    quarantine_files,
+    record_duplicate_files,
+    record_ingest_run,
+    rederive_workouts,
+    release_quarantine,
+    upsert_workouts,
+)
+from muthu_performance_lab.fit_archive import FitSource, source_crc
+from muthu_performance_lab.fit_ingest import (
+    default_worker_count,
+    find_fit_sources,
+    iter_fit_rows,
+    split_changed_files,
+)
+from muthu_performance_lab.downsample import (
+    date_positions,
+    density_bins,
+    lttb_indices,
+    lttb_union,
+    needs_binning,
+)
+from muthu_performance_lab.fit_reader import activity_identity
+from muthu_performance_lab.metrics import training_load_series
+from muthu_performance_lab.payload import (
+    FLOAT_DECIMALS,
+    LOAD_CHART_COLUMNS,
+    ExportEngine,
+    LoadRows,
+    build_payload,
+    dumps_payload,
+    export_chunks,
+    frame_columns,
+    write_atomic,
+)
+from muthu_performance_lab.profiling import RunProfile, stage, timed
+from muthu_performance_lab.queries import (
+    query_daily_run_distance,
+    query_monthly_mileage,
+    query_runs,
 )
 
 
@@ -28,111 +74,451 @@ def detect_default_garmin_path() -> Path | None:
     return None
 
 
-def _to_float(value: Any) -> float | None:
-    if value is None:
-        return None
-    if pd.isna(value):
-        return None
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
-
-
-def _clean_rows(df: pd.DataFrame, cols: list[str]) -> list[dict[str, Any]]:
-    records = []
-    for _, row in df.iterrows():
-        record: dict[str, Any] = {}
-        for col in cols:
-            value = row[col]
-            if isinstance(value, pd.Timestamp):
-                record[col] = value.date().isoformat()
-            elif pd.isna(value):
-                record[col] = None
-            else:
-                record[col] = value
-        records.append(record)
-    return records
-
-
-def refresh_database_from_garmin(garmin_root: Path) -> tuple[int, int]:
-    activity_dir = garmin_root / "Activity"
-    rows = ingest_activity_folder(activity_dir=activity_dir, error_log_path=ERROR_LOG_PATH)
-
-    conn = get_connection(DB_PATH)
-    try:
-        count = upsert_workouts(conn, rows)
-    finally:
-        conn.close()
-
-    return count, len(rows)
-
-
-def build_dashboard_payload() -> dict[str, Any]:
-    conn = get_connection(DB_PATH)
-    try:
-        all_df = load_workouts_df(conn)
-    finally:
-        conn.close()
-
-    runs_df = filter_runs(all_df)
-
-    if runs_df.empty:
-        return {
-            "generated_at": datetime.now().isoformat(timespec="seconds"),
-            "has_data": False,
-            "message": "No running workouts available.",
+def _row_indices(df: pd.DataFrame, required: list[str]) -> list[int]:
+    """Positions of the rows where every `required` column has a value."""
+    return np.flatnonzero(df[required].notna().all(axis=1).to_numpy()).tolist()
+
+
+def _sampled_rows(rows: np.ndarray, picked: np.ndarray) -> dict[str, Any]:
+    spec: dict[str, Any] = {"rows": rows[picked].tolist(), "length": len(rows)}
+    if len(rows) and rows[-1] != len(rows) - 1:
+        # Only needed when the series is a subset of the rows (see seriesPoints).
+        spec["positions"] = picked.tolist()
+    return spec
+
+
+def _downsampled_series(
+    runs_df: pd.DataFrame, load_df: pd.DataFrame, budgets: Mapping[str, int]
+) -> dict[str, dict[str, Any]]:
+    """
+    Series specs for the charts that have more points than their budget.
+
+    Line series keep the LTTB-picked "rows" (positions in runs_df or
+    load_df) and the full series "length", plus the picked "positions"
+    within the series when those differ from the rows, so the PWA can
+    space the points as before. The pace/HR scatter
+    becomes binned "columns" with a run "count" per point. Charts within
+    budget are left out and drawn from the raw rows.
+    """
+    series: dict[str, dict[str, Any]] = {}
+    run_x = date_positions(runs_df["workout_date"])
+
+    all_rows = np.arange(len(runs_df))
+    distance = runs_df["distance_km"].to_numpy(dtype="float64")
+    picked = lttb_indices(run_x, distance, budgets["distance_trend"])
+    if len(picked) < len(all_rows):
+        series["distance_trend"] = _sampled_rows(all_rows, picked)
+
+    cadence_rows = np.flatnonzero(runs_df["avg_cadence"].notna().to_numpy())
+    cadence = runs_df["avg_cadence"].to_numpy(dtype="float64")[cadence_rows]
+    picked = lttb_indices(run_x[cadence_rows], cadence, budgets["cadence_trend"])
+    if len(picked) < len(cadence_rows):
+        series["cadence_trend"] = _sampled_rows(cadence_rows, picked)
+
+    scatter_rows = np.asarray(_row_indices(runs_df, ["avg_hr", "avg_pace_min_per_km"]), dtype=np.int64)
+    if needs_binning(len(scatter_rows), budgets["pace_vs_hr"]):
+        bins = density_bins(
+            runs_df["avg_hr"].to_numpy(dtype="float64")[scatter_rows],
+            runs_df["avg_pace_min_per_km"].to_numpy(dtype="float64")[scatter_rows],
+            budgets["pace_vs_hr"],
+        ).rename(columns={"x": "avg_hr", "y": "avg_pace_min_per_km"})
+        series["pace_vs_hr"] = {
+            "columns": frame_columns(bins, ["avg_hr", "avg_pace_min_per_km", "count"]),
+            "binned": True,
         }
 
-    runs_df = runs_df.sort_values("workout_date")
-    monthly_df = monthly_mileage(runs_df)
-
-    latest = runs_df.iloc[-1]
-
-    payload = {
-        "generated_at": datetime.now().isoformat(timespec="seconds"),
-        "has_data": True,
-        "kpis": {
-            "total_runs": kpi_total_runs(runs_df),
-            "lifetime_distance_km": round(kpi_lifetime_distance_km(runs_df), 2),
-            "weekly_mileage_km": round(weekly_mileage_km(runs_df), 2),
-            "training_load_ratio": round(training_load_ratio(runs_df), 3),
-            "latest_run_date": latest["workout_date"].date().isoformat(),
-            "latest_run_pace": _to_float(latest.get("avg_pace_min_per_km")),
-        },
-        "series": {
-            "monthly_mileage": _clean_rows(monthly_df, ["month", "distance_km"]),
-            "pace_vs_hr": _clean_rows(
-                runs_df.dropna(subset=["avg_hr", "avg_pace_min_per_km"]),
-                ["workout_date", "avg_hr", "avg_pace_min_per_km", "distance_km", "duration_min"],
-            ),
-            "cadence_trend": _clean_rows(
-                runs_df.dropna(subset=["avg_cadence"]),
-                ["workout_date", "avg_cadence"],
-            ),
-            "distance_trend": _clean_rows(runs_df, ["workout_date", "distance_km"]),
-            "run_table": _clean_rows(
-                runs_df,
-                [
-                    "workout_date",
-                    "distance_km",
-                    "duration_min",
-                    "avg_hr",
-                    "max_hr",
-                    "avg_cadence",
-                    "avg_pace_min_per_km",
-                    "hr_efficiency",
-                    "calories",
-                    "avg_temperature",
-                ],
-            ),
-        },
+    load_rows = np.arange(len(load_df))
+    picked = lttb_union(
+        date_positions(load_df["date"]),
+        [load_df[col].to_numpy(dtype="float64") for col in ("load_ratio", "ewma_load_ratio")],
+        budgets["training_load"],
+    )
+    if len(picked) < len(load_rows):
+        series["training_load"] = _sampled_rows(load_rows, picked)
+    return series
+
+
+def _split_duplicates(
+    conn: sqlite3.Connection, changed: list[tuple[FitSource, float, int]]
+) -> tuple[list[tuple[FitSource, float, int]], dict[str, str], list[dict[str, Any]]]:
+    """
+    Set aside files whose activity is already stored under another path.
+
+    Each file's identity comes from its file_id header (see
+    fit_reader.activity_identity), so a duplicate costs a small read, not a
+    parse. Unchanged known duplicates are not read at all. Within `changed`
+    the first file of an activity wins. Returns (to_parse, activity key by
+    source_file, duplicates ready for record_duplicate_files).
+    """
+    stored = fetch_activity_keys(conn)
+    known_duplicates = fetch_duplicate_files(conn)
+    owners = dict(stored)
+    to_parse: list[tuple[FitSource, float, int]] = []
+    keys: dict[str, str] = {}
+    duplicates: list[dict[str, Any]] = []
+
+    for fit_path, mtime, size in changed:
+        source_file = str(fit_path.resolve())
+        crc = source_crc(fit_path)
+        known = known_duplicates.get(source_file)
+        if known is not None and known[:3] == (mtime, size, crc) and known[3] in stored:
+            activity_key = known[3]
+        else:
+            try:
+                activity_key = activity_identity(fit_path)
+            except OSError:
+                # Unreadable right now; the parser reports the real error.
+                to_parse.append((fit_path, mtime, size))
+                continue
+
+        owner = owners.get(activity_key)
+        if owner is not None and owner != source_file:
+            duplicates.append(
+                {
+                    "source_file": source_file,
+                    "source_mtime": mtime,
+                    "source_size": size,
+                    "source_crc": crc,
+                    "activity_key": activity_key,
+                    "duplicate_of": owner,
+                }
+            )
+            continue
+        owners[activity_key] = source_file
+        keys[source_file] = activity_key
+        to_parse.append((fit_path, mtime, size))
+    return to_parse, keys, duplicates
+
+
+def _stored_source_files(conn: sqlite3.Connection, source_files: list[str]) -> list[str]:
+    """The `source_files` that have a workouts row."""
+    return [
+        source_file
+        for source_file in source_files
+        if conn.execute("SELECT 1 FROM workouts WHERE source_file = ?", (source_file,)).fetchone()
+    ]
+
+
+def _ingest_changed(
+    conn: sqlite3.Connection,
+    changed: list[tuple[FitSource, float, int]],
+    workers: int | None,
+    batch_size: int,
+    progress: Callable[[int, int], None] | None,
+    store_streams: bool,
+    skip_quarantined: bool = True,
+    profile: RunProfile | None = None,
+) -> dict[str, int]:
+    """
+    Parse `changed` files and upsert them in batches.
+
+    Files quarantined at the same mtime and size are skipped (unless
+    skip_quarantined is False), and so are copies of activities already
+    stored under another path. Files that fail are quarantined in one batch
+    at the end; a failing file that was stored before loses its row, like a
+    stored file that became a duplicate. Returns counts for "upserted",
+    "failed", "quarantined" and "duplicates" (the last two were skipped).
+
+    With a profile, time waiting for the parsers counts as "parse" and the
+    rest of the batch loop as "upsert".
+    """
+    quarantined = 0
+    with stage(profile, "dedupe"):
+        if skip_quarantined:
+            known_bad = fetch_quarantined_files(conn)
+            if known_bad:
+                to_parse = [
+                    (fit_path, mtime, size)
+                    for fit_path, mtime, size in changed
+                    if known_bad.get(str(fit_path.resolve()))
+                    != (mtime, size, source_crc(fit_path))
+                ]
+                quarantined = len(changed) - len(to_parse)
+                changed = to_parse
+
+        changed, keys, duplicates = _split_duplicates(conn, changed)
+        record_duplicate_files(conn, duplicates)
+        # A stored file rewritten into a copy of another activity loses its row.
+        delete_workouts(
+            conn,
+            _stored_source_files(conn, [dup["source_file"] for dup in duplicates]),
+            streams_dir=STREAMS_DIR,
+        )
+
+    counts = {"done": 0, "reported": -1}
+    failures: list[dict[str, Any]] = []
+
+    def count_file(_fit_path: FitSource, _ok: bool) -> None:
+        counts["done"] += 1
+
+    def report_batch(_rows_so_far: int = 0) -> None:
+        if progress is not None and counts["reported"] != counts["done"]:
+            counts["reported"] = counts["done"]
+            progress(counts["done"], len(changed))
+
+    rows = iter_fit_rows(
+        changed,
+        ERROR_LOG_PATH,
+        workers=workers if workers is not None else default_worker_count(),
+        on_file=count_file,
+        streams_dir=STREAMS_DIR if store_streams else None,
+        on_failure=failures.append,
+        profile=profile,
+    )
+    keyed_rows = (
+        {**row, "activity_key": keys.get(row["source_file"])}
+        for row in timed(profile, rows, "parse")
+    )
+    with stage(profile, "upsert"):
+        upserted = upsert_workouts(conn, keyed_rows, batch_size=batch_size, on_batch=report_batch)
+    with stage(profile, "quarantine"):
+        quarantine_files(conn, failures)
+        # A stored file rewritten into one that no longer parses loses its row
+        # too: its old stream and best efforts describe data the file lost.
+        delete_workouts(
+            conn,
+            _stored_source_files(conn, [failure["source_file"] for failure in failures]),
+            streams_dir=STREAMS_DIR,
+        )
+    report_batch()
+    return {
+        "upserted": upserted,
+        "failed": len(failures),
+        "quarantined": quarantined,
+        "duplicates": len(duplicates),
     }
-    return payload
 
 
-def export_pwa_json(output_path: Path) -> dict[str, Any]:
+def refresh_database_from_garmin(
+    garmin_root: Path,
+    incremental: bool = True,
+    workers: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: Callable[[int, int], None] | None = None,
+    store_streams: bool = True,
+    profile: RunProfile | None = None,
+) -> dict[str, int]:
+    """
+    Sync the workouts table with the FIT files under garmin_root/Activity,
+    or with the FIT members of garmin_root when it is a ZIP archive (read
+    in place, see fit_archive.py).
+
+    In incremental mode, files whose (path, mtime, size) already match the
+    database are skipped, and so are quarantined files that failed to parse
+    at the same mtime and size; a full refresh retries them. In both modes
+    a file holding an activity that is already stored under another path
+    (same device serial number and creation time) is skipped as a
+    duplicate, and rows for files that no longer exist under the Activity
+    folder (or in the archive) are removed. FIT parsing is spread over `workers` processes
+    (defaults to the CPU count). A stored file that changed and now fails
+    to parse is quarantined and its old row removed.
+
+    Parsed rows stream straight into SQLite and are committed every
+    `batch_size` rows; `progress(files_done, files_total)` is called after
+    each commit. With store_streams, per-second record data is also saved
+    under STREAMS_DIR (see muthu_performance_lab.streams).
+
+    Stage and per-file parse timings go to `profile`. Without one, the
+    refresh is profiled on its own and saved to ingest_runs; callers that
+    pass a profile save it themselves (record_ingest_run), usually after
+    adding their own stages.
+    """
+    own_profile = profile is None
+    profile = profile or RunProfile("refresh")
+    with profile.stage("discover"):
+        fit_files, source_root = find_fit_sources(garmin_root)
+
+    with connection(DB_PATH) as conn:
+        with profile.stage("stat"):
+            known_files = fetch_known_files(conn)
+            # Workouts stored by an older version of the parser are parsed once more.
+            to_reparse = fetch_files_to_reparse(conn)
+            changed, unchanged = split_changed_files(
+                fit_files,
+                {
+                    source_file: stat
+                    for source_file, stat in known_files.items()
+                    if source_file not in to_reparse
+                }
+                if incremental
+                else {},
+            )
+
+        # Only prune rows that belong to this Activity folder (or archive),
+        # so switching between GARMIN roots does not wipe the other root's
+        # history. Pruning first lets a duplicate of a deleted file take its
+        # place in this same refresh.
+        activity_prefix = str(source_root.resolve()) + os.sep
+        on_disk = set(unchanged) | {str(fit_path.resolve()) for fit_path, _, _ in changed}
+
+        def gone(source_files: Iterable[str]) -> list[str]:
+            return [
+                source_file
+                for source_file in source_files
+                if source_file.startswith(activity_prefix) and source_file not in on_disk
+            ]
+
+        with profile.stage("prune"):
+            deleted = delete_workouts(conn, gone(known_files), streams_dir=STREAMS_DIR)
+            release_quarantine(conn, gone(fetch_quarantined_files(conn)))
+            forget_duplicate_files(conn, gone(fetch_duplicate_files(conn)))
+
+        ingested = _ingest_changed(
+            conn,
+            changed,
+            workers,
+            batch_size,
+            progress,
+            store_streams,
+            skip_quarantined=incremental,
+            profile=profile,
+        )
+        with profile.stage("rederive"):
+            rederived = rederive_workouts(conn, batch_size=batch_size)
+        if own_profile:
+            record_ingest_run(conn, profile)
+
+    return {
+        "parsed": ingested["upserted"],
+        "upserted": ingested["upserted"],
+        "skipped": len(unchanged),
+        "deleted": deleted,
+        "failed": ingested["failed"],
+        "quarantined": ingested["quarantined"],
+        "duplicates": ingested["duplicates"],
+        "rederived": rederived,
+    }
+
+
+def refresh_fit_files(
+    fit_files: list[FitSource],
+    removed_files: list[FitSource] | None = None,
+    workers: int | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    store_streams: bool = True,
+    skip_quarantined: bool = True,
+    profile: RunProfile | None = None,
+) -> dict[str, int]:
+    """
+    Like refresh_database_from_garmin, but for a known list of files.
+
+    Used by the folder watcher: only `fit_files` are checked and parsed (and
+    skipped if the database already has them at the same mtime and size, if
+    they are quarantined at that mtime and size, or if they duplicate a
+    stored activity), and rows, quarantine and duplicate entries for
+    `removed_files` are deleted. Nothing else is scanned.
+    skip_quarantined=False parses quarantined files anyway. Profiled and
+    saved to ingest_runs the same way.
+    """
+    own_profile = profile is None
+    profile = profile or RunProfile("refresh_files")
+    with connection(DB_PATH) as conn:
+        with profile.stage("prune"):
+            removed = [str(path.resolve()) for path in removed_files or []]
+            deleted = delete_workouts(conn, removed, streams_dir=STREAMS_DIR)
+            release_quarantine(conn, removed)
+            forget_duplicate_files(conn, removed)
+
+        with profile.stage("stat"):
+            changed, unchanged = split_changed_files(
+                [path for path in fit_files if path.exists()], fetch_known_files(conn)
+            )
+        ingested = _ingest_changed(
+            conn, changed, workers, batch_size, None, store_streams, skip_quarantined, profile
+        )
+        if own_profile:
+            record_ingest_run(conn, profile)
+
+    return {
+        "parsed": ingested["upserted"],
+        "upserted": ingested["upserted"],
+        "skipped": len(unchanged),
+        "deleted": deleted,
+        "failed": ingested["failed"],
+        "quarantined": ingested["quarantined"],
+        "duplicates": ingested["duplicates"],
+    }
+
+
+def _monthly_columns(conn: sqlite3.Connection) -> dict[str, list[Any]]:
+    return frame_columns(query_monthly_mileage(conn), ["month", "distance_km"])
+
+
+def _load_columns(load_df: pd.DataFrame, rows: LoadRows) -> dict[str, list[Any]]:
+    return frame_columns(load_df if rows is None else load_df.iloc[rows], LOAD_CHART_COLUMNS)
+
+
+def _load_months(load_df: pd.DataFrame) -> list[tuple[str, int, int, str]]:
+    load_values = load_df[LOAD_CHART_COLUMNS[1:]].to_numpy(dtype="float64").round(FLOAT_DECIMALS)
+    month_keys, month_starts = np.unique(
+        load_df["date"].to_numpy().astype("datetime64[M]"), return_index=True
+    )
+    month_ends = [*month_starts[1:], len(load_df)]
+    return [
+        (str(key), int(lo), int(hi), hashlib.sha1(load_values[lo:hi].tobytes()).hexdigest()[:16])
+        for key, lo, hi in zip(month_keys, month_starts, month_ends)
+    ]
+
+
+_ENGINE = ExportEngine(
+    runs=query_runs,
+    run_count=len,
+    run_columns=frame_columns,
+    row_indices=_row_indices,
+    monthly_columns=_monthly_columns,
+    daily_distance=query_daily_run_distance,
+    training_load=training_load_series,
+    load_columns=_load_columns,
+    load_months=_load_months,
+    downsampled_series=_downsampled_series,
+)
+
+
+def build_dashboard_payload(
+    point_budget_overrides: Mapping[str, int] | None = None,
+    db_path: Path = DB_PATH,
+    profile: RunProfile | None = None,
+) -> dict[str, Any]:
+    """
+    The whole dashboard as one columnar payload (format 2).
+
+    Chart series longer than their point budget (see
+    payload.DEFAULT_POINT_BUDGETS) are downsampled; "runs" always holds
+    every run for the run table.
+    """
+    return build_payload(_ENGINE, point_budget_overrides, db_path, profile)
+
+
+def export_pwa_json(
+    output_path: Path,
+    point_budget_overrides: Mapping[str, int] | None = None,
+    db_path: Path = DB_PATH,
+    profile: RunProfile | None = None,
+) -> dict[str, Any]:
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    payload = build_dashboard_payload()
-    output_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    payload = build_dashboard_payload(point_budget_overrides, db_path, profile)
+    with stage(profile, "payload_write"):
+        write_atomic(output_path, dumps_payload(payload))
     return payload
+
+
+def export_pwa_chunks(
+    output_dir: Path,
+    point_budget_overrides: Mapping[str, int] | None = None,
+    db_path: Path = DB_PATH,
+    profile: RunProfile | None = None,
+) -> dict[str, Any]:
+    """
+    Write the dashboard as output_dir/manifest.json plus one chunk per month.
+
+    Each chunk holds that month's runs and training-load rows (columnar, as in
+    build_dashboard_payload) and is named after a hash of its content, so a
+    browser can cache it forever. A month is only re-queried and rewritten
+    when its fingerprint differs from the previous manifest; chunks no longer
+    referenced are deleted. Returns the manifest plus "chunks_written" and
+    "chunks_reused" counts.
+
+    Charts over their point budget get downsampled "series" in the manifest;
+    their "rows" index the runs and load rows of all chunks in order.
+    """
+    return export_chunks(_ENGINE, output_dir, point_budget_overrides, db_path, profile)
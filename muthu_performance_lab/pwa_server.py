@@ -0,0 +1,198 @@
+"""
+Small static file server for the PWA (replaces `python -m http.server`).
+
+- Serves pwa/ under /pwa/, one thread per request.
+- Picks the .br/.gz sibling written by the exporter when the browser accepts
+  it, so nothing is compressed per request.
+- Sends a strong ETag (hash of the bytes sent) and answers If-None-Match
+  with 304 Not Modified.
+- Content-hashed data chunks are cached for a year as immutable; everything
+  else must be revalidated, which is cheap thanks to the ETag.
+"""
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import shutil
+import threading
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from muthu_performance_lab.compression import ENCODING_SUFFIXES
+from muthu_performance_lab.config import PWA_DIR
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+URL_PREFIX = "/pwa/"
+
+# Files under these folders have a content hash in their name.
+IMMUTABLE_FOLDERS = ("data/chunks/",)
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".json": "application/json",
+    ".webmanifest": "application/manifest+json",
+    ".svg": "image/svg+xml",
+}
+
+# path -> (mtime_ns, size, etag); hashing a file once per version is enough.
+_etag_cache: Dict[str, Tuple[int, int, str]] = {}
+_etag_lock = threading.Lock()
+
+
+def file_etag(path: Path) -> Tuple[str, int]:
+    """Strong ETag and size for the current contents of `path`."""
+    stat = path.stat()
+    key = str(path)
+    with _etag_lock:
+        cached = _etag_cache.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2], stat.st_size
+
+    digest = hashlib.sha1()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    etag = f'"{digest.hexdigest()[:20]}"'
+    with _etag_lock:
+        _etag_cache[key] = (stat.st_mtime_ns, stat.st_size, etag)
+    return etag, stat.st_size
+
+
+def accepted_encodings(header: Optional[str]) -> set[str]:
+    """Encodings from an Accept-Encoding header, skipping ones with q=0."""
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so a W/ prefix is ignored."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def choose_variant(path: Path, accept_encoding: Optional[str]) -> Tuple[Path, Optional[str]]:
+    """The best precompressed sibling the client accepts, or the file itself."""
+    accepted = accepted_encodings(accept_encoding)
+    source_mtime = path.stat().st_mtime_ns
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        if encoding not in accepted:
+            continue
+        sibling = path.with_name(path.name + suffix)
+        try:
+            # A sibling older than its file (e.g. after editing app.js) is ignored.
+            if sibling.stat().st_mtime_ns >= source_mtime:
+                return sibling, encoding
+        except FileNotFoundError:
+            continue
+    return path, None
+
+
+class PwaRequestHandler(BaseHTTPRequestHandler):
+    server_version = "MuthuPerformanceLab"
+
+    def __init__(self, *args, root: Path = PWA_DIR, **kwargs) -> None:
+        self.root = root.resolve()
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self) -> None:
+        self._serve(send_body=True)
+
+    def do_HEAD(self) -> None:
+        self._serve(send_body=False)
+
+    def _resolve(self, url_path: str) -> Optional[Path]:
+        relative = unquote(url_path[len(URL_PREFIX) :])
+        if relative == "" or relative.endswith("/"):
+            relative += "index.html"
+        target = (self.root / relative).resolve()
+        # Never serve anything outside pwa/ (e.g. via "..").
+        if self.root not in target.parents or not target.is_file():
+            return None
+        return target
+
+    def _serve(self, send_body: bool) -> None:
+        url_path = urlsplit(self.path).path
+        if url_path in ("/", "/pwa"):
+            self.send_response(HTTPStatus.MOVED_PERMANENTLY)
+            self.send_header("Location", URL_PREFIX)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        target = self._resolve(url_path) if url_path.startswith(URL_PREFIX) else None
+        if target is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        body_path, encoding = choose_variant(target, self.headers.get("Accept-Encoding"))
+        etag, size = file_etag(body_path)
+        relative = target.relative_to(self.root).as_posix()
+        immutable = relative.startswith(IMMUTABLE_FOLDERS)
+
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._send_cache_headers(etag, immutable)
+            self.end_headers()
+            return
+
+        content_type = CONTENT_TYPES.get(target.suffix) or (
+            mimetypes.guess_type(target.name)[0] or "application/octet-stream"
+        )
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(size))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self._send_cache_headers(etag, immutable)
+        self.end_headers()
+
+        if send_body:
+            with body_path.open("rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+
+    def _send_cache_headers(self, etag: str, immutable: bool) -> None:
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE)
+        self.send_header("Vary", "Accept-Encoding")
+
+
+def make_server(
+    host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, root: Path = PWA_DIR
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), partial(PwaRequestHandler, root=root))
+    server.daemon_threads = True
+    return server
+
+
+def serve_pwa(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, root: Path = PWA_DIR) -> None:
+    with make_server(host, port, root) as server:
+        print(f"PWA running at: http://{host}:{port}{URL_PREFIX}")
+        print("Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
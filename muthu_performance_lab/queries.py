@@ -0,0 +1,404 @@
+"""
+Dashboard metrics computed inside SQLite.
+
+Each function here answers the same question as its pandas counterpart in
+metrics.py (which stays as the reference implementation), but filters,
+groups and sums in SQL and only returns the columns a chart needs.
+
+Totals and date-bucketed metrics read the daily_totals rollup maintained by
+database.upsert_workouts; only query_runs touches individual workouts.
+Personal records read the best_efforts index, never the record streams.
+
+The *_rows functions return plain tuples for the stdlib-only exporter
+(lite_export.py); pandas is imported inside the DataFrame versions so that
+importing this module stays cheap.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Any, Iterable
+
+from muthu_performance_lab.config import BEST_EFFORT_DISTANCES, RUN_SPORTS
+from muthu_performance_lab.session_fields import LAP_COLUMNS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Same rows as metrics.filter_runs: running sports with a usable date.
+_RUN_WHERE = "lower(sport) IN ({}) AND workout_date IS NOT NULL".format(
+    ", ".join("?" for _ in RUN_SPORTS)
+)
+_RUN_PARAMS = tuple(sorted(RUN_SPORTS))
+# daily_totals.sport is already lower-cased and only holds dated workouts.
+_ROLLUP_RUN_WHERE = "sport IN ({})".format(", ".join("?" for _ in RUN_SPORTS))
+
+# Columns query_runs can return. hr_efficiency is derived, as in load_workouts_df.
+RUN_COLUMNS = {
+    "id": "id",
+    "workout_date": "workout_date",
+    "sport": "sport",
+    "sub_sport": "sub_sport",
+    "distance_km": "distance_km",
+    "duration_min": "duration_min",
+    "avg_hr": "avg_hr",
+    "max_hr": "max_hr",
+    "avg_cadence": "avg_cadence",
+    "avg_pace_min_per_km": "avg_pace_min_per_km",
+    "calories": "calories",
+    "avg_temperature": "avg_temperature",
+    "hr_efficiency": "avg_pace_min_per_km / avg_hr",
+}
+
+
+def _date_window(start: date | None, end: date | None) -> tuple[str, tuple[Any, ...]]:
+    clauses = []
+    params: list[Any] = []
+    if start is not None:
+        clauses.append("workout_date >= ?")
+        params.append(start.isoformat())
+    if end is not None:
+        clauses.append("workout_date <= ?")
+        params.append(end.isoformat())
+    return "".join(f" AND {clause}" for clause in clauses), tuple(params)
+
+
+def _sport_filter(sports: Iterable[str] | None, rollup: bool) -> tuple[str, tuple[Any, ...]]:
+    """
+    WHERE clause for `sports` (None means RUN_SPORTS, the default everywhere).
+
+    The default keeps the exact SQL text of _RUN_WHERE / _ROLLUP_RUN_WHERE, so
+    SQLite's statement cache and the sport indexes are used the same way.
+    """
+    if sports is None:
+        return (_ROLLUP_RUN_WHERE if rollup else _RUN_WHERE), _RUN_PARAMS
+    params = tuple(sorted({sport.lower() for sport in sports}))
+    placeholders = ", ".join("?" for _ in params)
+    if rollup:
+        return f"sport IN ({placeholders})", params
+    return f"lower(sport) IN ({placeholders}) AND workout_date IS NOT NULL", params
+
+
+def query_sports(conn: sqlite3.Connection) -> list[tuple[str, int]]:
+    """Every sport with at least one dated workout and its workout count, most common first."""
+    return conn.execute(
+        """
+        SELECT sport, CAST(TOTAL(workout_count) AS INTEGER) AS workouts
+        FROM daily_totals
+        GROUP BY sport
+        ORDER BY workouts DESC, sport
+        """
+    ).fetchall()
+
+
+def query_date_range(
+    conn: sqlite3.Connection, sports: Iterable[str] | None = None
+) -> tuple[str | None, str | None]:
+    """First and last workout date (ISO strings) for `sports`."""
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    return conn.execute(
+        f"SELECT MIN(workout_date), MAX(workout_date) FROM daily_totals WHERE {sport_sql}",
+        sport_params,
+    ).fetchone()
+
+
+def query_total_runs(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> int:
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(start, end)
+    (count,) = conn.execute(
+        f"SELECT TOTAL(workout_count) FROM daily_totals WHERE {sport_sql}{window_sql}",
+        sport_params + window_params,
+    ).fetchone()
+    return int(count)
+
+
+def query_lifetime_distance_km(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> float:
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(start, end)
+    # TOTAL() treats NULL as 0 and returns 0.0 on no rows, like fillna(0).sum().
+    (total,) = conn.execute(
+        f"SELECT TOTAL(distance_km) FROM daily_totals WHERE {sport_sql}{window_sql}",
+        sport_params + window_params,
+    ).fetchone()
+    return float(total)
+
+
+def query_monthly_mileage_rows(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> list[tuple[str, float]]:
+    """(first day of month "YYYY-MM-01", distance_km) pairs, oldest first."""
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(start, end)
+    return conn.execute(
+        f"""
+        SELECT substr(workout_date, 1, 7) || '-01' AS month, TOTAL(distance_km) AS distance_km
+        FROM daily_totals
+        WHERE {sport_sql}{window_sql}
+        GROUP BY month
+        ORDER BY month
+        """,
+        sport_params + window_params,
+    ).fetchall()
+
+
+def query_monthly_mileage(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> pd.DataFrame:
+    import pandas as pd
+
+    rows = query_monthly_mileage_rows(conn, start, end, sports)
+    monthly = pd.DataFrame(rows, columns=["month", "distance_km"])
+    monthly["month"] = pd.to_datetime(monthly["month"])
+    return monthly
+
+
+def query_weekly_mileage_km(
+    conn: sqlite3.Connection, today: date | None = None, sports: Iterable[str] | None = None
+) -> float:
+    """
+    Distance since Monday of `today`'s week (default: the current week).
+
+    An explicit `today` also ends the window there, so a week in the past
+    does not count later runs.
+    """
+    week_end = today
+    today = today or date.today()
+    week_start = today - timedelta(days=today.weekday())
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(week_start, week_end)
+    (total,) = conn.execute(
+        f"SELECT TOTAL(distance_km) FROM daily_totals WHERE {sport_sql}{window_sql}",
+        sport_params + window_params,
+    ).fetchone()
+    return float(total)
+
+
+def query_training_load_ratio(
+    conn: sqlite3.Connection, end: date | None = None, sports: Iterable[str] | None = None
+) -> float:
+    """
+    Same acute:chronic ratio as metrics.training_load_ratio, in one SQL pass.
+
+    With `end`, the ratio is the one as of the last workout on or before it.
+    """
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(None, end)
+    load_7, load_28 = conn.execute(
+        f"""
+        WITH runs AS (
+            SELECT workout_date, distance_km FROM daily_totals WHERE {sport_sql}{window_sql}
+        ),
+        latest AS (SELECT MAX(workout_date) AS day FROM runs)
+        SELECT
+            TOTAL(CASE WHEN workout_date > date(latest.day, '-7 days') THEN distance_km END),
+            TOTAL(CASE WHEN workout_date > date(latest.day, '-28 days') THEN distance_km END)
+        FROM runs, latest
+        WHERE workout_date > date(latest.day, '-28 days')
+        """,
+        sport_params + window_params,
+    ).fetchone()
+
+    if load_28 <= 0:
+        return 0.0
+    return float(load_7 / (load_28 / 4.0))
+
+
+def query_daily_run_distance_rows(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> list[tuple[str, float]]:
+    """(workout_date, distance_km) for every day with a run, oldest first."""
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(start, end)
+    return conn.execute(
+        f"""
+        SELECT workout_date, TOTAL(distance_km)
+        FROM daily_totals
+        WHERE {sport_sql}{window_sql}
+        GROUP BY workout_date
+        ORDER BY workout_date
+        """,
+        sport_params + window_params,
+    ).fetchall()
+
+
+def query_daily_run_distance(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> pd.Series:
+    """Run distance per day from the rollup, shaped like metrics.daily_distance."""
+    import pandas as pd
+
+    rows = query_daily_run_distance_rows(conn, start, end, sports)
+    if not rows:
+        return pd.Series(dtype="float64")
+    days, distances = zip(*rows)
+    return pd.Series(distances, index=pd.to_datetime(list(days)), dtype="float64")
+
+
+def query_run_rows(
+    conn: sqlite3.Connection,
+    columns: list[str],
+    start: date | None = None,
+    end: date | None = None,
+    require: list[str] | None = None,
+    sports: Iterable[str] | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+    newest_first: bool = False,
+) -> list[tuple[Any, ...]]:
+    """
+    Fetch only `columns` for runs in [start, end], oldest first.
+
+    Rows where any column in `require` is NULL are dropped in SQL, mirroring
+    the dropna(subset=...) calls the charts used to make. `limit`/`offset`
+    return one page of the (optionally newest-first) order.
+    """
+    unknown = [col for col in [*columns, *(require or [])] if col not in RUN_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown run columns: {unknown}")
+
+    select_sql = ", ".join(f"{RUN_COLUMNS[col]} AS {col}" for col in columns)
+    sport_sql, sport_params = _sport_filter(sports, rollup=False)
+    window_sql, window_params = _date_window(start, end)
+    require_sql = "".join(f" AND {RUN_COLUMNS[col]} IS NOT NULL" for col in require or [])
+    order_sql = "workout_date DESC, id DESC" if newest_first else "workout_date, id"
+    page_sql, page_params = "", ()
+    if limit is not None:
+        page_sql, page_params = " LIMIT ? OFFSET ?", (limit, offset)
+    return conn.execute(
+        f"""
+        SELECT {select_sql}
+        FROM workouts
+        WHERE {sport_sql}{window_sql}{require_sql}
+        ORDER BY {order_sql}{page_sql}
+        """,
+        sport_params + window_params + page_params,
+    ).fetchall()
+
+
+def query_runs(
+    conn: sqlite3.Connection,
+    columns: list[str],
+    start: date | None = None,
+    end: date | None = None,
+    require: list[str] | None = None,
+    sports: Iterable[str] | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+    newest_first: bool = False,
+) -> pd.DataFrame:
+    """query_run_rows as a DataFrame, with workout_date parsed to datetimes."""
+    import pandas as pd
+
+    rows = query_run_rows(conn, columns, start, end, require, sports, limit, offset, newest_first)
+    df = pd.DataFrame(rows, columns=columns)
+    if "workout_date" in df:
+        df["workout_date"] = pd.to_datetime(df["workout_date"])
+    return df
+
+
+# Columns of query_best_efforts rows.
+BEST_EFFORT_COLUMNS = ["workout_id", "workout_date", "distance_m", "elapsed_s", "start_offset_s"]
+
+
+def query_best_efforts(
+    conn: sqlite3.Connection,
+    distance_m: float,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+    limit: int = 10,
+) -> list[tuple[Any, ...]]:
+    """The `limit` fastest efforts over `distance_m` in [start, end], fastest first."""
+    # best_efforts.sport is lower-cased like the rollup's.
+    sport_sql, sport_params = _sport_filter(sports, rollup=True)
+    window_sql, window_params = _date_window(start, end)
+    return conn.execute(
+        f"""
+        SELECT {", ".join(BEST_EFFORT_COLUMNS)}
+        FROM best_efforts
+        WHERE distance_m = ? AND {sport_sql}{window_sql}
+        ORDER BY elapsed_s, workout_date
+        LIMIT ?
+        """,
+        (distance_m,) + sport_params + window_params + (limit,),
+    ).fetchall()
+
+
+def query_personal_records(
+    conn: sqlite3.Connection,
+    start: date | None = None,
+    end: date | None = None,
+    sports: Iterable[str] | None = None,
+) -> dict[str, tuple[Any, ...] | None]:
+    """
+    The fastest effort per BEST_EFFORT_DISTANCES name in [start, end]
+    (a query_best_efforts row), or None where no workout covers the distance.
+    """
+    records: dict[str, tuple[Any, ...] | None] = {}
+    for name, distance_m in BEST_EFFORT_DISTANCES.items():
+        rows = query_best_efforts(conn, distance_m, start, end, sports, limit=1)
+        records[name] = rows[0] if rows else None
+    return records
+
+
+# Columns of query_laps rows.
+LAP_ROW_COLUMNS = ["lap_index", *LAP_COLUMNS]
+
+
+def query_laps(conn: sqlite3.Connection, workout_id: int) -> list[tuple[Any, ...]]:
+    """Every lap of one workout, in order, as LAP_ROW_COLUMNS tuples."""
+    return conn.execute(
+        f"SELECT {', '.join(LAP_ROW_COLUMNS)} FROM laps WHERE workout_id = ? ORDER BY lap_index",
+        (workout_id,),
+    ).fetchall()
+
+
+def query_monthly_run_fingerprints(conn: sqlite3.Connection) -> dict[str, str]:
+    """
+    A short digest of every run row in each month ("YYYY-MM").
+
+    Hashes the exact contents of every RUN_COLUMNS column (sport and
+    sub_sport included) of the month's runs in one ordered scan, so the PWA
+    export can tell which months changed without building their chunks; an
+    edit that leaves the month's totals unchanged still changes its digest.
+    """
+    select_sql = ", ".join(RUN_COLUMNS.values())
+    cursor = conn.execute(
+        f"""
+        SELECT substr(workout_date, 1, 7) AS month, {select_sql}
+        FROM workouts
+        WHERE {_RUN_WHERE}
+        ORDER BY workout_date, id
+        """,
+        _RUN_PARAMS,
+    )
+    digests: dict[str, Any] = {}
+    for month, *values in cursor:
+        digest = digests.get(month)
+        if digest is None:
+            digest = digests[month] = hashlib.sha1()
+        digest.update(repr(values).encode("utf-8"))
+    return {month: digest.hexdigest()[:16] for month, digest in digests.items()}
@@ -0,0 +1,167 @@
+"""
+Stored FIT session fields and the workout columns derived from them.
+
+Every parsed workout keeps its whole session message (as read by fit_reader
+or fitparse) in the workout_fields table, so a new or corrected column can be
+computed from the stored fields instead of decoding every FIT file again:
+
+    1. change derive_columns (and add the column to workouts in a migration)
+    2. bump DERIVED_VERSION
+    3. the next refresh, or `python export_pwa_data.py --rederive`, rewrites
+       the columns of every workout derived by an older version
+
+Lap messages use the same field names, so laps are derived the same way.
+Laps and best efforts come from the FIT file itself, not from stored fields;
+PARSE_VERSION marks which of those a stored workout has.
+
+Standard library only, so the pandas-free commands can re-derive too.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Bump whenever derive_columns changes what it returns for the same fields.
+DERIVED_VERSION = 1
+
+# Bump when ingest starts keeping something new that only the FIT file has;
+# refreshes parse workouts stored by an older version once more.
+# 1: session fields. 2: laps and best efforts. 3: enhanced_* speed and
+# altitude fields, which the fast reader used to leave out.
+PARSE_VERSION = 3
+
+# workouts columns written by derive_columns, in table order.
+DERIVED_COLUMNS = [
+    "workout_date",
+    "sport",
+    "sub_sport",
+    "distance_km",
+    "duration_min",
+    "avg_hr",
+    "max_hr",
+    "avg_cadence",
+    "avg_pace_min_per_km",
+    "calories",
+    "avg_temperature",
+]
+
+# laps columns besides workout_id and lap_index, in table order.
+LAP_COLUMNS = [
+    "start_time",
+    "distance_km",
+    "duration_min",
+    "avg_hr",
+    "max_hr",
+    "avg_cadence",
+    "avg_pace_min_per_km",
+    "calories",
+]
+
+
+def _safe_float(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_field(session_data: Dict[str, Any], keys: List[str]) -> Any:
+    for key in keys:
+        if key in session_data and session_data[key] is not None:
+            return session_data[key]
+    return None
+
+
+def derive_columns(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The DERIVED_COLUMNS of one workout, from its session fields."""
+    start_time = _get_field(session_data, ["start_time", "timestamp"])
+    if isinstance(start_time, datetime):
+        workout_date = start_time.date().isoformat()
+    else:
+        workout_date = None
+
+    distance_m = _safe_float(_get_field(session_data, ["total_distance"]))
+    distance_km = (distance_m / 1000.0) if distance_m is not None else None
+
+    duration_sec = _safe_float(_get_field(session_data, ["total_timer_time", "total_elapsed_time"]))
+    duration_min = (duration_sec / 60.0) if duration_sec is not None else None
+
+    avg_hr = _safe_float(_get_field(session_data, ["avg_heart_rate"]))
+    max_hr = _safe_float(_get_field(session_data, ["max_heart_rate"]))
+
+    # Garmin devices can use different cadence field names depending on activity type.
+    avg_cadence = _safe_float(
+        _get_field(session_data, ["avg_running_cadence", "avg_cadence"])
+    )
+
+    calories = _safe_float(_get_field(session_data, ["total_calories"]))
+    avg_temperature = _safe_float(_get_field(session_data, ["avg_temperature"]))
+
+    # Pace in minutes per kilometer.
+    avg_pace = None
+    if distance_km and duration_min and distance_km > 0:
+        avg_pace = duration_min / distance_km
+
+    sport = _get_field(session_data, ["sport"])
+    sub_sport = _get_field(session_data, ["sub_sport"])
+
+    return {
+        "workout_date": workout_date,
+        "sport": str(sport) if sport is not None else None,
+        "sub_sport": str(sub_sport) if sub_sport is not None else None,
+        "distance_km": distance_km,
+        "duration_min": duration_min,
+        "avg_hr": avg_hr,
+        "max_hr": max_hr,
+        "avg_cadence": avg_cadence,
+        "avg_pace_min_per_km": avg_pace,
+        "calories": calories,
+        "avg_temperature": avg_temperature,
+    }
+
+
+def derive_lap_columns(lap_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The LAP_COLUMNS of one lap message."""
+    columns = derive_columns(lap_data)
+    start_time = lap_data.get("start_time")
+    columns["start_time"] = start_time.isoformat() if isinstance(start_time, datetime) else None
+    return {name: columns[name] for name in LAP_COLUMNS}
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.hex()
+    # date and time values from fitparse, and anything else JSON has no type for.
+    return str(value)
+
+
+def encode_session_fields(session_data: Dict[str, Any]) -> str:
+    """
+    Compact JSON for a session field map; decode_session_fields reverses it.
+
+    Fields without a value are dropped. datetimes are stored as ISO strings
+    and listed under "datetimes" so they come back as datetimes; tuples come
+    back as lists and bytes as hex strings.
+    """
+    fields = {}
+    datetimes = []
+    for name, value in session_data.items():
+        if value is None:
+            continue
+        if isinstance(value, datetime):
+            value = value.isoformat()
+            datetimes.append(name)
+        fields[name] = value
+    payload = {"fields": fields, "datetimes": datetimes} if datetimes else {"fields": fields}
+    return json.dumps(payload, separators=(",", ":"), default=_json_value)
+
+
+def decode_session_fields(text: str) -> Dict[str, Any]:
+    payload = json.loads(text)
+    fields = payload["fields"]
+    for name in payload.get("datetimes", []):
+        fields[name] = datetime.fromisoformat(fields[name])
+    return fields
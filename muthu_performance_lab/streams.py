@@ -0,0 +1,162 @@
+"""
+Per-second record streams stored as one columnar file per activity.
+
+File layout (little endian):
+    8 bytes   magic b"MPLSTRM1"
+    4 bytes   header length N (uint32)
+    N bytes   JSON header: {"length": rows, "columns": {name: {"dtype", "offset", "missing"}}}
+    ...       data block (starts at the next 16-byte boundary): one contiguous
+              typed array per column, each 16-byte aligned; "offset" is
+              relative to the start of the data block
+
+load_stream memory-maps the file and returns NumPy views onto the column
+blocks, so reading a trace never copies or decodes anything.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from muthu_performance_lab.fit_reader import MessageLayout
+
+MAGIC = b"MPLSTRM1"
+STREAM_SUFFIX = ".stream"
+_ALIGN = 16
+
+# FIT record timestamps count from 1989-12-31; streams store Unix seconds.
+_FIT_TO_UNIX = 631065600
+
+# channel -> (record field numbers in preference order, scale, offset, dtype, missing value)
+# Floats use NaN for missing samples; integer channels use the listed sentinel.
+# Positions stay in FIT semicircles (degrees = value * 180 / 2**31).
+RECORD_CHANNELS: Dict[str, Tuple[Tuple[int, ...], float, float, str, Any]] = {
+    "timestamp": ((253,), 1, -_FIT_TO_UNIX, "<u4", 0),
+    "heart_rate": ((3,), 1, 0, "<u1", 0xFF),
+    "cadence": ((4,), 1, 0, "<u1", 0xFF),
+    "distance": ((5,), 100, 0, "<f4", float("nan")),
+    "speed": ((73, 6), 1000, 0, "<f4", float("nan")),
+    "altitude": ((78, 2), 5, 500, "<f4", float("nan")),
+    "position_lat": ((0,), 1, 0, "<i4", 0x7FFFFFFF),
+    "position_long": ((1,), 1, 0, "<i4", 0x7FFFFFFF),
+}
+
+
+def stream_file_name(source_file: str) -> str:
+    # Named after the source path so a re-parsed file overwrites its own stream.
+    return hashlib.sha1(source_file.encode("utf-8")).hexdigest()[:20] + STREAM_SUFFIX
+
+
+def build_record_columns(records: List[Tuple[MessageLayout, tuple]]) -> Dict[str, np.ndarray]:
+    """
+    Turn raw record messages from fit_reader.read_fit_activity into typed
+    columns. Channels with no valid sample in the whole activity are dropped.
+    """
+    # Records that share a definition are converted together as one 2-D array.
+    groups: Dict[int, Tuple[Dict[int, Tuple[int, Any]], List[int], List[tuple]]] = {}
+    for row_number, (layout, raw) in enumerate(records):
+        group = groups.setdefault(id(layout), (layout[2], [], []))
+        group[1].append(row_number)
+        group[2].append(raw)
+
+    converted = [
+        (field_index, np.asarray(rows, dtype=np.int64), np.asarray(raws, dtype=np.float64))
+        for field_index, rows, raws in groups.values()
+    ]
+
+    columns: Dict[str, np.ndarray] = {}
+    for name, (field_nums, scale, offset, dtype, missing) in RECORD_CHANNELS.items():
+        column = np.full(len(records), missing, dtype=dtype)
+        has_data = False
+        for field_index, rows, values in converted:
+            num = next((n for n in field_nums if n in field_index), None)
+            if num is None:
+                continue
+            position, invalid = field_index[num]
+            raw_column = values[:, position]
+            valid = raw_column == raw_column if invalid is None else raw_column != invalid
+            if valid.any():
+                has_data = True
+                column[rows[valid]] = (raw_column[valid] / scale - offset).astype(dtype)
+        if has_data:
+            columns[name] = column
+    return columns
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def write_stream(path: Path, columns: Dict[str, np.ndarray]) -> None:
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("All stream columns must have the same length")
+
+    meta: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, column in columns.items():
+        offset = _align(offset)
+        missing = RECORD_CHANNELS[name][4] if name in RECORD_CHANNELS else None
+        meta[name] = {
+            "dtype": column.dtype.str,
+            "offset": offset,
+            # NaN is not valid JSON; float channels are always NaN-padded.
+            "missing": None if isinstance(missing, float) else missing,
+        }
+        offset += column.nbytes
+
+    header = json.dumps(
+        {"length": lengths.pop() if lengths else 0, "columns": meta}, separators=(",", ":")
+    ).encode("utf-8")
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for name, column in columns.items():
+            f.seek(data_start + meta[name]["offset"])
+            f.write(np.ascontiguousarray(column).tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_stream(path: Path) -> Dict[str, np.ndarray]:
+    """Memory-map a stream file and return read-only, zero-copy column views."""
+    with path.open("rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a stream file: {path}")
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len))
+
+    length = header["length"]
+    if length == 0:
+        return {
+            name: np.empty(0, dtype=meta["dtype"]) for name, meta in header["columns"].items()
+        }
+
+    data_start = _align(len(MAGIC) + 4 + header_len)
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    columns: Dict[str, np.ndarray] = {}
+    for name, meta in header["columns"].items():
+        dtype = np.dtype(meta["dtype"])
+        start = data_start + meta["offset"]
+        columns[name] = buffer[start : start + length * dtype.itemsize].view(dtype)
+    return columns
+
+
+def load_workout_stream(
+    conn: sqlite3.Connection, workout_id: int, streams_dir: Path
+) -> Optional[Dict[str, np.ndarray]]:
+    """Return the memory-mapped record columns for one workout, or None if not stored."""
+    row = conn.execute(
+        "SELECT stream_file FROM workout_streams WHERE workout_id = ?", (workout_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return load_stream(streams_dir / row[0])
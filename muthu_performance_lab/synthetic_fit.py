@@ -0,0 +1,367 @@
+"""
+Deterministic synthetic FIT activities in a GARMIN-shaped folder tree.
+
+Used by benchmark.py to build histories of any size without a real watch.
+Each activity is a valid FIT file (header and file CRCs included) with a
+file_id message, one record message every `record_interval` seconds
+(time, heart rate, cadence, distance, speed, altitude, position), a lap
+message every AUTO_LAP_M metres and a session summary, written to
+GARMIN/Activity/<start time>.fit the way Garmin devices name them. A
+fraction of the files is deliberately broken (truncated, garbage, bad
+header, no session) so failure handling is exercised too.
+
+The same arguments always produce byte-identical files.
+"""
+from __future__ import annotations
+
+import json
+import random
+import shutil
+import struct
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from muthu_performance_lab.fit_reader import (
+    FIT_EPOCH,
+    MESG_FILE_ID,
+    MESG_LAP,
+    MESG_RECORD,
+    MESG_SESSION,
+    SPORTS,
+)
+
+# Share of activities per sport, as a Garmin history of a runner looks.
+DEFAULT_SPORT_MIX: Dict[str, float] = {
+    "running": 0.7,
+    "cycling": 0.15,
+    "walking": 0.1,
+    "swimming": 0.05,
+}
+# Activity length range in minutes.
+DEFAULT_DURATION_MIN: Tuple[int, int] = (20, 90)
+# Seconds between record messages ("smart recording" on most watches).
+DEFAULT_RECORD_INTERVAL = 5
+DEFAULT_CORRUPT_FRACTION = 0.01
+DEFAULT_FIRST_DAY = datetime(2012, 1, 1)
+
+# Lap length, as the auto lap setting of most watches.
+AUTO_LAP_M = 1000
+
+CORRUPT_KINDS = ("truncated", "garbage", "bad_header", "no_session")
+# Written next to Activity/ so an unchanged tree is not generated twice.
+SPEC_NAME = "synthetic.json"
+# Part of the spec; bump when build_activity writes different files, so
+# trees from an older generator are not reused. 2: lap messages.
+GENERATOR_FORMAT = 2
+
+# sport -> (speed range in m/s, cadence range, heart rate range)
+SPORT_PROFILES: Dict[str, Tuple[Tuple[float, float], Tuple[int, int], Tuple[int, int]]] = {
+    "running": ((2.4, 3.9), (80, 92), (130, 170)),
+    "cycling": ((5.5, 9.0), (75, 95), (115, 155)),
+    "walking": ((1.2, 1.7), (50, 62), (90, 120)),
+    "swimming": ((0.7, 1.1), (0, 0), (110, 150)),
+}
+_SPORT_NUMBERS = {name: number for number, name in SPORTS.items()}
+
+_FIT_PROTOCOL = 0x20
+_FIT_PROFILE = 2132
+_DEVICE_SERIAL = 3_900_000_000
+_MANUFACTURER_GARMIN = 1
+_FILE_ACTIVITY = 4
+_NO_CADENCE = 0xFF
+
+# (field number, base type) per message; base types as in fit_reader._BASE_TYPES.
+_FILE_ID_FIELDS = [(0, 0x00), (1, 0x84), (2, 0x84), (3, 0x8C), (4, 0x86)]
+_RECORD_FIELDS = [
+    (253, 0x86), (0, 0x85), (1, 0x85), (3, 0x02), (4, 0x02), (5, 0x86), (6, 0x84), (2, 0x84),
+]
+_SESSION_FIELDS = [
+    (253, 0x86), (2, 0x86), (5, 0x00), (6, 0x00), (7, 0x86), (8, 0x86), (9, 0x86),
+    (11, 0x84), (14, 0x84), (16, 0x02), (17, 0x02), (18, 0x02), (57, 0x01),
+]
+_LAP_FIELDS = [
+    (254, 0x84), (253, 0x86), (2, 0x86), (7, 0x86), (8, 0x86), (9, 0x86),
+    (15, 0x02), (16, 0x02), (17, 0x02),
+]
+_STRUCT_CODES = {0x00: "B", 0x01: "b", 0x02: "B", 0x84: "H", 0x85: "i", 0x86: "I", 0x8C: "I"}
+
+
+def _crc_table() -> List[int]:
+    # CRC-16 as defined by the FIT SDK (reflected polynomial 0xA001).
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def fit_crc(data: bytes, crc: int = 0) -> int:
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def _definition(local: int, global_num: int, fields: List[Tuple[int, int]]) -> bytes:
+    out = struct.pack("<BBBHB", 0x40 | local, 0, 0, global_num, len(fields))
+    for num, base_type in fields:
+        out += struct.pack("<BBB", num, struct.calcsize(_STRUCT_CODES[base_type]), base_type)
+    return out
+
+
+def _message(local: int, fields: List[Tuple[int, int]]) -> struct.Struct:
+    # Packs the one-byte data header followed by the field values.
+    return struct.Struct("<B" + "".join(_STRUCT_CODES[base_type] for _, base_type in fields))
+
+
+_FILE_ID = _message(0, _FILE_ID_FIELDS)
+_RECORD = _message(1, _RECORD_FIELDS)
+_SESSION = _message(2, _SESSION_FIELDS)
+_LAP = _message(3, _LAP_FIELDS)
+
+
+def _fit_time(moment: datetime) -> int:
+    return int((moment - FIT_EPOCH).total_seconds())
+
+
+def _wrap_fit(body: bytes) -> bytes:
+    header = struct.pack("<BBHI4s", 14, _FIT_PROTOCOL, _FIT_PROFILE, len(body), b".FIT")
+    header += struct.pack("<H", fit_crc(header))
+    data = header + body
+    return data + struct.pack("<H", fit_crc(data))
+
+
+def build_activity(
+    start: datetime,
+    duration_s: int,
+    sport: str = "running",
+    seed: int = 0,
+    record_interval: int = DEFAULT_RECORD_INTERVAL,
+    with_session: bool = True,
+) -> bytes:
+    """One FIT activity file as bytes; the same arguments give the same bytes."""
+    rnd = random.Random(seed)
+    (speed_lo, speed_hi), (cadence_lo, cadence_hi), (hr_lo, hr_hi) = SPORT_PROFILES[sport]
+    start_ts = _fit_time(start)
+    base_speed = rnd.uniform(speed_lo, speed_hi)
+    base_hr = rnd.uniform(hr_lo, hr_hi - 10)
+    # Somewhere around Chennai, in FIT semicircles.
+    lat = int((13.0 + rnd.random() * 0.1) * 2**31 / 180)
+    lon = int((80.2 + rnd.random() * 0.1) * 2**31 / 180)
+
+    parts = [
+        _definition(0, MESG_FILE_ID, _FILE_ID_FIELDS),
+        _FILE_ID.pack(0, _FILE_ACTIVITY, _MANUFACTURER_GARMIN, 0, _DEVICE_SERIAL, start_ts),
+        _definition(1, MESG_RECORD, _RECORD_FIELDS),
+        _definition(3, MESG_LAP, _LAP_FIELDS),
+    ]
+    distance = 0.0
+    altitude = 20.0 + rnd.random() * 30
+    hr_sum = hr_max = cadence_sum = samples = 0
+    pack_record = _RECORD.pack
+    # Running totals of the current lap.
+    lap = {
+        "index": 0, "start": 0, "distance": 0.0, "hr": 0, "hr_max": 0, "cadence": 0, "samples": 0,
+    }
+
+    def close_lap(offset: int) -> None:
+        samples_in_lap = lap["samples"]
+        parts.append(
+            _LAP.pack(
+                3, lap["index"], start_ts + offset, start_ts + lap["start"],
+                (offset - lap["start"]) * 1000, (offset - lap["start"]) * 1000,
+                int((distance - lap["distance"]) * 100), lap["hr"] // samples_in_lap,
+                lap["hr_max"], lap["cadence"] // samples_in_lap if cadence_hi else _NO_CADENCE,
+            )
+        )
+        lap.update(
+            index=lap["index"] + 1, start=offset, distance=distance,
+            hr=0, hr_max=0, cadence=0, samples=0,
+        )
+
+    for offset in range(0, duration_s + 1, record_interval):
+        speed = max(base_speed * (0.9 + rnd.random() * 0.2), 0.1)
+        if offset:
+            distance += speed * record_interval
+        altitude = min(max(altitude + rnd.uniform(-0.5, 0.5), 0.0), 200.0)
+        # Heart rate drifts up through the activity, as it does on long runs.
+        hr = int(base_hr + 10 * offset / max(duration_s, 1) + rnd.randint(-3, 3))
+        cadence = rnd.randint(cadence_lo, cadence_hi) if cadence_hi else _NO_CADENCE
+        lat += rnd.randint(-400, 400)
+        lon += rnd.randint(-400, 400)
+        parts.append(
+            pack_record(
+                1, start_ts + offset, lat, lon, hr, cadence,
+                int(distance * 100), int(speed * 1000), int((altitude + 500) * 5),
+            )
+        )
+        hr_sum += hr
+        hr_max = max(hr_max, hr)
+        cadence_sum += 0 if cadence == _NO_CADENCE else cadence
+        samples += 1
+        lap["hr"] += hr
+        lap["hr_max"] = max(lap["hr_max"], hr)
+        lap["cadence"] += 0 if cadence == _NO_CADENCE else cadence
+        lap["samples"] += 1
+        if distance - lap["distance"] >= AUTO_LAP_M:
+            close_lap(offset)
+    if lap["samples"]:
+        close_lap(offset)
+
+    if with_session:
+        avg_cadence = cadence_sum // samples if cadence_hi else _NO_CADENCE
+        parts.append(_definition(2, MESG_SESSION, _SESSION_FIELDS))
+        parts.append(
+            _SESSION.pack(
+                2, start_ts + duration_s, start_ts, _SPORT_NUMBERS[sport], 0,
+                duration_s * 1000, duration_s * 1000, int(distance * 100),
+                int(duration_s / 60 * rnd.uniform(9, 13)), int(distance / duration_s * 1000),
+                hr_sum // samples, hr_max, avg_cadence, rnd.randint(18, 32),
+            )
+        )
+    return _wrap_fit(b"".join(parts))
+
+
+def corrupt_activity(data: bytes, kind: str, seed: int = 0) -> bytes:
+    """A broken variant of a valid FIT file; `kind` is one of CORRUPT_KINDS."""
+    rnd = random.Random(seed)
+    if kind == "truncated":
+        return data[: len(data) // 2]
+    if kind == "garbage":
+        return rnd.randbytes(max(len(data) // 4, 64))
+    if kind == "bad_header":
+        return data[:8] + b"XFIT" + data[12:]
+    raise ValueError(f"Unknown corrupt kind {kind!r}; no_session is built, not corrupted")
+
+
+def _pick_sport(rnd: random.Random, sport_mix: Mapping[str, float]) -> str:
+    return rnd.choices(list(sport_mix), weights=list(sport_mix.values()))[0]
+
+
+def generate_garmin_tree(
+    garmin_root: Path,
+    activities: int,
+    seed: int = 0,
+    sport_mix: Mapping[str, float] = DEFAULT_SPORT_MIX,
+    duration_min: Tuple[int, int] = DEFAULT_DURATION_MIN,
+    record_interval: int = DEFAULT_RECORD_INTERVAL,
+    corrupt_fraction: float = DEFAULT_CORRUPT_FRACTION,
+    first_day: datetime = DEFAULT_FIRST_DAY,
+) -> Dict[str, Any]:
+    """
+    Write `activities` FIT files to garmin_root/Activity and return a summary.
+
+    Activities are spread roughly one per day from `first_day`, with a
+    sport drawn from `sport_mix` and a length drawn from `duration_min`
+    (minutes). round(activities * corrupt_fraction) of them are written
+    broken, cycling through CORRUPT_KINDS. The summary ("spec", "files",
+    "valid", "corrupt", "bytes", "sports") is also saved as synthetic.json.
+    """
+    unknown = set(sport_mix) - set(SPORT_PROFILES)
+    if unknown:
+        raise ValueError(f"No synthetic profile for sports: {', '.join(sorted(unknown))}")
+
+    spec = _spec(
+        activities, seed, sport_mix, duration_min, record_interval, corrupt_fraction, first_day
+    )
+    activity_dir = garmin_root / "Activity"
+    shutil.rmtree(activity_dir, ignore_errors=True)
+    activity_dir.mkdir(parents=True)
+
+    rnd = random.Random(seed)
+    corrupt_count = round(activities * corrupt_fraction)
+    corrupt_at = dict(
+        zip(sorted(rnd.sample(range(activities), corrupt_count)), CORRUPT_KINDS * activities)
+    )
+    sports: Dict[str, int] = {}
+    total_bytes = 0
+    day = previous = first_day
+    for index in range(activities):
+        # Mostly one activity a day, sometimes a rest day or a double.
+        day += timedelta(days=rnd.choice((0, 1, 1, 1, 1, 2)))
+        start = day + timedelta(
+            hours=rnd.randint(5, 19), minutes=rnd.randint(0, 59), seconds=rnd.randint(0, 59)
+        )
+        # Start times only move forward, which also keeps file names unique.
+        start = max(start, previous + timedelta(hours=2))
+        previous = start
+        sport = _pick_sport(rnd, sport_mix)
+        duration_s = rnd.randint(duration_min[0] * 60, duration_min[1] * 60)
+        file_seed = rnd.getrandbits(32)
+
+        kind = corrupt_at.get(index)
+        data = build_activity(
+            start, duration_s, sport, file_seed, record_interval, with_session=kind != "no_session"
+        )
+        if kind is not None and kind != "no_session":
+            data = corrupt_activity(data, kind, file_seed)
+        if kind is None:
+            sports[sport] = sports.get(sport, 0) + 1
+
+        (activity_dir / f"{start:%Y-%m-%d-%H-%M-%S}.fit").write_bytes(data)
+        total_bytes += len(data)
+
+    summary = {
+        "spec": spec,
+        "files": activities,
+        "valid": activities - corrupt_count,
+        "corrupt": corrupt_count,
+        "bytes": total_bytes,
+        "sports": dict(sorted(sports.items())),
+    }
+    (garmin_root / SPEC_NAME).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
+
+
+def ensure_garmin_tree(garmin_root: Path, activities: int, **options: Any) -> Dict[str, Any]:
+    """Like generate_garmin_tree, but reuses a tree already generated with the same arguments."""
+    summary = _read_summary(garmin_root)
+    wanted = _spec(
+        activities,
+        options.get("seed", 0),
+        options.get("sport_mix", DEFAULT_SPORT_MIX),
+        options.get("duration_min", DEFAULT_DURATION_MIN),
+        options.get("record_interval", DEFAULT_RECORD_INTERVAL),
+        options.get("corrupt_fraction", DEFAULT_CORRUPT_FRACTION),
+        options.get("first_day", DEFAULT_FIRST_DAY),
+    )
+    if summary is not None and summary.get("spec") == wanted:
+        activity_dir = garmin_root / "Activity"
+        if activity_dir.is_dir() and sum(1 for _ in activity_dir.glob("*.fit")) == activities:
+            return summary
+    return generate_garmin_tree(garmin_root, activities, **options)
+
+
+def _spec(
+    activities: int,
+    seed: int,
+    sport_mix: Mapping[str, float],
+    duration_min: Tuple[int, int],
+    record_interval: int,
+    corrupt_fraction: float,
+    first_day: datetime,
+) -> Dict[str, Any]:
+    # JSON-shaped, so it compares equal after a round trip through synthetic.json.
+    return {
+        "format": GENERATOR_FORMAT,
+        "activities": activities,
+        "seed": seed,
+        "sport_mix": dict(sport_mix),
+        "duration_min": list(duration_min),
+        "record_interval": record_interval,
+        "corrupt_fraction": corrupt_fraction,
+        "first_day": first_day.isoformat(),
+    }
+
+
+def _read_summary(garmin_root: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads((garmin_root / SPEC_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,201 @@
+"""
+Watch GARMIN/Activity and hand new or removed FIT files to a callback
+(or, with watch_file, a single ZIP export to re-read when it changes).
+
+Polling is used so it behaves the same on macOS and Linux. Each poll only
+lists folders whose modification time changed since the previous poll
+(adding or removing a file updates its folder's mtime), so an idle watch
+costs one stat per folder. Files that are still being copied are
+re-checked on every poll until their size and mtime have been stable for
+`debounce` seconds; the whole burst is then handed over in one call.
+A full rescan every `full_scan_every` seconds catches in-place rewrites.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+FileState = Tuple[int, int]  # (mtime_ns, size)
+# folder -> (folder mtime_ns, {fit path: FileState}, [subfolders])
+FolderState = Dict[str, Tuple[int, Dict[str, FileState], List[str]]]
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_FULL_SCAN_EVERY = 300.0
+
+
+def scan_folder_tree(root: Path, previous: FolderState) -> FolderState:
+    """Snapshot every .fit file under `root`, reusing unchanged folders from `previous`."""
+    state: FolderState = {}
+    stack = [str(root)]
+    while stack:
+        folder = stack.pop()
+        try:
+            folder_mtime = os.stat(folder).st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+        cached = previous.get(folder)
+        if cached is not None and cached[0] == folder_mtime:
+            state[folder] = cached
+            stack.extend(cached[2])
+            continue
+
+        files: Dict[str, FileState] = {}
+        subfolders: List[str] = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                    elif entry.name.lower().endswith(".fit") and entry.is_file():
+                        stat = entry.stat()
+                        files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    # Deleted between listing and stat.
+                    continue
+        state[folder] = (folder_mtime, files, subfolders)
+        stack.extend(subfolders)
+    return state
+
+
+def fit_files_in(state: FolderState) -> Dict[str, FileState]:
+    return {
+        path: file_state for _, files, _ in state.values() for path, file_state in files.items()
+    }
+
+
+def _stat_file(path: str) -> Optional[FileState]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch_folder(
+    root: Path,
+    on_changes: Callable[[List[Path], List[Path]], None],
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    debounce: float = DEFAULT_DEBOUNCE,
+    full_scan_every: float = DEFAULT_FULL_SCAN_EVERY,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Call `on_changes(new_or_changed, removed)` after each settled burst of changes.
+
+    Files present when the watch starts are treated as already handled (run a
+    normal refresh first). Runs until `stop` is set or the process is
+    interrupted. If `on_changes` raises, the same files are offered again
+    after the next debounce period.
+    """
+    stop = stop or threading.Event()
+    state = scan_folder_tree(root, {})
+    known = fit_files_in(state)
+    last_full_scan = time.monotonic()
+    # path -> (latest FileState, when it last changed)
+    pending: Dict[str, Tuple[FileState, float]] = {}
+    removed: Dict[str, float] = {}
+
+    while not stop.wait(poll_interval):
+        now = time.monotonic()
+        if now - last_full_scan >= full_scan_every:
+            state = scan_folder_tree(root, {})
+            last_full_scan = now
+        else:
+            state = scan_folder_tree(root, state)
+        current = fit_files_in(state)
+
+        for path, file_state in current.items():
+            if path not in pending and known.get(path) != file_state:
+                pending[path] = (file_state, now)
+
+        # A file that is still being written keeps its folder mtime, so
+        # pending files are re-checked directly. The cached folder entry is
+        # updated too, otherwise the next poll would see the stale size.
+        for path, (file_state, _) in list(pending.items()):
+            latest = _stat_file(path)
+            folder_files = state.get(os.path.dirname(path), (0, {}, []))[1]
+            if latest is None:
+                del pending[path]
+                current.pop(path, None)
+                folder_files.pop(path, None)
+            elif latest != file_state:
+                pending[path] = (latest, now)
+                current[path] = latest
+                folder_files[path] = latest
+
+        for path in known.keys() - current.keys():
+            removed.setdefault(path, now)
+        for path in current.keys() & removed.keys():
+            del removed[path]
+
+        if not pending and not removed:
+            known = current
+            continue
+        last_change = max(
+            [changed_at for _, changed_at in pending.values()] + list(removed.values())
+        )
+        if now - last_change < debounce:
+            continue
+
+        try:
+            on_changes(
+                [Path(path) for path in sorted(pending)], [Path(path) for path in sorted(removed)]
+            )
+        except Exception as exc:  # noqa: BLE001
+            print(f"Watcher: could not process changes ({exc}); retrying after the next pause.")
+            for path, (file_state, _) in pending.items():
+                pending[path] = (file_state, now)
+            for path in removed:
+                removed[path] = now
+            continue
+
+        known = current
+        pending.clear()
+        removed.clear()
+
+
+def watch_file(
+    path: Path,
+    on_change: Callable[[], None],
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    debounce: float = DEFAULT_DEBOUNCE,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Call `on_change()` each time `path` (e.g. a ZIP export) changes and has
+    then kept the same size and mtime for `debounce` seconds.
+
+    Used instead of watch_folder for archives: the caller re-reads the whole
+    file, and unchanged members are skipped by their change key. Retries the
+    same way when `on_change` raises.
+    """
+    stop = stop or threading.Event()
+    known = _stat_file(str(path))
+    # (latest FileState, when it last changed) while a change is settling.
+    pending: Optional[Tuple[Optional[FileState], float]] = None
+
+    while not stop.wait(poll_interval):
+        now = time.monotonic()
+        latest = _stat_file(str(path))
+        if pending is None:
+            if latest == known:
+                continue
+            pending = (latest, now)
+        elif latest != pending[0]:
+            pending = (latest, now)
+        if now - pending[1] < debounce or latest is None:
+            continue
+
+        try:
+            on_change()
+        except Exception as exc:  # noqa: BLE001
+            print(f"Watcher: could not process changes ({exc}); retrying after the next pause.")
+            pending = (latest, now)
+            continue
+        known = latest
+        pending = None
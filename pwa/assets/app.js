@@ -1,8 +1,233 @@
+const MANIFEST_URL = "./data/manifest.json";
 const DATA_URL = "./data/dashboard_data.json";
-const CHART_W = 640;
-const CHART_H = 280;
+// Local JSON API (api_server.py, started by serve_pwa.py). It adds date and
+// sport filters; without it the static export above is used.
+const API_URL = `${window.location.protocol}//${window.location.hostname}:8766/api/`;
+const API_TIMEOUT_MS = 3000;
 const PAD = 28;
 
+// Turn {col: [values]} into [{col: value}, ...] for the given row positions.
+function columnsToRows(columns, rows) {
+  const names = Object.keys(columns);
+  return rows.map((i) => {
+    const row = {};
+    names.forEach((name) => {
+      row[name] = columns[name][i];
+    });
+    return row;
+  });
+}
+
+function range(length) {
+  return Array.from({ length }, (_, i) => i);
+}
+
+// Points for one series spec. Downsampled series (see downsample.py) come
+// from a series of "length" points and list the "positions" they keep (the
+// same as "rows" when omitted). Every point gets _x, its place along the x
+// axis from 0 to 1, so kept points are spaced as in the full chart.
+function seriesPoints(spec, runs) {
+  let points;
+  if (spec.columns) {
+    const first = Object.values(spec.columns)[0] || [];
+    points = columnsToRows(spec.columns, spec.rows || range(first.length));
+  } else {
+    const runCount = runs.workout_date.length;
+    points = columnsToRows(runs, spec.rows === "all" ? range(runCount) : spec.rows);
+  }
+  const length = spec.length || points.length;
+  const positions = spec.positions || (spec.length ? spec.rows : null);
+  points.forEach((point, k) => {
+    const position = positions ? positions[k] : k;
+    point._x = length > 1 ? position / (length - 1) : 0.5;
+  });
+  return points;
+}
+
+// The export stores run columns once (see pwa_export.build_dashboard_payload);
+// rebuild the per-series row arrays the renderers expect.
+function decodePayload(payload) {
+  if (payload.format !== 2 || !payload.has_data) return payload;
+
+  const series = {};
+  Object.entries(payload.series).forEach(([name, spec]) => {
+    // The run table reads payload.runs directly (see renderTable).
+    if (name !== "run_table") series[name] = seriesPoints(spec, payload.runs);
+  });
+  return { ...payload, series };
+}
+
+function appendColumns(target, columns) {
+  Object.entries(columns).forEach(([name, values]) => {
+    if (!target[name]) target[name] = [];
+    values.forEach((value) => target[name].push(value));
+  });
+}
+
+// Row positions where none of the `required` columns is null.
+function rowsWhere(columns, required) {
+  const rows = [];
+  columns[required[0]].forEach((_, i) => {
+    if (required.every((name) => columns[name][i] !== null)) rows.push(i);
+  });
+  return rows;
+}
+
+// Chunk files are named by content hash, so an unchanged month keeps its URL
+// and is served from the service worker cache instead of the network.
+async function fetchChunk(file) {
+  const resp = await fetch(`./data/${file}`);
+  if (!resp.ok) throw new Error(`HTTP ${resp.status} for ${file}`);
+  return resp.json();
+}
+
+// Stitch the manifest and its month chunks back into the single-file layout.
+async function loadChunkedPayload(manifest) {
+  if (!manifest.has_data) return manifest;
+
+  const chunks = await Promise.all(manifest.chunks.map((chunk) => fetchChunk(chunk.file)));
+  const runs = {};
+  const load = {};
+  chunks.forEach((chunk) => {
+    appendColumns(runs, chunk.runs);
+    appendColumns(load, chunk.training_load);
+  });
+
+  // Downsampled series from the manifest index into the stitched columns.
+  const sampled = manifest.series || {};
+  const scatterRows = { rows: rowsWhere(runs, ["avg_hr", "avg_pace_min_per_km"]) };
+  return {
+    format: 2,
+    generated_at: manifest.generated_at,
+    has_data: true,
+    kpis: manifest.kpis,
+    runs,
+    series: {
+      monthly_mileage: manifest.monthly_mileage,
+      training_load: { columns: load, ...sampled.training_load },
+      pace_vs_hr: sampled.pace_vs_hr || scatterRows,
+      cadence_trend: sampled.cadence_trend || { rows: rowsWhere(runs, ["avg_cadence"]) },
+      distance_trend: sampled.distance_trend || { rows: "all" },
+      run_table: { rows: "all" },
+    },
+  };
+}
+
+async function fetchStaticPayload() {
+  const resp = await fetch(MANIFEST_URL, { cache: "no-store" });
+  if (resp.ok) return loadChunkedPayload(await resp.json());
+
+  // Exports made with --output only have the single JSON file.
+  const single = await fetch(DATA_URL, { cache: "no-store" });
+  if (!single.ok) throw new Error(`HTTP ${single.status}`);
+  return single.json();
+}
+
+async function fetchApi(endpoint, params) {
+  const url = new URL(endpoint, API_URL);
+  Object.entries(params).forEach(([name, value]) => {
+    if (value) url.searchParams.set(name, value);
+  });
+  const resp = await fetch(url, { signal: AbortSignal.timeout(API_TIMEOUT_MS) });
+  if (!resp.ok) throw new Error(`HTTP ${resp.status} for ${endpoint}`);
+  return resp.json();
+}
+
+// Build the same payload as the static export from the API, for `filters`
+// ({ start, end, sport }). Runs arrive in pages, fetched in parallel.
+async function loadApiPayload(filters, retries = 1) {
+  const [meta, kpis, monthly, load, first] = await Promise.all([
+    fetchApi("meta", filters),
+    fetchApi("kpis", filters),
+    fetchApi("monthly_mileage", filters),
+    fetchApi("load", filters),
+    fetchApi("runs", { ...filters, page_size: 5000 }),
+  ]);
+  const rest = await Promise.all(
+    range(first.pages - 1).map((k) =>
+      fetchApi("runs", { ...filters, page_size: first.page_size, page: k + 2 })
+    )
+  );
+  const parts = [meta, kpis, monthly, load, first, ...rest];
+  // An ingest finished while loading: start over so all parts match.
+  if (parts.some((part) => part.data_version !== meta.data_version)) {
+    if (retries > 0) return loadApiPayload(filters, retries - 1);
+    throw new Error("Data kept changing while loading from the API");
+  }
+
+  setupFilters(meta);
+  const generatedAt = `live, data version ${meta.data_version}`;
+  if (!first.total) {
+    const message = "No runs match these filters.";
+    return { format: 2, generated_at: generatedAt, has_data: false, message };
+  }
+
+  const runs = {};
+  [first, ...rest].forEach((page) => appendColumns(runs, page.runs));
+  return {
+    format: 2,
+    generated_at: generatedAt,
+    has_data: true,
+    kpis: kpis.kpis,
+    runs,
+    series: {
+      monthly_mileage: { columns: monthly.columns },
+      training_load: { columns: load.columns },
+      pace_vs_hr: { rows: rowsWhere(runs, ["avg_hr", "avg_pace_min_per_km"]) },
+      cadence_trend: { rows: rowsWhere(runs, ["avg_cadence"]) },
+      distance_trend: { rows: "all" },
+    },
+  };
+}
+
+// Filled once from /api/meta; the form stays hidden when the API is offline.
+function setupFilters(meta) {
+  const form = document.getElementById("filters");
+  const select = document.getElementById("filterSport");
+  if (!form.hidden) return;
+  meta.sports.forEach(({ sport, workouts }) => {
+    const option = document.createElement("option");
+    option.value = sport;
+    option.textContent = `${sport} (${workouts})`;
+    // Reset goes back to running, the sport the static export shows.
+    option.defaultSelected = sport === "running";
+    select.appendChild(option);
+  });
+  if (meta.sports.length > 1) {
+    const option = document.createElement("option");
+    option.value = "all";
+    option.textContent = "all sports";
+    select.appendChild(option);
+  }
+  ["filterStart", "filterEnd"].forEach((id) => {
+    const input = document.getElementById(id);
+    input.min = meta.first_date || "";
+    input.max = meta.last_date || "";
+  });
+  form.hidden = false;
+}
+
+function currentFilters() {
+  const form = document.getElementById("filters");
+  if (form.hidden) return {};
+  return {
+    start: document.getElementById("filterStart").value,
+    end: document.getElementById("filterEnd").value,
+    sport: document.getElementById("filterSport").value,
+  };
+}
+
+async function fetchPayload() {
+  try {
+    return await loadApiPayload(currentFilters());
+  } catch (err) {
+    // Offline or started without the API: the static export has everything
+    // except the filters.
+    document.getElementById("filters").hidden = true;
+    return fetchStaticPayload();
+  }
+}
+
 function fmtNum(n, digits = 1) {
   if (n === null || n === undefined || Number.isNaN(Number(n))) return "-";
   return Number(n).toFixed(digits);
@@ -19,121 +244,164 @@ function paceLabel(minPerKm) {
   return `${m}:${String(s).padStart(2, "0")} /km`;
 }
 
-function yScale(value, min, max) {
-  if (max === min) return CHART_H / 2;
-  const pct = (value - min) / (max - min);
-  return CHART_H - PAD - pct * (CHART_H - PAD * 2);
+// Charts are drawn on <canvas>: one draw call per point instead of one DOM
+// node, so long histories do not slow down layout or use much memory.
+function setupCanvas(canvasId) {
+  const canvas = document.getElementById(canvasId);
+  const width = canvas.clientWidth;
+  const height = canvas.clientHeight;
+  const ratio = window.devicePixelRatio || 1;
+  // The backing store matches the on-screen size, so lines stay sharp.
+  if (canvas.width !== Math.round(width * ratio) || canvas.height !== Math.round(height * ratio)) {
+    canvas.width = Math.round(width * ratio);
+    canvas.height = Math.round(height * ratio);
+  }
+  const ctx = canvas.getContext("2d");
+  ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+  ctx.clearRect(0, 0, width, height);
+  return { ctx, width, height };
 }
 
-function xScale(i, total) {
-  if (total <= 1) return CHART_W / 2;
-  const pct = i / (total - 1);
-  return PAD + pct * (CHART_W - PAD * 2);
+function drawAxes(chart) {
+  const { ctx, width, height } = chart;
+  ctx.beginPath();
+  ctx.moveTo(PAD, PAD);
+  ctx.lineTo(PAD, height - PAD);
+  ctx.lineTo(width - PAD, height - PAD);
+  ctx.strokeStyle = "#a8b3ac";
+  ctx.lineWidth = 1;
+  ctx.stroke();
 }
 
-function clearSvg(svg) {
-  while (svg.firstChild) svg.removeChild(svg.firstChild);
+// Min and max without spreading a long array into Math.min/Math.max.
+function extent(values) {
+  let min = Infinity;
+  let max = -Infinity;
+  values.forEach((v) => {
+    if (Number.isNaN(v)) return;
+    if (v < min) min = v;
+    if (v > max) max = v;
+  });
+  return [min, max];
 }
 
-function addAxes(svg) {
-  const axis = document.createElementNS("http://www.w3.org/2000/svg", "path");
-  axis.setAttribute("d", `M ${PAD} ${PAD} V ${CHART_H - PAD} H ${CHART_W - PAD}`);
-  axis.setAttribute("stroke", "#a8b3ac");
-  axis.setAttribute("fill", "none");
-  axis.setAttribute("stroke-width", "1");
-  svg.appendChild(axis);
+function yScale(chart, value, min, max) {
+  if (max === min) return chart.height / 2;
+  const pct = (value - min) / (max - min);
+  return chart.height - PAD - pct * (chart.height - PAD * 2);
+}
+
+// Points carry _x (0 to 1) from seriesPoints.
+function xScale(chart, point) {
+  return PAD + point._x * (chart.width - PAD * 2);
+}
+
+function strokeSeries(chart, points, valueKey, min, max, color, lineWidth) {
+  const { ctx } = chart;
+  ctx.beginPath();
+  points.forEach((p, i) => {
+    const x = xScale(chart, p);
+    const y = yScale(chart, Number(p[valueKey]), min, max);
+    if (i === 0) ctx.moveTo(x, y);
+    else ctx.lineTo(x, y);
+  });
+  ctx.strokeStyle = color;
+  ctx.lineWidth = lineWidth;
+  ctx.lineJoin = "round";
+  ctx.stroke();
 }
 
-function renderLine(svgId, points, valueKey, color) {
-  const svg = document.getElementById(svgId);
-  clearSvg(svg);
-  addAxes(svg);
+function renderLine(canvasId, points, valueKey, color) {
+  const chart = setupCanvas(canvasId);
+  drawAxes(chart);
   if (!points.length) return;
 
-  const vals = points.map((p) => Number(p[valueKey])).filter((v) => !Number.isNaN(v));
-  const min = Math.min(...vals);
-  const max = Math.max(...vals);
-
-  const d = points
-    .map((p, i) => {
-      const x = xScale(i, points.length);
-      const y = yScale(Number(p[valueKey]), min, max);
-      return `${i === 0 ? "M" : "L"} ${x} ${y}`;
-    })
-    .join(" ");
-
-  const path = document.createElementNS("http://www.w3.org/2000/svg", "path");
-  path.setAttribute("d", d);
-  path.setAttribute("fill", "none");
-  path.setAttribute("stroke", color);
-  path.setAttribute("stroke-width", "2.5");
-  svg.appendChild(path);
+  const [min, max] = extent(points.map((p) => Number(p[valueKey])));
+  strokeSeries(chart, points, valueKey, min, max, color, 2.5);
 
-  points.forEach((p, i) => {
-    const c = document.createElementNS("http://www.w3.org/2000/svg", "circle");
-    c.setAttribute("cx", xScale(i, points.length));
-    c.setAttribute("cy", yScale(Number(p[valueKey]), min, max));
-    c.setAttribute("r", "3.5");
-    c.setAttribute("fill", color);
-    c.setAttribute("opacity", "0.85");
-    svg.appendChild(c);
+  // All dots go into one path and are filled at once.
+  const { ctx } = chart;
+  ctx.beginPath();
+  points.forEach((p) => {
+    const x = xScale(chart, p);
+    const y = yScale(chart, Number(p[valueKey]), min, max);
+    ctx.moveTo(x + 3.5, y);
+    ctx.arc(x, y, 3.5, 0, Math.PI * 2);
   });
+  ctx.globalAlpha = 0.85;
+  ctx.fillStyle = color;
+  ctx.fill();
+  ctx.globalAlpha = 1;
 }
 
-function renderBars(svgId, points, valueKey, color) {
-  const svg = document.getElementById(svgId);
-  clearSvg(svg);
-  addAxes(svg);
+function renderMultiLine(canvasId, points, series) {
+  const chart = setupCanvas(canvasId);
+  drawAxes(chart);
   if (!points.length) return;
 
-  const vals = points.map((p) => Number(p[valueKey])).filter((v) => !Number.isNaN(v));
-  const max = Math.max(...vals, 1);
-  const barW = Math.max(2, (CHART_W - PAD * 2) / points.length - 2);
+  // All series share one y scale so they can be compared directly.
+  const vals = [];
+  series.forEach(([key]) => {
+    points.forEach((p) => vals.push(Number(p[key])));
+  });
+  const [low, max] = extent(vals);
+  if (max === -Infinity) return;
+  const min = Math.min(0, low);
 
-  points.forEach((p, i) => {
-    const x = PAD + i * ((CHART_W - PAD * 2) / points.length) + 1;
-    const y = yScale(Number(p[valueKey]), 0, max);
-    const h = CHART_H - PAD - y;
-    const r = document.createElementNS("http://www.w3.org/2000/svg", "rect");
-    r.setAttribute("x", x);
-    r.setAttribute("y", y);
-    r.setAttribute("width", barW);
-    r.setAttribute("height", Math.max(h, 1));
-    r.setAttribute("fill", color);
-    r.setAttribute("opacity", "0.85");
-    svg.appendChild(r);
-  });
-}
-
-function renderScatter(svgId, points) {
-  const svg = document.getElementById(svgId);
-  clearSvg(svg);
-  addAxes(svg);
+  series.forEach(([key, color]) => {
+    strokeSeries(chart, points, key, min, max, color, 1.8);
+  });
+}
+
+function renderBars(canvasId, points, valueKey, color) {
+  const chart = setupCanvas(canvasId);
+  drawAxes(chart);
   if (!points.length) return;
 
-  const xs = points.map((p) => Number(p.avg_hr));
-  const ys = points.map((p) => Number(p.avg_pace_min_per_km));
-  const minX = Math.min(...xs);
-  const maxX = Math.max(...xs);
-  const minY = Math.min(...ys);
-  const maxY = Math.max(...ys);
+  const [, high] = extent(points.map((p) => Number(p[valueKey])));
+  const max = Math.max(high, 1);
+  const plotW = chart.width - PAD * 2;
+  const barW = Math.max(1, plotW / points.length - 2);
 
+  const { ctx } = chart;
+  ctx.globalAlpha = 0.85;
+  ctx.fillStyle = color;
   points.forEach((p) => {
-    const xPct = (Number(p.avg_hr) - minX) / (maxX - minX || 1);
-    const x = PAD + xPct * (CHART_W - PAD * 2);
+    const x = PAD + p._x * (plotW - barW);
+    const y = yScale(chart, Number(p[valueKey]), 0, max);
+    ctx.fillRect(x, y, barW, Math.max(chart.height - PAD - y, 1));
+  });
+  ctx.globalAlpha = 1;
+}
 
-    // Pace chart is inverted (faster pace appears higher).
-    const yPct = (Number(p.avg_pace_min_per_km) - minY) / (maxY - minY || 1);
-    const y = CHART_H - PAD - yPct * (CHART_H - PAD * 2);
+function renderScatter(canvasId, points) {
+  const chart = setupCanvas(canvasId);
+  drawAxes(chart);
+  if (!points.length) return;
+
+  const [minX, maxX] = extent(points.map((p) => Number(p.avg_hr)));
+  const [minY, maxY] = extent(points.map((p) => Number(p.avg_pace_min_per_km)));
+  // Binned points (long histories) stand for "count" runs each; bigger and
+  // darker dots mean more runs.
+  const [, maxCount] = extent(points.map((p) => p.count || 1));
+  const plotW = chart.width - PAD * 2;
+  const plotH = chart.height - PAD * 2;
 
-    const c = document.createElementNS("http://www.w3.org/2000/svg", "circle");
-    c.setAttribute("cx", x);
-    c.setAttribute("cy", y);
-    c.setAttribute("r", "4");
-    c.setAttribute("fill", "#1f7a63");
-    c.setAttribute("opacity", "0.75");
-    svg.appendChild(c);
+  const { ctx } = chart;
+  ctx.fillStyle = "#1f7a63";
+  points.forEach((p) => {
+    const x = PAD + ((Number(p.avg_hr) - minX) / (maxX - minX || 1)) * plotW;
+    // Pace chart is inverted (faster pace appears higher).
+    const y =
+      chart.height - PAD - ((Number(p.avg_pace_min_per_km) - minY) / (maxY - minY || 1)) * plotH;
+    const weight = Math.sqrt((p.count || 1) / maxCount);
+    // Dots are filled one by one so overlapping runs look darker.
+    ctx.globalAlpha = maxCount > 1 ? 0.35 + 0.6 * weight : 0.75;
+    ctx.beginPath();
+    ctx.arc(x, y, maxCount > 1 ? 2.5 + 5 * weight : 4, 0, Math.PI * 2);
+    ctx.fill();
   });
+  ctx.globalAlpha = 1;
 }
 
 function renderKpis(kpis) {
@@ -156,27 +424,171 @@ function renderKpis(kpis) {
   });
 }
 
-function renderTable(rows) {
+const TABLE_COLUMNS = [
+  ["workout_date", (v) => v || "-"],
+  ["distance_km", (v) => fmtNum(v, 2)],
+  ["duration_min", (v) => fmtNum(v, 1)],
+  ["avg_hr", (v) => fmtNum(v, 0)],
+  ["max_hr", (v) => fmtNum(v, 0)],
+  ["avg_cadence", (v) => fmtNum(v, 1)],
+  ["avg_pace_min_per_km", paceLabel],
+  ["hr_efficiency", (v) => fmtNum(v, 4)],
+  ["calories", (v) => fmtNum(v, 0)],
+  ["avg_temperature", (v) => fmtNum(v, 1)],
+];
+// Rows drawn above and below the visible window, so fast scrolling does
+// not show blank space before the next frame.
+const TABLE_OVERSCAN = 10;
+
+// The run table only creates <tr> elements for the rows in view (plus
+// TABLE_OVERSCAN); two spacer rows stand in for the rest, so 10,000 runs
+// cost as much as 30. Rows are read straight from the columnar runs.
+const table = {
+  runs: null,
+  count: 0,
+  sortKey: "workout_date",
+  descending: true,
+  // column -> { order: Uint32Array ascending with empty values last, filled: count }
+  sortIndexes: new Map(),
+  rowHeight: 37,
+  pool: [],
+  frame: 0,
+};
+
+function sortIndex(key) {
+  if (!table.sortIndexes.has(key)) {
+    const values = table.runs[key];
+    const filled = [];
+    const empty = [];
+    for (let i = 0; i < table.count; i += 1) {
+      (values[i] === null || values[i] === undefined ? empty : filled).push(i);
+    }
+    filled.sort((a, b) => (values[a] < values[b] ? -1 : values[a] > values[b] ? 1 : a - b));
+    const order = Uint32Array.from(filled.concat(empty));
+    table.sortIndexes.set(key, { order, filled: filled.length });
+  }
+  return table.sortIndexes.get(key);
+}
+
+// Run position shown at `row` for the current sort; empty values stay last.
+function tableRunAt(row) {
+  const { order, filled } = sortIndex(table.sortKey);
+  if (table.descending && row < filled) return order[filled - 1 - row];
+  return order[row];
+}
+
+function spacerRow() {
+  const tr = document.createElement("tr");
+  tr.className = "spacer";
+  const td = document.createElement("td");
+  td.colSpan = TABLE_COLUMNS.length;
+  tr.appendChild(td);
+  return tr;
+}
+
+function renderTableWindow() {
+  table.frame = 0;
+  const wrap = document.getElementById("runTableWrap");
   const tbody = document.querySelector("#runTable tbody");
-  tbody.innerHTML = "";
+  if (!table.runs) return;
+
+  const first = Math.max(0, Math.floor(wrap.scrollTop / table.rowHeight) - TABLE_OVERSCAN);
+  const last = Math.min(
+    table.count,
+    first + Math.ceil(wrap.clientHeight / table.rowHeight) + TABLE_OVERSCAN * 2
+  );
 
-  const sorted = [...rows].sort((a, b) => (a.workout_date < b.workout_date ? 1 : -1));
-  sorted.forEach((r) => {
+  if (!tbody.firstChild) {
+    tbody.appendChild(spacerRow());
+    tbody.appendChild(spacerRow());
+  }
+  const bottom = tbody.lastChild;
+  // Grow or shrink the pool of reusable rows to the window size.
+  while (table.pool.length < last - first) {
     const tr = document.createElement("tr");
-    tr.innerHTML = `
-      <td>${r.workout_date || "-"}</td>
-      <td>${fmtNum(r.distance_km, 2)}</td>
-      <td>${fmtNum(r.duration_min, 1)}</td>
-      <td>${fmtNum(r.avg_hr, 0)}</td>
-      <td>${fmtNum(r.max_hr, 0)}</td>
-      <td>${fmtNum(r.avg_cadence, 1)}</td>
-      <td>${paceLabel(r.avg_pace_min_per_km)}</td>
-      <td>${fmtNum(r.hr_efficiency, 4)}</td>
-      <td>${fmtNum(r.calories, 0)}</td>
-      <td>${fmtNum(r.avg_temperature, 1)}</td>
-    `;
-    tbody.appendChild(tr);
+    TABLE_COLUMNS.forEach(() => tr.appendChild(document.createElement("td")));
+    tbody.insertBefore(tr, bottom);
+    table.pool.push(tr);
+  }
+  while (table.pool.length > last - first) tbody.removeChild(table.pool.pop());
+
+  table.pool.forEach((tr, k) => {
+    const run = tableRunAt(first + k);
+    TABLE_COLUMNS.forEach(([key, format], c) => {
+      tr.cells[c].textContent = format(table.runs[key][run]);
+    });
   });
+  tbody.firstChild.firstChild.style.height = `${first * table.rowHeight}px`;
+  bottom.firstChild.style.height = `${(table.count - last) * table.rowHeight}px`;
+
+  // Measure the real row height once; CSS fixes it, but fonts vary.
+  const measured = table.pool.length ? table.pool[0].getBoundingClientRect().height : 0;
+  if (measured && Math.abs(measured - table.rowHeight) > 0.5) {
+    table.rowHeight = measured;
+    renderTableWindow();
+  }
+}
+
+function scheduleTableWindow() {
+  if (!table.frame) table.frame = requestAnimationFrame(renderTableWindow);
+}
+
+function updateSortHeaders() {
+  document.querySelectorAll("#runTable th[data-key]").forEach((th) => {
+    const active = th.dataset.key === table.sortKey;
+    th.setAttribute("aria-sort", active ? (table.descending ? "descending" : "ascending") : "none");
+  });
+}
+
+function renderTable(runs) {
+  table.runs = runs;
+  table.count = runs.workout_date.length;
+  table.sortIndexes.clear();
+  // Build the default order now; other columns are indexed on first click.
+  sortIndex(table.sortKey);
+  updateSortHeaders();
+  renderTableWindow();
+}
+
+function setupTable() {
+  document.getElementById("runTableWrap").addEventListener("scroll", scheduleTableWindow, {
+    passive: true,
+  });
+  document.querySelectorAll("#runTable th[data-key]").forEach((th) => {
+    th.addEventListener("click", () => {
+      const key = th.dataset.key;
+      table.descending = key === table.sortKey ? !table.descending : true;
+      table.sortKey = key;
+      updateSortHeaders();
+      document.getElementById("runTableWrap").scrollTop = 0;
+      renderTableWindow();
+    });
+  });
+}
+
+let lastPayload = null;
+
+function renderCharts(payload) {
+  renderLine("monthlyChart", payload.series.monthly_mileage, "distance_km", "#b45709");
+  renderScatter("scatterChart", payload.series.pace_vs_hr);
+  renderLine("cadenceChart", payload.series.cadence_trend, "avg_cadence", "#0c4a3a");
+  renderBars("distanceChart", payload.series.distance_trend, "distance_km", "#296f8f");
+  renderMultiLine("loadChart", payload.series.training_load || [], [
+    ["load_ratio", "#0c4a3a"],
+    ["ewma_load_ratio", "#c26a1b"],
+  ]);
+}
+
+// Draw a decoded payload that has data. Also used by bench.html.
+function renderDashboard(payload) {
+  lastPayload = payload;
+  document.getElementById("emptyState").hidden = true;
+  document.getElementById("content").hidden = false;
+  document.getElementById("generatedAt").textContent = `Generated: ${payload.generated_at}`;
+
+  renderKpis(payload.kpis);
+  renderCharts(payload);
+  renderTable(payload.runs);
 }
 
 async function loadDashboard() {
@@ -185,29 +597,17 @@ async function loadDashboard() {
   const content = document.getElementById("content");
 
   try {
-    const resp = await fetch(DATA_URL, { cache: "no-store" });
-    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
-    const payload = await resp.json();
+    const payload = decodePayload(await fetchPayload());
 
     if (!payload.has_data) {
       emptyState.hidden = false;
       content.hidden = true;
       generatedAt.textContent = payload.generated_at
-        ? `Generated: ${payload.generated_at}`
+        ? `Generated: ${payload.generated_at}. ${payload.message || ""}`
         : "No data file found yet.";
       return;
     }
-
-    emptyState.hidden = true;
-    content.hidden = false;
-    generatedAt.textContent = `Generated: ${payload.generated_at}`;
-
-    renderKpis(payload.kpis);
-    renderLine("monthlyChart", payload.series.monthly_mileage, "distance_km", "#b45709");
-    renderScatter("scatterChart", payload.series.pace_vs_hr);
-    renderLine("cadenceChart", payload.series.cadence_trend, "avg_cadence", "#0c4a3a");
-    renderBars("distanceChart", payload.series.distance_trend, "distance_km", "#296f8f");
-    renderTable(payload.series.run_table);
+    renderDashboard(payload);
   } catch (err) {
     emptyState.hidden = false;
     content.hidden = true;
@@ -216,6 +616,17 @@ async function loadDashboard() {
   }
 }
 
+// Canvas pixels do not stretch like SVG, so charts are redrawn at the new size.
+let resizeFrame = 0;
+window.addEventListener("resize", () => {
+  if (resizeFrame || !lastPayload) return;
+  resizeFrame = requestAnimationFrame(() => {
+    resizeFrame = 0;
+    renderCharts(lastPayload);
+    scheduleTableWindow();
+  });
+});
+
 function setupInstallPrompt() {
   let deferredPrompt = null;
   const installBtn = document.getElementById("installBtn");
@@ -235,15 +646,29 @@ function setupInstallPrompt() {
   });
 }
 
-document.getElementById("refreshBtn").addEventListener("click", () => {
-  loadDashboard();
-});
+setupTable();
 
-if ("serviceWorker" in navigator) {
-  window.addEventListener("load", () => {
-    navigator.serviceWorker.register("./sw.js");
+// bench.html loads this file with data-autoload="false" and feeds its own payload.
+if (document.body.dataset.autoload !== "false") {
+  document.getElementById("refreshBtn").addEventListener("click", () => {
+    loadDashboard();
+  });
+
+  document.getElementById("filters").addEventListener("submit", (event) => {
+    event.preventDefault();
+    loadDashboard();
+  });
+  document.getElementById("filters").addEventListener("reset", () => {
+    // Let the form clear its inputs first.
+    setTimeout(loadDashboard, 0);
   });
-}
 
-setupInstallPrompt();
-loadDashboard();
+  if ("serviceWorker" in navigator) {
+    window.addEventListener("load", () => {
+      navigator.serviceWorker.register("./sw.js");
+    });
+  }
+
+  setupInstallPrompt();
+  loadDashboard();
+}
@@ -0,0 +1,126 @@
+// Render benchmark for bench.html: builds a synthetic format-2 payload
+// (?runs=N, default 10000) with every series at full length, i.e. no
+// downsampling, and times how long app.js takes to show it.
+const BENCH_DEFAULT_RUNS = 10000;
+const BENCH_SEED = 42;
+
+// Small seeded PRNG, so every run of the page draws the same data.
+function mulberry32(seed) {
+  let a = seed;
+  return () => {
+    a = (a + 0x6d2b79f5) | 0;
+    let t = Math.imul(a ^ (a >>> 15), 1 | a);
+    t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t;
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+function round(value, digits) {
+  const f = 10 ** digits;
+  return Math.round(value * f) / f;
+}
+
+function syntheticPayload(runCount) {
+  const rand = mulberry32(BENCH_SEED);
+  const runs = {
+    workout_date: [],
+    distance_km: [],
+    duration_min: [],
+    avg_hr: [],
+    max_hr: [],
+    avg_cadence: [],
+    avg_pace_min_per_km: [],
+    hr_efficiency: [],
+    calories: [],
+    avg_temperature: [],
+  };
+  // About one run a day, ending today.
+  const day = 24 * 3600 * 1000;
+  const start = Date.now() - runCount * day;
+  const monthly = new Map();
+  for (let i = 0; i < runCount; i += 1) {
+    const date = new Date(start + i * day).toISOString().slice(0, 10);
+    const km = round(3 + rand() * 15, 2);
+    const pace = round(4.5 + rand() * 2.5, 2);
+    const hr = Math.round(130 + rand() * 40);
+    // A few runs miss sensor data, like real watches.
+    const cadence = rand() < 0.05 ? null : round(160 + rand() * 20, 1);
+    runs.workout_date.push(date);
+    runs.distance_km.push(km);
+    runs.duration_min.push(round(km * pace, 1));
+    runs.avg_hr.push(hr);
+    runs.max_hr.push(hr + Math.round(rand() * 20));
+    runs.avg_cadence.push(cadence);
+    runs.avg_pace_min_per_km.push(pace);
+    runs.hr_efficiency.push(round(1000 / (pace * hr), 4));
+    runs.calories.push(Math.round(km * 65));
+    runs.avg_temperature.push(round(10 + rand() * 20, 1));
+    const month = `${date.slice(0, 7)}-01`;
+    monthly.set(month, round((monthly.get(month) || 0) + km, 2));
+  }
+
+  const ratios = runs.distance_km.map((km) => round(0.8 + (km / 18) * 0.6, 3));
+  const last = runCount - 1;
+  return {
+    format: 2,
+    generated_at: `synthetic, ${runCount} runs`,
+    has_data: true,
+    kpis: {
+      total_runs: runCount,
+      lifetime_distance_km: round(runs.distance_km.reduce((a, b) => a + b, 0), 2),
+      weekly_mileage_km: round(runs.distance_km.slice(-7).reduce((a, b) => a + b, 0), 2),
+      training_load_ratio: ratios[last],
+      latest_run_date: runs.workout_date[last],
+      latest_run_pace: runs.avg_pace_min_per_km[last],
+    },
+    runs,
+    series: {
+      monthly_mileage: {
+        columns: { month: [...monthly.keys()], distance_km: [...monthly.values()] },
+      },
+      training_load: {
+        columns: {
+          date: runs.workout_date,
+          acute_km: runs.distance_km,
+          chronic_km: runs.distance_km,
+          load_ratio: ratios,
+          ewma_load_ratio: ratios,
+        },
+      },
+      pace_vs_hr: { rows: "all" },
+      cadence_trend: { rows: rowsWhere(runs, ["avg_cadence"]) },
+      distance_trend: { rows: "all" },
+      run_table: { rows: "all" },
+    },
+  };
+}
+
+function runBench() {
+  const params = new URLSearchParams(window.location.search);
+  const runCount = Number(params.get("runs")) || BENCH_DEFAULT_RUNS;
+  const result = document.getElementById("benchResult");
+  const raw = syntheticPayload(runCount);
+
+  // Start the clock after building the data: the payload would normally come
+  // from the network, which is not what this page measures.
+  const t0 = performance.now();
+  const payload = decodePayload(raw);
+  const t1 = performance.now();
+  renderDashboard(payload);
+  const t2 = performance.now();
+  // Two frames later the browser has done layout and painted the result.
+  requestAnimationFrame(() => {
+    requestAnimationFrame(() => {
+      const t3 = performance.now();
+      const rows = document.querySelectorAll("#runTable tbody tr:not(.spacer)").length;
+      result.textContent =
+        `${runCount} runs: decode ${(t1 - t0).toFixed(1)} ms, ` +
+        `render ${(t2 - t1).toFixed(1)} ms, first paint ${(t3 - t0).toFixed(1)} ms ` +
+        `(${rows} table rows in the DOM)`;
+      console.log(result.textContent);
+    });
+  });
+}
+
+document.getElementById("rerunBtn").addEventListener("click", runBench);
+runBench();
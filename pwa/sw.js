@@ -1,4 +1,6 @@
-const CACHE_NAME = "muthu-performance-lab-v1";
+const CACHE_NAME = "muthu-performance-lab-v6";
+// Month chunks live in their own cache so app updates do not throw them away.
+const DATA_CACHE = "muthu-performance-lab-data";
 const APP_SHELL = [
   "./",
   "./index.html",
@@ -17,30 +19,80 @@ self.addEventListener("install", (event) => {
 self.addEventListener("activate", (event) => {
   event.waitUntil(
     caches.keys().then((keys) =>
-      Promise.all(keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key)))
+      Promise.all(
+        keys
+          .filter((key) => key !== CACHE_NAME && key !== DATA_CACHE)
+          .map((key) => caches.delete(key))
+      )
     )
   );
   self.clients.claim();
 });
 
+// Drop cached chunks that the latest manifest no longer lists.
+async function pruneChunks(manifestResponse, manifestUrl) {
+  const manifest = await manifestResponse.json();
+  const keep = new Set(
+    (manifest.chunks || []).map((chunk) => new URL(chunk.file, manifestUrl).toString())
+  );
+  const cache = await caches.open(DATA_CACHE);
+  const cached = await cache.keys();
+  await Promise.all(
+    cached.filter((req) => !keep.has(req.url)).map((req) => cache.delete(req))
+  );
+}
+
+function networkFirst(event, url) {
+  url.search = "";
+  const cacheKey = url.toString();
+  event.respondWith(
+    fetch(event.request)
+      .then((res) => {
+        if (res.ok) {
+          const clone = res.clone();
+          caches.open(CACHE_NAME).then((cache) => cache.put(cacheKey, clone));
+          if (url.pathname.endsWith("/data/manifest.json")) {
+            event.waitUntil(pruneChunks(res.clone(), cacheKey));
+          }
+        }
+        return res;
+      })
+      .catch(() => caches.match(cacheKey))
+  );
+}
+
+// Chunk names include a content hash, so a cached copy never goes stale.
+function cacheForever(event) {
+  event.respondWith(
+    caches.open(DATA_CACHE).then((cache) =>
+      cache.match(event.request).then(
+        (hit) =>
+          hit ||
+          fetch(event.request).then((res) => {
+            if (res.ok) cache.put(event.request, res.clone());
+            return res;
+          })
+      )
+    )
+  );
+}
+
 self.addEventListener("fetch", (event) => {
   const req = event.request;
   if (req.method !== "GET") return;
+  const url = new URL(req.url);
 
-  // Network-first for data file, so refresh gets latest export.
-  if (req.url.includes("/pwa/data/dashboard_data.json")) {
-    const url = new URL(req.url);
-    url.search = "";
-    const cacheKey = url.toString();
-    event.respondWith(
-      fetch(req)
-        .then((res) => {
-          const clone = res.clone();
-          caches.open(CACHE_NAME).then((cache) => cache.put(cacheKey, clone));
-          return res;
-        })
-        .catch(() => caches.match(cacheKey))
-    );
+  if (url.pathname.includes("/pwa/data/chunks/")) {
+    cacheForever(event);
+    return;
+  }
+
+  // Network-first for the manifest and data file, so refresh gets the latest export.
+  if (
+    url.pathname.endsWith("/pwa/data/manifest.json") ||
+    url.pathname.endsWith("/pwa/data/dashboard_data.json")
+  ) {
+    networkFirst(event, url);
     return;
   }
 
@@ -22,6 +22,4 @@ else
 fi
 
 echo ""
-echo "PWA running at: http://localhost:8765/pwa/"
-echo "Press Ctrl+C to stop."
-python -m http.server 8765
+python serve_pwa.py --port 8765
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import argparse
+import threading
+
+from muthu_performance_lab.api_server import DEFAULT_API_PORT, serve_api
+from muthu_performance_lab.compression import precompress_tree
+from muthu_performance_lab.config import PWA_DIR
+from muthu_performance_lab.pwa_server import DEFAULT_HOST, DEFAULT_PORT, serve_pwa
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Serve the PWA dashboard locally.")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument(
+        "--api-port",
+        type=int,
+        default=DEFAULT_API_PORT,
+        help="Port for the JSON API used for date and sport filters (0 turns it off).",
+    )
+    args = parser.parse_args()
+
+    # The exporter already does this; repeating it covers hand-edited assets.
+    precompress_tree(PWA_DIR)
+    if args.api_port:
+        # Daemon thread: it stops with the PWA server on Ctrl+C.
+        threading.Thread(
+            target=serve_api,
+            kwargs={"host": args.host, "port": args.api_port, "pwa_port": args.port},
+            daemon=True,
+        ).start()
+    serve_pwa(args.host, args.port, PWA_DIR)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+"""The local JSON API: filter parsing, the Origin allow-list, keep-alive and the response cache."""
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import date
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+
+from muthu_performance_lab.api_server import (
+    ApiError,
+    DashboardApi,
+    ResponseCache,
+    parse_filters,
+    pwa_origins,
+    start_api_server,
+)
+from muthu_performance_lab.database import connection, upsert_workouts
+
+ALLOWED_ORIGIN = "http://127.0.0.1:8765"
+
+
+def _no_sports() -> list[str]:
+    raise AssertionError("only sport=all lists the sports")
+
+
+def test_parse_filters() -> None:
+    assert parse_filters({}, _no_sports) == (None, None, None)
+    assert parse_filters({"start": ["2024-01-01"], "end": [" 2024-01-31 "]}, _no_sports) == (
+        date(2024, 1, 1),
+        date(2024, 1, 31),
+        None,
+    )
+    # The default sports come back as None, so the default SQL is reused.
+    assert parse_filters({"sport": ["Running"]}, _no_sports) == (None, None, None)
+    assert parse_filters({"sport": ["cycling, Running,,cycling"]}, _no_sports) == (
+        None,
+        None,
+        ("cycling", "running"),
+    )
+    assert parse_filters({"sport": ["ALL"]}, lambda: ["swimming", "running"]) == (
+        None,
+        None,
+        ("running", "swimming"),
+    )
+    # Empty values are ignored, and the last of repeated values wins.
+    assert parse_filters({"start": [""], "sport": ["running", "cycling"]}, _no_sports) == (
+        None,
+        None,
+        ("cycling",),
+    )
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ({"start": ["2024-13-01"]}, "start must be a date"),
+        ({"end": ["yesterday"]}, "end must be a date"),
+        ({"start": ["2024-02-01"], "end": ["2024-01-01"]}, "start must not be after end"),
+    ],
+)
+def test_parse_filters_rejects_bad_values(query: dict, message: str) -> None:
+    with pytest.raises(ApiError, match=message) as excinfo:
+        parse_filters(query, _no_sports)
+    assert excinfo.value.status == HTTPStatus.BAD_REQUEST
+
+
+def _workout(index: int, workout_date: str) -> dict:
+    return {
+        "source_file": f"/fit/{index:03d}.fit",
+        "source_mtime": 1.0,
+        "source_size": 100,
+        "workout_date": workout_date,
+        "sport": "running",
+        "sub_sport": "generic",
+        "distance_km": 10.0,
+        "duration_min": 55.0,
+        "avg_hr": 150.0,
+        "max_hr": 175.0,
+        "avg_cadence": 170.0,
+        "avg_pace_min_per_km": 5.5,
+        "calories": 400.0,
+        "avg_temperature": 18.0,
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    path = tmp_path / "lab.db"
+    with connection(path) as conn:
+        upsert_workouts(conn, [_workout(0, "2024-01-05"), _workout(1, "2024-02-10")])
+    return path
+
+
+def test_cache_is_emptied_when_the_data_version_changes(db_path: Path) -> None:
+    cache = ResponseCache(max_entries=2)
+    cache.check_version(1)
+    cache.put(("a",), b"1")
+    cache.put(("b",), b"2")
+    cache.check_version(1)
+    assert cache.get(("a",)) == b"1"
+    cache.put(("c",), b"3")
+    # "b" was the least recently used.
+    assert cache.get(("b",)) is None and len(cache) == 2
+    cache.check_version(2)
+    assert len(cache) == 0 and cache.get(("a",)) is None
+
+    api = DashboardApi(db_path)
+
+    def kpis() -> dict:
+        status, body = asyncio.run(api.respond("/api/kpis?sport=running"))
+        assert status == HTTPStatus.OK
+        return json.loads(body)
+
+    first = kpis()
+    assert first["kpis"]["total_runs"] == 2
+    assert kpis() == first
+    assert (api.cache.hits, api.cache.misses) == (1, 1)
+
+    # An ingest by any process bumps the data version.
+    with connection(db_path) as conn:
+        upsert_workouts(conn, [_workout(2, "2024-03-15")])
+    second = kpis()
+    assert second["data_version"] == first["data_version"] + 1
+    assert second["kpis"]["total_runs"] == 3
+    assert (api.cache.hits, api.cache.misses) == (1, 2)
+
+
+async def _exchange(port: int, *requests: bytes) -> list[bytes]:
+    """Send `requests` on one connection; the raw responses, split on status lines."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"".join(requests))
+    await writer.drain()
+    data = await asyncio.wait_for(reader.read(), timeout=10)
+    writer.close()
+    return [b"HTTP/1.1" + part for part in data.split(b"HTTP/1.1")[1:]]
+
+
+def _serve(db_path: Path, *requests: bytes) -> list[bytes]:
+    async def run() -> list[bytes]:
+        server = await start_api_server(port=0, db_path=db_path)
+        async with server:
+            return await _exchange(server.sockets[0].getsockname()[1], *requests)
+
+    return asyncio.run(run())
+
+
+def _get(target: str, *headers: str) -> bytes:
+    return "\r\n".join([f"GET {target} HTTP/1.1", "Host: 127.0.0.1", *headers, "", ""]).encode()
+
+
+def test_only_the_pwa_origin_may_read_responses(db_path: Path) -> None:
+    assert ALLOWED_ORIGIN in pwa_origins()
+    allowed, no_origin, refused = _serve(
+        db_path,
+        _get("/api/meta", f"Origin: {ALLOWED_ORIGIN}"),
+        _get("/api/meta"),
+        _get("/api/meta", "Origin: https://example.com", "Connection: close"),
+    )
+    assert allowed.startswith(b"HTTP/1.1 200 ")
+    assert f"Access-Control-Allow-Origin: {ALLOWED_ORIGIN}".encode() in allowed
+    assert no_origin.startswith(b"HTTP/1.1 200 ")
+    assert b"Access-Control-Allow-Origin" not in no_origin
+    assert refused.startswith(b"HTTP/1.1 403 ")
+    assert b"Access-Control-Allow-Origin" not in refused
+    assert b"is not allowed" in refused
+
+
+def test_a_request_body_closes_the_connection(db_path: Path) -> None:
+    # Were the body left unread, "GET /api/meta..." would be answered after
+    # "hello" had been parsed as a request line.
+    responses = _serve(
+        db_path,
+        b"POST /api/meta HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello",
+        _get("/api/meta"),
+    )
+    assert len(responses) == 1
+    assert responses[0].startswith(b"HTTP/1.1 405 ")
+    assert b"Connection: close" in responses[0]
@@ -0,0 +1,199 @@
+"""Best efforts from record streams, laps from FIT files, and the queries that read both."""
+from __future__ import annotations
+
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from muthu_performance_lab.best_efforts import best_efforts
+from muthu_performance_lab.config import BEST_EFFORT_DISTANCES
+from muthu_performance_lab.database import connection, upsert_workouts
+from muthu_performance_lab.fit_ingest import iter_fit_rows
+from muthu_performance_lab.queries import query_best_efforts, query_laps, query_personal_records
+from muthu_performance_lab.synthetic_fit import AUTO_LAP_M, build_activity
+
+
+def _steady(seconds: int, metres_per_s: float, step_s: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """A constant-pace stream starting at FIT timestamp 1000."""
+    offsets = np.arange(0, seconds + 1, step_s, dtype=np.float64)
+    return 1000.0 + offsets, offsets * metres_per_s
+
+
+def test_constant_pace_gives_exact_efforts() -> None:
+    timestamps, distances = _steady(600, 4.0)
+    assert best_efforts(timestamps, distances, [400.0, 1000.0]) == [
+        {"distance_m": 400.0, "elapsed_s": 100.0, "start_offset_s": 0.0},
+        {"distance_m": 1000.0, "elapsed_s": 250.0, "start_offset_s": 0.0},
+    ]
+
+
+def test_start_is_interpolated_between_samples() -> None:
+    # 8 m between samples: 1002 m before the first end that covers it
+    # (1008 m) lies 6 m past the first sample, three quarters of a step.
+    timestamps, distances = _steady(600, 4.0, step_s=2)
+    assert best_efforts(timestamps, distances, [1002.0]) == [
+        {"distance_m": 1002.0, "elapsed_s": 250.5, "start_offset_s": 1.5}
+    ]
+
+
+def test_fastest_stretch_is_found_mid_activity() -> None:
+    # 600 s at 3 m/s, 1 km at 5 m/s, then 600 s at 3 m/s.
+    speeds = [3.0] * 600 + [5.0] * 200 + [3.0] * 600
+    timestamps = 1000.0 + np.arange(len(speeds) + 1, dtype=np.float64)
+    distances = np.concatenate([[0.0], np.cumsum(speeds)])
+    (effort,) = best_efforts(timestamps, distances, [1000.0])
+    assert effort["elapsed_s"] == pytest.approx(200.0)
+    assert effort["start_offset_s"] == pytest.approx(600.0)
+
+
+def test_backward_gps_steps_are_clamped() -> None:
+    timestamps, distances = _steady(600, 4.0)
+    distances[50] = distances[49] - 1.0
+    timestamps[400] = timestamps[398]
+    efforts = best_efforts(timestamps, distances, [400.0])
+    # The clamped sample waits a second at 196 m, so the 400 m from there is a second quicker.
+    assert efforts == [{"distance_m": 400.0, "elapsed_s": 99.0, "start_offset_s": 50.0}]
+    monotonic = np.maximum.accumulate(timestamps), np.maximum.accumulate(distances)
+    assert best_efforts(*monotonic, [400.0]) == efforts
+
+
+def test_missing_distances_and_times_are_skipped() -> None:
+    timestamps, distances = _steady(600, 4.0)
+    timestamps[0] = 0.0
+    distances[[20, 21, 350]] = np.nan
+    timestamps[200] = 0.0
+    # Offsets count from the first usable sample, one second in.
+    assert best_efforts(timestamps, distances, [400.0]) == [
+        {"distance_m": 400.0, "elapsed_s": 100.0, "start_offset_s": 0.0}
+    ]
+    assert best_efforts(np.zeros(5), np.arange(5.0), [1.0]) == []
+    assert best_efforts(timestamps, np.full(len(timestamps), np.nan), [1.0]) == []
+
+
+def test_distances_longer_than_the_activity_are_left_out() -> None:
+    timestamps, distances = _steady(300, 4.0)
+    efforts = best_efforts(timestamps, distances, [5000.0, 400.0, 1200.0, 1000.0])
+    assert [effort["distance_m"] for effort in efforts] == [400.0, 1000.0, 1200.0]
+    assert best_efforts(timestamps[:1], distances[:1], [1.0]) == []
+
+
+def test_zero_time_distance_jumps_are_not_efforts() -> None:
+    timestamps = np.array([1000.0, 1000.0, 1000.0])
+    distances = np.array([0.0, 300.0, 600.0])
+    assert best_efforts(timestamps, distances, [400.0]) == []
+    # Only the windows that end on the jump are dropped: 200 m ending at the
+    # third sample starts a third of the way into the 10 s, 300 m step.
+    timestamps = np.array([1000.0, 1000.0, 1010.0])
+    efforts = best_efforts(timestamps, distances, [200.0, 500.0])
+    assert [effort["distance_m"] for effort in efforts] == [200.0, 500.0]
+    assert efforts[0]["elapsed_s"] == pytest.approx(20 / 3)
+    assert efforts[0]["start_offset_s"] == pytest.approx(10 / 3)
+    assert efforts[1]["elapsed_s"] == pytest.approx(10.0)
+
+
+def test_laps_and_best_efforts_are_stored_for_a_fit_file(tmp_path: Path) -> None:
+    fit_path = tmp_path / "run.fit"
+    fit_path.write_bytes(build_activity(datetime(2024, 3, 1, 7), 1800, "running", seed=4))
+    streams_dir = tmp_path / "streams"
+    streams_dir.mkdir()
+    stat = fit_path.stat()
+    rows = iter_fit_rows(
+        [(fit_path, stat.st_mtime, stat.st_size)], tmp_path / "errors.log", streams_dir=streams_dir
+    )
+    db_path = tmp_path / "lab.db"
+    with connection(db_path) as conn:
+        assert upsert_workouts(conn, rows) == 1
+        workout_id, distance_km, duration_min = conn.execute(
+            "SELECT id, distance_km, duration_min FROM workouts"
+        ).fetchone()
+        laps = query_laps(conn, workout_id)
+        records = query_personal_records(conn)
+
+    distance_m = distance_km * 1000
+    # One lap per AUTO_LAP_M, plus the remainder; together they are the session.
+    assert [lap[0] for lap in laps] == list(range(len(laps)))
+    assert len(laps) == int(distance_m // AUTO_LAP_M) + 1
+    assert all(lap[2] == pytest.approx(AUTO_LAP_M / 1000, abs=0.02) for lap in laps[:-1])
+    assert sum(lap[2] for lap in laps) == pytest.approx(distance_km, abs=0.01)
+    assert sum(lap[3] for lap in laps) == pytest.approx(duration_min)
+    assert [lap[1] for lap in laps] == sorted(lap[1] for lap in laps)
+    assert laps[0][1] == "2024-03-01T07:00:00"
+
+    covered = [name for name, metres in BEST_EFFORT_DISTANCES.items() if metres <= distance_m]
+    assert [name for name, record in records.items() if record] == covered
+    assert records["1k"][0] == workout_id and records["1k"][1] == "2024-03-01"
+    assert records["400m"][3] < records["1k"][3] < duration_min * 60
+
+
+def _workout(index: int, workout_date: str, sport: str, efforts: dict[float, float]) -> dict:
+    return {
+        "source_file": f"/fit/{index:03d}.fit",
+        "source_mtime": 1.0,
+        "source_size": 100,
+        "workout_date": workout_date,
+        "sport": sport,
+        "sub_sport": "generic",
+        "distance_km": 10.0,
+        "duration_min": 50.0,
+        "avg_hr": 150.0,
+        "max_hr": 175.0,
+        "avg_cadence": 170.0,
+        "avg_pace_min_per_km": 5.0,
+        "calories": 400.0,
+        "avg_temperature": 18.0,
+        "best_efforts": [
+            {"distance_m": metres, "elapsed_s": elapsed, "start_offset_s": 0.0}
+            for metres, elapsed in efforts.items()
+        ],
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    path = tmp_path / "lab.db"
+    with connection(path) as conn:
+        upsert_workouts(
+            conn,
+            [
+                _workout(0, "2024-01-05", "running", {1000.0: 250.0, 5000.0: 1400.0}),
+                _workout(1, "2024-02-10", "Running", {1000.0: 240.0, 5000.0: 1500.0}),
+                _workout(2, "2024-03-15", "running", {1000.0: 260.0}),
+                _workout(3, "2024-03-20", "cycling", {1000.0: 90.0, 5000.0: 500.0}),
+            ],
+        )
+    return path
+
+
+def test_query_best_efforts_orders_filters_and_limits(db_path: Path) -> None:
+    with connection(db_path) as conn:
+        fastest = query_best_efforts(conn, 1000.0, sports=["running"])
+        assert [(row[1], row[3]) for row in fastest] == [
+            ("2024-02-10", 240.0),
+            ("2024-01-05", 250.0),
+            ("2024-03-15", 260.0),
+        ]
+        assert query_best_efforts(conn, 1000.0, sports=["running"], limit=1) == fastest[:1]
+        # Runs only by default, like every other query.
+        assert query_best_efforts(conn, 1000.0) == fastest
+        both = query_best_efforts(conn, 1000.0, sports=["running", "cycling"])
+        assert [row[3] for row in both] == [90.0, 240.0, 250.0, 260.0]
+        in_march = query_best_efforts(
+            conn, 1000.0, date(2024, 3, 1), date(2024, 3, 31), sports=["running"]
+        )
+        assert [row[1] for row in in_march] == ["2024-03-15"]
+        assert query_best_efforts(conn, 400.0) == []
+
+
+def test_query_personal_records(db_path: Path) -> None:
+    with connection(db_path) as conn:
+        records = query_personal_records(conn, sports=["running"])
+        assert list(records) == list(BEST_EFFORT_DISTANCES)
+        assert records["1k"][1:4] == ("2024-02-10", 1000.0, 240.0)
+        assert records["5k"][1:4] == ("2024-01-05", 5000.0, 1400.0)
+        assert records["400m"] is None and records["marathon"] is None
+
+        after_january = query_personal_records(conn, start=date(2024, 2, 1), sports=["running"])
+        assert after_january["5k"][1:4] == ("2024-02-10", 5000.0, 1500.0)
+        assert query_personal_records(conn, sports=["cycling"])["1k"][3] == 90.0
@@ -0,0 +1,217 @@
+"""Schema migrations and the bookkeeping kept next to the workouts table."""
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from muthu_performance_lab.database import (
+    MIGRATIONS,
+    check_daily_totals,
+    connection,
+    delete_workouts,
+    fetch_duplicate_files,
+    fetch_files_to_reparse,
+    migrate,
+    rederive_workouts,
+    upsert_workouts,
+)
+from muthu_performance_lab.fit_ingest import iter_fit_rows
+from muthu_performance_lab.fit_reader import read_fit_summary
+from muthu_performance_lab.session_fields import (
+    DERIVED_COLUMNS,
+    DERIVED_VERSION,
+    decode_session_fields,
+    derive_columns,
+)
+from muthu_performance_lab.synthetic_fit import build_activity
+
+# The workouts table as the first release created it, before source_size.
+BASELINE_SCHEMA = """
+CREATE TABLE workouts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_file TEXT UNIQUE NOT NULL,
+    source_mtime REAL NOT NULL,
+    workout_date TEXT,
+    sport TEXT,
+    sub_sport TEXT,
+    distance_km REAL,
+    duration_min REAL,
+    avg_hr REAL,
+    max_hr REAL,
+    avg_cadence REAL,
+    avg_pace_min_per_km REAL,
+    calories REAL,
+    avg_temperature REAL
+);
+"""
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_baseline_database_is_upgraded_through_every_migration(tmp_path: Path) -> None:
+    activity = build_activity(datetime(2024, 3, 1, 7), 900, "running", seed=1)
+    original = tmp_path / "Activity" / "a.fit"
+    copy = tmp_path / "Activity" / "copy of a.fit"
+    original.parent.mkdir()
+    original.write_bytes(activity)
+    copy.write_bytes(activity)
+    missing = tmp_path / "Activity" / "gone.fit"
+
+    db_path = tmp_path / "lab.db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO workouts (source_file, source_mtime, workout_date, sport, distance_km, "
+        "duration_min, avg_hr) VALUES (?, 1.0, ?, ?, ?, ?, ?)",
+        [
+            (str(original), "2024-03-01", "running", 3.0, 15.0, 150.0),
+            (str(missing), "2024-03-01", "Running", 5.0, 25.0, None),
+            (str(copy), "2024-03-01", "running", 3.0, 15.0, 150.0),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    with connection(db_path) as conn:
+        applied = conn.execute("SELECT version FROM schema_migrations ORDER BY version")
+        assert [row[0] for row in applied] == [version for version, _, _ in MIGRATIONS]
+        assert [version for version, _, _ in MIGRATIONS] == list(range(1, 10))
+        assert migrate(conn) == []
+
+        assert {"source_size", "activity_key", "source_crc"} <= _columns(conn, "workouts")
+        assert "source_crc" in _columns(conn, "quarantine")
+        assert "parse_version" in _columns(conn, "workout_fields")
+        for table in ("laps", "best_efforts", "ingest_runs", "ingest_run_files", "app_meta"):
+            assert _columns(conn, table), table
+
+        # The copy of an already stored activity moved to duplicate_files;
+        # the row whose file is gone stays, unkeyed.
+        rows = conn.execute("SELECT source_file, activity_key FROM workouts ORDER BY id").fetchall()
+        assert [source_file for source_file, _ in rows] == [str(original), str(missing)]
+        assert rows[0][1] is not None and rows[1][1] is None
+        duplicates = fetch_duplicate_files(conn)
+        assert list(duplicates) == [str(copy)]
+        assert duplicates[str(copy)][3] == rows[0][1]
+
+        # The rollup was seeded from the surviving rows.
+        assert conn.execute("SELECT * FROM daily_totals").fetchall() == [
+            ("2024-03-01", "running", 2, 8.0, 40.0, 15.0, 2250.0)
+        ]
+        assert check_daily_totals(conn) == []
+        # No stored session fields yet: both are parsed again by the next refresh.
+        assert fetch_files_to_reparse(conn) == {str(original), str(missing)}
+
+
+def _workout(index: int, workout_date: str | None, sport: str | None, distance_km: float) -> dict:
+    return {
+        "source_file": f"/fit/{index:03d}.fit",
+        "source_mtime": 1.0,
+        "source_size": 100,
+        "workout_date": workout_date,
+        "sport": sport,
+        "sub_sport": "generic",
+        "distance_km": distance_km,
+        "duration_min": distance_km * 6,
+        "avg_hr": 150.0 if index % 2 else None,
+        "max_hr": 175.0,
+        "avg_cadence": 170.0,
+        "avg_pace_min_per_km": 6.0,
+        "calories": 400.0,
+        "avg_temperature": 18.0,
+    }
+
+
+def test_daily_totals_follow_upserts_and_deletes(tmp_path: Path) -> None:
+    db_path = tmp_path / "lab.db"
+    with connection(db_path) as conn:
+        upsert_workouts(
+            conn,
+            [
+                _workout(0, "2024-03-01", "running", 5.0),
+                _workout(1, "2024-03-01", "Running", 10.0),
+                _workout(2, "2024-03-01", "cycling", 30.0),
+                _workout(3, "2024-03-02", None, 2.0),
+                _workout(4, None, "running", 7.0),
+            ],
+            batch_size=2,
+        )
+        assert check_daily_totals(conn) == []
+
+        # Moved to another day and sport, then removed.
+        upsert_workouts(conn, [_workout(1, "2024-03-03", "cycling", 12.0)])
+        assert check_daily_totals(conn) == []
+        delete_workouts(conn, ["/fit/000.fit", "/fit/003.fit"])
+        assert check_daily_totals(conn) == []
+        assert conn.execute(
+            "SELECT workout_date, sport, workout_count FROM daily_totals ORDER BY 1, 2"
+        ).fetchall() == [("2024-03-01", "cycling", 1), ("2024-03-03", "cycling", 1)]
+
+        conn.execute("UPDATE daily_totals SET distance_km = distance_km + 0.5")
+        conn.execute("DELETE FROM daily_totals WHERE workout_date = '2024-03-03'")
+        conn.execute("INSERT INTO daily_totals VALUES ('2024-03-04', 'running', 1, 1, 1, 0, 0)")
+        assert check_daily_totals(conn) == [
+            "2024-03-01 cycling: stored=(1, 30.5, 180.0, 0.0, 0.0) "
+            "rebuilt=(1, 30.0, 180.0, 0.0, 0.0)",
+            "2024-03-03 cycling: stored=None rebuilt=(1, 12.0, 72.0, 72.0, 10800.0)",
+            "2024-03-04 running: stored=(1, 1.0, 1.0, 0.0, 0.0) rebuilt=None",
+        ]
+        conn.rollback()
+
+
+def test_rederive_reproduces_the_columns_from_stored_session_fields(tmp_path: Path) -> None:
+    activity_dir = tmp_path / "Activity"
+    activity_dir.mkdir()
+    sessions = {}
+    for seed, sport in enumerate(["running", "cycling", "walking"], 1):
+        path = activity_dir / f"{sport}.fit"
+        data = build_activity(datetime(2024, 3, seed, 7), 1200, sport, seed=seed)
+        path.write_bytes(data)
+        sessions[str(path.resolve())] = read_fit_summary(data)["session"]
+    files = [(path, path.stat().st_mtime, path.stat().st_size) for path in activity_dir.iterdir()]
+    streams_dir = tmp_path / "streams"
+    streams_dir.mkdir()
+
+    select_sql = f"SELECT source_file, {', '.join(DERIVED_COLUMNS)} FROM workouts ORDER BY 1"
+    db_path = tmp_path / "lab.db"
+    with connection(db_path) as conn:
+        rows = iter_fit_rows(files, tmp_path / "errors.log", streams_dir=streams_dir)
+        upsert_workouts(conn, rows)
+        ingested = conn.execute(select_sql).fetchall()
+        assert [row[0] for row in ingested] == sorted(sessions)
+        assert ingested == [
+            (source_file, *derive_columns(sessions[source_file]).values())
+            for source_file in sorted(sessions)
+        ]
+        stored_fields = conn.execute(
+            "SELECT w.source_file, f.session_json FROM workouts w "
+            "JOIN workout_fields f ON f.workout_id = w.id"
+        ).fetchall()
+        assert len(stored_fields) == 3
+        for source_file, session_json in stored_fields:
+            decoded = decode_session_fields(session_json)
+            assert derive_columns(decoded) == derive_columns(sessions[source_file])
+        assert rederive_workouts(conn) == 0
+
+        # Columns written by an older derive_columns, on another day and sport.
+        conn.execute(
+            "UPDATE workouts SET workout_date = '2020-01-01', sport = 'Old', distance_km = 0, "
+            "avg_hr = NULL, avg_pace_min_per_km = 99"
+        )
+        conn.execute("UPDATE best_efforts SET workout_date = '2020-01-01', sport = 'old'")
+        conn.execute("UPDATE workout_fields SET derived_version = ?", (DERIVED_VERSION - 1,))
+        conn.commit()
+
+        assert rederive_workouts(conn, batch_size=2) == 3
+        assert conn.execute(select_sql).fetchall() == ingested
+        assert check_daily_totals(conn) == []
+        stale_efforts = conn.execute(
+            "SELECT COUNT(*) FROM best_efforts b JOIN workouts w ON w.id = b.workout_id "
+            "WHERE b.workout_date != w.workout_date OR b.sport != lower(w.sport)"
+        ).fetchone()[0]
+        assert stale_efforts == 0
+        assert rederive_workouts(conn) == 0
+        assert rederive_workouts(conn, everything=True) == 3
+        assert conn.execute(select_sql).fetchall() == ingested
@@ -0,0 +1,138 @@
+"""FIT files read in place from a ZIP export, and the refreshes that keep them in sync."""
+from __future__ import annotations
+
+import calendar
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from muthu_performance_lab import pwa_export
+from muthu_performance_lab.database import connection
+from muthu_performance_lab.fit_archive import (
+    ArchiveMember,
+    find_archive_members,
+    source_crc,
+    source_from_file,
+)
+from muthu_performance_lab.synthetic_fit import build_activity
+
+MEMBER_DATE = (2024, 3, 1, 7, 30, 0)
+
+
+def _activity(seed: int) -> bytes:
+    return build_activity(datetime(2024, 3, seed, 7), 900, "running", seed=seed)
+
+
+def _write_zip(path: Path, members: dict[str, bytes]) -> Path:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(zipfile.ZipInfo(name, MEMBER_DATE), data)
+    return path
+
+
+def test_members_come_from_the_activity_folder(tmp_path: Path) -> None:
+    archive = _write_zip(
+        tmp_path / "garmin.zip",
+        {
+            "DI_CONNECT/Activity/b.FIT": b"b",
+            "DI_CONNECT/Activity/a.fit": b"a",
+            "DI_CONNECT/Activity/notes.txt": b"",
+            "DI_CONNECT/Monitor/m.fit": b"m",
+            "__MACOSX/DI_CONNECT/Activity/._a.fit": b"",
+        },
+    )
+    members = find_archive_members(archive)
+    assert [member.name for member in members] == [
+        "DI_CONNECT/Activity/a.fit",
+        "DI_CONNECT/Activity/b.FIT",
+    ]
+    first = members[0]
+    assert first.archive == str(archive.resolve())
+    assert (first.size, first.crc) == (1, zipfile.crc32(b"a"))
+    assert source_crc(first) == first.crc and source_crc(archive) is None
+    assert first.read_bytes() == b"a" and first.exists()
+
+    # Without an Activity folder every FIT member counts.
+    flat = _write_zip(tmp_path / "flat.zip", {"x.fit": b"x", "sub/y.fit": b"y", "z.gpx": b""})
+    assert [member.name for member in find_archive_members(flat)] == ["sub/y.fit", "x.fit"]
+
+
+def test_member_dates_do_not_depend_on_the_time_zone(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available")
+    archive = _write_zip(tmp_path / "garmin.zip", {"Activity/a.fit": b"a"})
+    expected = float(calendar.timegm(MEMBER_DATE + (0, 0, 0)))
+    for zone in ("UTC", "Asia/Kolkata", "America/New_York"):
+        monkeypatch.setenv("TZ", zone)
+        time.tzset()
+        assert find_archive_members(archive)[0].mtime == expected
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_source_from_file(tmp_path: Path) -> None:
+    archive = _write_zip(tmp_path / "garmin.zip", {"GARMIN/Activity/a.fit": b"a"})
+    (member,) = find_archive_members(archive)
+    assert source_from_file(str(member)) == member
+
+    missing = str(archive.resolve() / "GARMIN" / "Activity" / "gone.fit")
+    assert source_from_file(missing) == Path(missing)
+    assert not source_from_file(missing).exists()
+
+    plain = tmp_path / "Activity" / "a.fit"
+    assert source_from_file(str(plain)) == plain
+    assert not isinstance(source_from_file(str(plain)), ArchiveMember)
+
+
+@pytest.fixture
+def db_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    path = tmp_path / "lab.db"
+    monkeypatch.setattr(pwa_export, "DB_PATH", path)
+    monkeypatch.setattr(pwa_export, "STREAMS_DIR", tmp_path / "streams")
+    monkeypatch.setattr(pwa_export, "ERROR_LOG_PATH", tmp_path / "errors.log")
+    (tmp_path / "streams").mkdir()
+    return path
+
+
+def _stored(db_path: Path) -> dict[str, int | None]:
+    with connection(db_path) as conn:
+        return dict(conn.execute("SELECT source_file, source_crc FROM workouts"))
+
+
+def test_zip_ingest_skips_unchanged_members_and_prunes_removed_ones(
+    tmp_path: Path, db_path: Path
+) -> None:
+    archive = tmp_path / "garmin.zip"
+    activities = {
+        f"GARMIN/Activity/{name}.fit": _activity(seed) for seed, name in enumerate("abc", 1)
+    }
+    _write_zip(archive, activities)
+
+    result = pwa_export.refresh_database_from_garmin(archive, workers=1)
+    assert (result["parsed"], result["skipped"], result["deleted"]) == (3, 0, 0)
+
+    def member(name: str) -> str:
+        return str(archive.resolve() / "GARMIN" / "Activity" / name)
+
+    assert _stored(db_path) == {
+        member(f"{name}.fit"): zipfile.crc32(data) for name, data in zip("abc", activities.values())
+    }
+
+    result = pwa_export.refresh_database_from_garmin(archive, workers=1)
+    assert (result["parsed"], result["skipped"], result["deleted"]) == (0, 3, 0)
+
+    # A newer export: b is gone and c holds another recording.
+    del activities["GARMIN/Activity/b.fit"]
+    activities["GARMIN/Activity/c.fit"] = _activity(9)
+    _write_zip(archive, activities)
+    result = pwa_export.refresh_database_from_garmin(archive, workers=1)
+    assert (result["parsed"], result["skipped"], result["deleted"]) == (1, 1, 1)
+    assert _stored(db_path) == {
+        member(name): zipfile.crc32(activities[f"GARMIN/Activity/{name}"])
+        for name in ("a.fit", "c.fit")
+    }
@@ -0,0 +1,58 @@
+"""Re-parsing a file replaces everything stored for its earlier version."""
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from muthu_performance_lab import fit_ingest
+from muthu_performance_lab.database import connection, upsert_workouts
+from muthu_performance_lab.fit_reader import FitReaderError
+from muthu_performance_lab.synthetic_fit import build_activity
+
+pytest.importorskip("fitparse")
+
+
+def _ingest(fit_path: Path, db_path: Path, streams_dir: Path) -> None:
+    stat = fit_path.stat()
+    rows = fit_ingest.iter_fit_rows(
+        [(fit_path, stat.st_mtime, stat.st_size)],
+        db_path.parent / "errors.log",
+        streams_dir=streams_dir,
+    )
+    with connection(db_path) as conn:
+        assert upsert_workouts(conn, rows) == 1
+
+
+def _stored(db_path: Path) -> tuple[list, int]:
+    with connection(db_path) as conn:
+        streams = conn.execute("SELECT stream_file FROM workout_streams").fetchall()
+        (efforts,) = conn.execute("SELECT COUNT(*) FROM best_efforts").fetchone()
+    return streams, efforts
+
+
+def test_fitparse_reparse_clears_the_old_stream(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fit_path = tmp_path / "run.fit"
+    fit_path.write_bytes(build_activity(datetime(2024, 3, 1, 7), 1800, "running", seed=1))
+    db_path = tmp_path / "lab.db"
+    streams_dir = tmp_path / "streams"
+    streams_dir.mkdir()
+
+    _ingest(fit_path, db_path, streams_dir)
+    streams, efforts = _stored(db_path)
+    assert len(streams) == 1 and efforts > 0
+    assert (streams_dir / streams[0][0]).exists()
+
+    def unsupported(data: bytes) -> None:
+        raise FitReaderError("Compressed timestamps are not supported")
+
+    monkeypatch.setattr(fit_ingest, "read_fit_activity", unsupported)
+    _ingest(fit_path, db_path, streams_dir)
+    assert _stored(db_path) == ([], 0)
+    assert not (streams_dir / streams[0][0]).exists()
+    with connection(db_path) as conn:
+        (laps,) = conn.execute("SELECT COUNT(*) FROM laps").fetchone()
+    assert laps > 0
@@ -0,0 +1,113 @@
+"""The fast FIT reader must name and scale session and lap fields exactly like fitparse."""
+from __future__ import annotations
+
+import io
+import struct
+from datetime import datetime
+
+import pytest
+
+from muthu_performance_lab.fit_reader import (
+    MESG_FILE_ID,
+    MESG_LAP,
+    MESG_SESSION,
+    FitReaderError,
+    read_fit_activity,
+    read_fit_file_id,
+    read_fit_summary,
+)
+from muthu_performance_lab.synthetic_fit import SPORT_PROFILES, build_activity, fit_crc
+
+fitparse = pytest.importorskip("fitparse")
+
+_STRUCT_CODES = {0x00: "B", 0x02: "B", 0x84: "H", 0x86: "I"}
+_INVALID_UINT16 = 0xFFFF
+
+
+def _fitparse_summary(data: bytes) -> dict:
+    fit = fitparse.FitFile(io.BytesIO(data))
+    return {
+        "session": next(fit.get_messages("session")).get_values(),
+        "laps": [lap.get_values() for lap in fit.get_messages("lap")],
+    }
+
+
+def _fit_file(messages: list[tuple[int, list[tuple[int, int, int]]]]) -> bytes:
+    """A FIT file of (global number, [(field number, base type, raw value)]) messages."""
+    body = b""
+    for local, (global_num, fields) in enumerate(messages):
+        body += struct.pack("<BBBHB", 0x40 | local, 0, 0, global_num, len(fields))
+        for num, base_type, _ in fields:
+            size = struct.calcsize(_STRUCT_CODES[base_type])
+            body += struct.pack("<BBB", num, size, base_type)
+        codes = "".join(_STRUCT_CODES[base_type] for _, base_type, _ in fields)
+        body += struct.pack("<B" + codes, local, *(value for _, _, value in fields))
+    header = struct.pack("<BBHI4s", 14, 0x20, 2132, len(body), b".FIT")
+    data = header + struct.pack("<H", fit_crc(header)) + body
+    return data + struct.pack("<H", fit_crc(data))
+
+
+@pytest.mark.parametrize("sport", sorted(SPORT_PROFILES))
+def test_synthetic_activity_matches_fitparse(sport: str) -> None:
+    data = build_activity(datetime(2024, 3, 1, 7), 1800, sport, seed=3)
+    fast = read_fit_summary(data)
+    expected = _fitparse_summary(data)
+    assert fast["session"] == expected["session"]
+    assert fast["laps"] == expected["laps"]
+
+
+@pytest.mark.parametrize("enhanced_first", [False, True])
+def test_enhanced_fields_match_fitparse(enhanced_first: bool) -> None:
+    # A written enhanced_avg_speed wins over the expanded avg_speed only when
+    # it comes later in the message, as in fitparse.
+    enhanced = [(124, 0x86, 3_250), (126, 0x86, 2_710)]
+    session = [
+        (5, 0x00, 1),
+        (14, 0x84, 3_200),
+        (15, 0x84, _INVALID_UINT16),
+        (49, 0x84, 2_700),
+        (50, 0x84, 2_900),
+        (71, 0x84, 2_550),
+    ]
+    session = enhanced + session if enhanced_first else session + enhanced
+    lap = [(13, 0x84, 3_100), (14, 0x84, 4_200), (42, 0x84, 2_650), (43, 0x84, 2_800)]
+    data = _fit_file(
+        [(MESG_FILE_ID, [(0, 0x00, 4)]), (MESG_LAP, lap), (MESG_SESSION, session)]
+    )
+
+    fast = read_fit_summary(data)
+    expected = _fitparse_summary(data)
+    assert fast["session"] == expected["session"]
+    assert fast["laps"] == expected["laps"]
+    assert fast["session"]["enhanced_avg_speed"] == (3.2 if enhanced_first else 3.25)
+    assert fast["laps"][0]["enhanced_max_speed"] == 4.2
+
+
+def _rewrap(data: bytes, cut: int) -> bytes:
+    """`data` cut after `cut` bytes, with its header and CRC fixed to match the shorter body."""
+    body = data[14:cut]
+    header = struct.pack("<BBHI4s", 14, 0x20, 2132, len(body), b".FIT")
+    data = header + struct.pack("<H", fit_crc(header)) + body
+    return data + struct.pack("<H", fit_crc(data))
+
+
+def test_truncated_files_raise_fit_reader_error() -> None:
+    # Every cut, including ones inside a definition message, must fail as
+    # FitReaderError so that ingest falls back to fitparse.
+    data = build_activity(datetime(2024, 3, 1, 7), 120, "running", seed=5)
+    definition_cuts = 0
+    for cut in range(15, len(data) - 2):
+        # The header still promises the whole data section.
+        with pytest.raises(FitReaderError, match="truncated"):
+            read_fit_activity(data[:cut])
+        # A header that matches the cut: a shorter file, valid only when the
+        # cut falls between two messages.
+        try:
+            read_fit_activity(_rewrap(data, cut))
+        except FitReaderError as exc:
+            definition_cuts += "definition" in str(exc)
+        try:
+            read_fit_file_id(data[:cut])
+        except FitReaderError:
+            pass
+    assert definition_cuts > 0
@@ -0,0 +1,167 @@
+"""The stdlib export engine must write exactly what the pandas engine writes."""
+from __future__ import annotations
+
+import json
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from muthu_performance_lab import lite_export, pwa_export
+from muthu_performance_lab.database import connection, upsert_workouts
+from muthu_performance_lab.downsample import density_bins, lttb_indices
+from muthu_performance_lab.metrics import training_load_series
+from muthu_performance_lab.payload import MANIFEST_NAME, dumps_payload
+
+BUDGETS = [
+    None,
+    {"distance_trend": 0, "cadence_trend": 0, "training_load": 0, "pace_vs_hr": 0},
+    {"distance_trend": 5, "cadence_trend": 3, "training_load": 7, "pace_vs_hr": 4},
+]
+
+
+def _daily_km(seed: int, days: int = 400) -> list[tuple[str, float]]:
+    """Daily run distances with rest days, repeated values and gaps past the chronic window."""
+    rnd = random.Random(seed)
+    day, rows = date(2020, 1, 1), []
+    for _ in range(days):
+        day += timedelta(days=rnd.choice([1, 1, 1, 2, 3] * 8 + [35]))
+        rows.append((day.isoformat(), rnd.choice([5.0, 5.0, 10.0, rnd.uniform(1.0, 42.2)])))
+    return rows
+
+
+def _maybe(rnd: random.Random, value: float, missing: float = 0.1) -> float | None:
+    return None if rnd.random() < missing else value
+
+
+def _workouts(count: int, seed: int) -> list[dict]:
+    """`count` workouts over the last years: mostly runs, gaps, same-day runs, missing values."""
+    rnd = random.Random(seed)
+    day = date.today() - timedelta(days=int(count * 1.3))
+    rows = []
+    for index in range(count):
+        day += timedelta(days=rnd.choice([0, 1, 1, 1, 2, 3, 9] * 10 + [45]))
+        distance_km = _maybe(rnd, rnd.uniform(1.0, 30.0), 0.03)
+        duration_min = (distance_km or 5.0) * rnd.uniform(4.2, 7.5)
+        rows.append(
+            {
+                "source_file": f"/fit/{seed}/{index:05d}.fit",
+                "source_mtime": 1.0,
+                "source_size": 100,
+                "workout_date": day.isoformat(),
+                "sport": rnd.choice(["running"] * 8 + ["Running", "cycling", "walking"]),
+                "sub_sport": rnd.choice(["generic", "trail", "treadmill"]),
+                "distance_km": distance_km,
+                "duration_min": duration_min,
+                "avg_hr": _maybe(rnd, rnd.uniform(120.0, 175.0)),
+                "max_hr": _maybe(rnd, float(rnd.randint(160, 195))),
+                "avg_cadence": _maybe(rnd, float(rnd.randint(150, 185)), 0.2),
+                "avg_pace_min_per_km": duration_min / distance_km if distance_km else None,
+                "calories": _maybe(rnd, float(rnd.randint(100, 2000))),
+                # Tiny negative values round to -0.0, whose sign numpy keeps.
+                "avg_temperature": _maybe(rnd, rnd.choice([rnd.uniform(-5, 35), -1e-9])),
+            }
+        )
+    return rows
+
+
+@pytest.fixture(scope="module", params=["empty", "other_sports", "few", "history"])
+def db_path(request: pytest.FixtureRequest, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    path = tmp_path_factory.mktemp(request.param) / "lab.db"
+    rows = {
+        "empty": [],
+        "other_sports": [{**row, "sport": "cycling"} for row in _workouts(20, seed=1)],
+        "few": _workouts(6, seed=2),
+        "history": _workouts(1500, seed=3),
+    }[request.param]
+    with connection(path) as conn:
+        upsert_workouts(conn, rows)
+    return path
+
+
+def _without_time(text: str) -> dict:
+    payload = json.loads(text)
+    payload.pop("generated_at", None)
+    return payload
+
+
+def _files(output_dir: Path) -> dict[str, str]:
+    return {
+        path.relative_to(output_dir).as_posix(): path.read_text(encoding="utf-8")
+        for path in sorted(output_dir.rglob("*.json"))
+    }
+
+
+@pytest.mark.parametrize("budgets", BUDGETS)
+def test_payload_matches_pwa_export(db_path: Path, budgets: dict | None) -> None:
+    expected = pwa_export.build_dashboard_payload(budgets, db_path)
+    payload = lite_export.build_dashboard_payload(budgets, db_path)
+    payload["generated_at"] = expected["generated_at"]
+    assert dumps_payload(payload) == dumps_payload(expected)
+
+
+@pytest.mark.parametrize("budgets", BUDGETS)
+def test_chunks_match_pwa_export(db_path: Path, budgets: dict | None, tmp_path: Path) -> None:
+    pandas_dir, lite_dir = tmp_path / "pandas", tmp_path / "lite"
+    expected = pwa_export.export_pwa_chunks(pandas_dir, budgets, db_path=db_path)
+    result = lite_export.export_pwa_chunks(lite_dir, budgets, db_path=db_path)
+    assert result["chunks_written"] == expected["chunks_written"]
+
+    pandas_files, lite_files = _files(pandas_dir), _files(lite_dir)
+    assert sorted(lite_files) == sorted(pandas_files)
+    for name, text in pandas_files.items():
+        if name == MANIFEST_NAME:
+            assert _without_time(lite_files[name]) == _without_time(text)
+        else:
+            assert lite_files[name] == text
+
+
+def test_lite_export_reuses_pandas_chunks(db_path: Path, tmp_path: Path) -> None:
+    expected = pwa_export.export_pwa_chunks(tmp_path, db_path=db_path)
+    before = _files(tmp_path)
+    result = lite_export.export_pwa_chunks(tmp_path, db_path=db_path)
+    assert result["chunks_written"] == 0
+    assert result["chunks_reused"] == len(expected["chunks"])
+    after = _files(tmp_path)
+    assert sorted(after) == sorted(before)
+    assert _without_time(after[MANIFEST_NAME]) == _without_time(before[MANIFEST_NAME])
+
+
+# The engines only match while lite_export repeats the libraries' arithmetic
+# exactly; these catch a pandas/numpy change before it shows up in a file.
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_training_load_repeats_pandas_exactly(seed: int) -> None:
+    daily = _daily_km(seed)
+    days, km = zip(*daily)
+    expected = training_load_series(pd.Series(km, index=pd.to_datetime(list(days))))
+    load = lite_export._training_load(daily)
+    assert load["date"] == [day.date().isoformat() for day in expected["date"]]
+    for name in ["acute_km", "chronic_km", "load_ratio", "ewma_load_ratio"]:
+        assert load[name] == expected[name].tolist(), name
+
+
+@pytest.mark.parametrize("count", [1, 7, 8, 9, 127, 128, 129, 300, 1000, 4099])
+def test_pairwise_mean_repeats_numpy_exactly(count: int) -> None:
+    values = [random.Random(count).uniform(-1e6, 1e6) for _ in range(count)]
+    values = [value * 10 ** random.Random(k).randint(-8, 8) for k, value in enumerate(values)]
+    assert lite_export._mean(values, 0, count) == np.asarray(values).mean()
+
+
+@pytest.mark.parametrize("budget", [3, 10, 57, 400])
+def test_downsampling_repeats_numpy_exactly(budget: int) -> None:
+    rnd = random.Random(budget)
+    x = sorted(rnd.uniform(0, 5000) for _ in range(3000))
+    y = [rnd.uniform(2.0, 40.0) for _ in x]
+    picked = lite_export._lttb_indices(x, y, budget)
+    assert picked == lttb_indices(np.asarray(x), np.asarray(y), budget).tolist()
+
+    bins = lite_export._density_bins(x, y, budget)
+    expected = density_bins(np.asarray(x), np.asarray(y), budget)
+    assert bins["avg_hr"] == expected["x"].tolist()
+    assert bins["avg_pace_min_per_km"] == expected["y"].tolist()
+    assert bins["count"] == expected["count"].tolist()
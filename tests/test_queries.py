@@ -0,0 +1,138 @@
+"""The SQL aggregates in queries.py must match their pandas versions in metrics.py."""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+from muthu_performance_lab.database import connection, upsert_workouts
+from muthu_performance_lab.metrics import (
+    filter_runs,
+    kpi_lifetime_distance_km,
+    kpi_total_runs,
+    load_workouts_df,
+    monthly_mileage,
+    training_load_ratio,
+    weekly_mileage_km,
+)
+from muthu_performance_lab.queries import (
+    query_lifetime_distance_km,
+    query_monthly_mileage,
+    query_monthly_run_fingerprints,
+    query_total_runs,
+    query_training_load_ratio,
+    query_weekly_mileage_km,
+)
+
+# (days before today, sport, distance_km); None distances count as 0 in both layers.
+WORKOUTS = [
+    (0, "running", 5.2),
+    (0, "Running", 3.1),
+    (0, "cycling", 40.0),
+    (1, "running", 10.0),
+    (3, "running", None),
+    (6, "running", 8.4),
+    (9, "running", 12.5),
+    (20, "running", 21.1),
+    (27, "running", 6.0),
+    (45, "running", 15.0),
+    (45, "swimming", 2.0),
+    (70, "running", 30.0),
+    (400, "running", 42.2),
+]
+
+
+def _workout(index: int, days_ago: int, sport: str, distance_km: float | None) -> dict:
+    duration_min = distance_km * 5.5 if distance_km else 30.0
+    return {
+        "source_file": f"/fit/{index:03d}.fit",
+        "source_mtime": 1.0,
+        "source_size": 100,
+        "workout_date": (date.today() - timedelta(days=days_ago)).isoformat(),
+        "sport": sport,
+        "sub_sport": "generic",
+        "distance_km": distance_km,
+        "duration_min": duration_min,
+        "avg_hr": 150.0,
+        "max_hr": 175.0,
+        "avg_cadence": 170.0,
+        "avg_pace_min_per_km": duration_min / distance_km if distance_km else None,
+        "calories": 400.0,
+        "avg_temperature": 18.0,
+    }
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    path = tmp_path / "lab.db"
+    with connection(path) as conn:
+        upsert_workouts(
+            conn, [_workout(index, *workout) for index, workout in enumerate(WORKOUTS)]
+        )
+    return path
+
+
+@pytest.fixture
+def runs_df(db_path: Path):
+    with connection(db_path) as conn:
+        return filter_runs(load_workouts_df(conn))
+
+
+def test_kpis_match_metrics(db_path: Path, runs_df) -> None:
+    with connection(db_path) as conn:
+        assert query_total_runs(conn) == kpi_total_runs(runs_df) == 11
+        assert query_lifetime_distance_km(conn) == pytest.approx(
+            kpi_lifetime_distance_km(runs_df)
+        )
+
+
+def test_monthly_mileage_matches_metrics(db_path: Path, runs_df) -> None:
+    expected = monthly_mileage(runs_df)
+    with connection(db_path) as conn:
+        monthly = query_monthly_mileage(conn)
+    assert monthly["month"].tolist() == expected["month"].tolist()
+    assert monthly["distance_km"].tolist() == pytest.approx(expected["distance_km"].tolist())
+
+
+def test_weekly_mileage_matches_metrics(db_path: Path, runs_df) -> None:
+    with connection(db_path) as conn:
+        assert query_weekly_mileage_km(conn) == pytest.approx(weekly_mileage_km(runs_df))
+
+
+def test_training_load_ratio_matches_metrics(db_path: Path, runs_df) -> None:
+    expected = training_load_ratio(runs_df)
+    assert expected > 0
+    with connection(db_path) as conn:
+        assert query_training_load_ratio(conn) == pytest.approx(expected)
+
+
+def test_empty_database_matches_metrics(tmp_path: Path) -> None:
+    with connection(tmp_path / "empty.db") as conn:
+        runs_df = filter_runs(load_workouts_df(conn))
+        assert query_total_runs(conn) == kpi_total_runs(runs_df) == 0
+        assert query_weekly_mileage_km(conn) == weekly_mileage_km(runs_df) == 0.0
+        assert query_training_load_ratio(conn) == training_load_ratio(runs_df) == 0.0
+        assert query_monthly_mileage(conn).empty and monthly_mileage(runs_df).empty
+
+
+def test_fingerprints_see_edits_that_keep_the_totals(db_path: Path) -> None:
+    with connection(db_path) as conn:
+        before = query_monthly_run_fingerprints(conn)
+        month = date.today().isoformat()[:7]
+        conn.execute(
+            "UPDATE workouts SET sub_sport = 'trail' WHERE source_file = '/fit/000.fit'"
+        )
+        after_sub_sport = query_monthly_run_fingerprints(conn)
+        # Swapping two runs' distances leaves every per-month sum unchanged.
+        conn.execute(
+            "UPDATE workouts SET distance_km = CASE source_file"
+            " WHEN '/fit/000.fit' THEN 3.1 ELSE 5.2 END"
+            " WHERE source_file IN ('/fit/000.fit', '/fit/001.fit')"
+        )
+        after_swap = query_monthly_run_fingerprints(conn)
+    assert after_sub_sport[month] != before[month]
+    assert after_swap[month] != after_sub_sport[month]
+    assert {key: value for key, value in after_swap.items() if key != month} == {
+        key: value for key, value in before.items() if key != month
+    }
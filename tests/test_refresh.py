@@ -0,0 +1,167 @@
+"""refresh_database_from_garmin on a GARMIN folder: quarantine, duplicates and incremental runs."""
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from muthu_performance_lab import pwa_export
+from muthu_performance_lab.database import connection, fetch_duplicate_files, list_quarantine
+from muthu_performance_lab.synthetic_fit import build_activity, corrupt_activity
+
+
+def _activity(seed: int) -> bytes:
+    return build_activity(datetime(2024, 3, seed, 7), 900, "running", seed=seed)
+
+
+@pytest.fixture
+def garmin_root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(pwa_export, "DB_PATH", tmp_path / "lab.db")
+    monkeypatch.setattr(pwa_export, "STREAMS_DIR", tmp_path / "streams")
+    monkeypatch.setattr(pwa_export, "ERROR_LOG_PATH", tmp_path / "errors.log")
+    (tmp_path / "streams").mkdir()
+    root = tmp_path / "GARMIN"
+    (root / "Activity").mkdir(parents=True)
+    return root
+
+
+def _refresh(garmin_root: Path, incremental: bool = True) -> dict[str, int]:
+    return pwa_export.refresh_database_from_garmin(garmin_root, incremental, workers=1)
+
+
+def _stored_files() -> list[str]:
+    with connection(pwa_export.DB_PATH) as conn:
+        return [row[0] for row in conn.execute("SELECT source_file FROM workouts ORDER BY 1")]
+
+
+def _quarantined() -> list[str]:
+    with connection(pwa_export.DB_PATH) as conn:
+        return [entry["source_file"] for entry in list_quarantine(conn)]
+
+
+def _logged_failures() -> int:
+    path = pwa_export.ERROR_LOG_PATH
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+def test_failing_file_is_quarantined_until_it_changes(garmin_root: Path) -> None:
+    good = garmin_root / "Activity" / "good.fit"
+    bad = garmin_root / "Activity" / "bad.fit"
+    good.write_bytes(_activity(1))
+    bad.write_bytes(corrupt_activity(_activity(2), "truncated"))
+
+    result = _refresh(garmin_root)
+    assert (result["upserted"], result["failed"], result["quarantined"]) == (1, 1, 0)
+    assert _quarantined() == [str(bad.resolve())]
+    assert _logged_failures() == 1
+
+    # Same mtime and size: skipped without being parsed again.
+    result = _refresh(garmin_root)
+    assert (result["upserted"], result["failed"], result["quarantined"]) == (0, 0, 1)
+    assert _logged_failures() == 1
+
+    # A full refresh retries it.
+    result = _refresh(garmin_root, incremental=False)
+    assert (result["failed"], result["quarantined"]) == (1, 0)
+    assert _logged_failures() == 2
+
+    # A new mtime is a new version of the file, so it is parsed again.
+    stat = bad.stat()
+    os.utime(bad, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    result = _refresh(garmin_root)
+    assert (result["failed"], result["quarantined"]) == (1, 0)
+    assert _logged_failures() == 3
+    assert _quarantined() == [str(bad.resolve())]
+
+    # Fixed: parsed, stored and released.
+    bad.write_bytes(_activity(2))
+    result = _refresh(garmin_root)
+    assert (result["upserted"], result["failed"], result["quarantined"]) == (1, 0, 0)
+    assert _quarantined() == []
+    assert _stored_files() == sorted([str(good.resolve()), str(bad.resolve())])
+
+
+def test_deleted_quarantined_file_is_released(garmin_root: Path) -> None:
+    bad = garmin_root / "Activity" / "bad.fit"
+    bad.write_bytes(corrupt_activity(_activity(2), "garbage"))
+    assert _refresh(garmin_root)["failed"] == 1
+    bad.unlink()
+    _refresh(garmin_root)
+    assert _quarantined() == []
+
+
+def test_copy_of_an_activity_is_a_duplicate_until_the_original_goes(garmin_root: Path) -> None:
+    original = garmin_root / "Activity" / "a.fit"
+    copy = garmin_root / "Activity" / "a_copy.fit"
+    original.write_bytes(_activity(1))
+    copy.write_bytes(_activity(1))
+    other = garmin_root / "Activity" / "b.fit"
+    other.write_bytes(_activity(2))
+
+    for _ in range(2):
+        result = _refresh(garmin_root)
+        assert result["duplicates"] == 1
+        assert _stored_files() == [str(original.resolve()), str(other.resolve())]
+        with connection(pwa_export.DB_PATH) as conn:
+            duplicates = fetch_duplicate_files(conn)
+            (owner,) = conn.execute(
+                "SELECT duplicate_of FROM duplicate_files WHERE source_file = ?",
+                (str(copy.resolve()),),
+            ).fetchone()
+        assert list(duplicates) == [str(copy.resolve())]
+        assert owner == str(original.resolve())
+    assert result["upserted"] == 0
+
+    # The copy takes the original's place in the same refresh that prunes it.
+    original.unlink()
+    result = _refresh(garmin_root)
+    assert (result["deleted"], result["upserted"], result["duplicates"]) == (1, 1, 0)
+    assert _stored_files() == [str(copy.resolve()), str(other.resolve())]
+    with connection(pwa_export.DB_PATH) as conn:
+        assert fetch_duplicate_files(conn) == {}
+
+
+def _stored_dates() -> dict[str, str]:
+    with connection(pwa_export.DB_PATH) as conn:
+        return dict(conn.execute("SELECT source_file, workout_date FROM workouts"))
+
+
+def test_incremental_refresh_parses_only_changed_files(garmin_root: Path) -> None:
+    first = garmin_root / "Activity" / "first.fit"
+    second = garmin_root / "Activity" / "second.fit"
+    first.write_bytes(_activity(1))
+    second.write_bytes(_activity(2))
+    assert _refresh(garmin_root)["parsed"] == 2
+
+    result = _refresh(garmin_root)
+    assert (result["parsed"], result["skipped"]) == (0, 2)
+    result = _refresh(garmin_root, incremental=False)
+    assert (result["parsed"], result["skipped"]) == (2, 0)
+
+    first.write_bytes(_activity(5))
+    result = _refresh(garmin_root)
+    assert (result["parsed"], result["skipped"]) == (1, 1)
+    assert _stored_dates() == {
+        str(first.resolve()): "2024-03-05",
+        str(second.resolve()): "2024-03-02",
+    }
+
+    # Rewritten into a file that no longer parses: quarantined, and nothing
+    # of its earlier version is left behind.
+    assert len(list(pwa_export.STREAMS_DIR.iterdir())) == 2
+    first.write_bytes(corrupt_activity(_activity(5), "truncated"))
+    result = _refresh(garmin_root)
+    assert (result["parsed"], result["failed"], result["skipped"]) == (0, 1, 1)
+    assert _quarantined() == [str(first.resolve())]
+    assert _stored_files() == [str(second.resolve())]
+    with connection(pwa_export.DB_PATH) as conn:
+        for table in ("workout_streams", "workout_fields", "laps", "best_efforts"):
+            orphans = conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE workout_id NOT IN (SELECT id FROM workouts)"
+            ).fetchone()[0]
+            assert orphans == 0, table
+        (efforts,) = conn.execute("SELECT COUNT(*) FROM best_efforts").fetchone()
+    assert efforts > 0
+    assert len(list(pwa_export.STREAMS_DIR.iterdir())) == 1
@@ -0,0 +1,125 @@
+"""watch_folder hands settled bursts of new, changed and removed FIT files to its callback."""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple
+
+import pytest
+
+from muthu_performance_lab.watcher import watch_folder
+
+POLL = 0.02
+DEBOUNCE = 0.2
+# Long enough for a slow CI machine to notice, far shorter than any wait below.
+TIMEOUT = 10.0
+
+Changes = Tuple[List[Path], List[Path]]
+
+
+@contextmanager
+def _watching(
+    root: Path, on_changes: Callable[[List[Path], List[Path]], None] | None = None
+) -> Iterator["queue.Queue[Changes]"]:
+    """Watch `root` in a thread; every call, once `on_changes` has run, is put on the queue."""
+    calls: "queue.Queue[Changes]" = queue.Queue()
+
+    def record(changed: List[Path], removed: List[Path]) -> None:
+        try:
+            if on_changes is not None:
+                on_changes(changed, removed)
+        finally:
+            calls.put((changed, removed))
+
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=watch_folder,
+        args=(root, record),
+        kwargs={"poll_interval": POLL, "debounce": DEBOUNCE, "stop": stop},
+        daemon=True,
+    )
+    thread.start()
+    # Let the first scan see the folder as it is now.
+    time.sleep(POLL * 5)
+    try:
+        yield calls
+    finally:
+        stop.set()
+        thread.join(TIMEOUT)
+
+
+def _no_more_calls(calls: "queue.Queue[Changes]") -> None:
+    with pytest.raises(queue.Empty):
+        calls.get(timeout=DEBOUNCE * 3)
+
+
+@pytest.fixture
+def activity_dir(tmp_path: Path) -> Path:
+    folder = tmp_path / "Activity"
+    folder.mkdir()
+    (folder / "existing.fit").write_bytes(b"old")
+    return folder
+
+
+def test_a_burst_of_files_is_one_call(activity_dir: Path) -> None:
+    with _watching(activity_dir) as calls:
+        names = ["a.fit", "B.FIT", "nested/c.fit"]
+        (activity_dir / "nested").mkdir()
+        for name in names:
+            (activity_dir / name).write_bytes(b"fit")
+            time.sleep(DEBOUNCE / 4)
+        (activity_dir / "notes.txt").write_text("not a FIT file")
+
+        changed, removed = calls.get(timeout=TIMEOUT)
+        assert sorted(changed) == sorted(activity_dir / name for name in names)
+        assert removed == []
+        _no_more_calls(calls)
+
+
+def test_a_growing_file_waits_until_it_is_stable(activity_dir: Path) -> None:
+    path = activity_dir / "copying.fit"
+    sizes: List[int] = []
+
+    def record_size(changed: List[Path], removed: List[Path]) -> None:
+        sizes.append(path.stat().st_size)
+
+    with _watching(activity_dir, record_size) as calls:
+        with path.open("wb") as f:
+            # Written for about three debounce periods.
+            for _ in range(30):
+                f.write(b"x" * 100)
+                f.flush()
+                time.sleep(DEBOUNCE / 10)
+
+        assert calls.get(timeout=TIMEOUT) == ([path], [])
+        assert sizes == [3000]
+        _no_more_calls(calls)
+
+
+def test_removals_are_reported(activity_dir: Path) -> None:
+    with _watching(activity_dir) as calls:
+        (activity_dir / "existing.fit").unlink()
+        assert calls.get(timeout=TIMEOUT) == ([], [activity_dir / "existing.fit"])
+        _no_more_calls(calls)
+
+
+def test_a_failing_callback_is_retried(
+    activity_dir: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    failures = [RuntimeError("database is locked")]
+
+    def fail_once(changed: List[Path], removed: List[Path]) -> None:
+        if failures:
+            raise failures.pop()
+
+    with _watching(activity_dir, fail_once) as calls:
+        (activity_dir / "new.fit").write_bytes(b"fit")
+        (activity_dir / "existing.fit").unlink()
+        expected = ([activity_dir / "new.fit"], [activity_dir / "existing.fit"])
+        assert calls.get(timeout=TIMEOUT) == expected
+        assert calls.get(timeout=TIMEOUT) == expected
+        _no_more_calls(calls)
+    assert "database is locked" in capsys.readouterr().out